@@ -0,0 +1,670 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from contextlib import contextmanager
+from functools import partial
+
+import pandas as pd
+
+from sync.banco_local import ler
+from sync.colunar import consultar, interruptor_duckdb
+from sync.copia import citar, tabela_existe
+from sync.datas import chave_do_periodo, chave_mes, periodo_da_chave
+from sync.indices import indices_quentes, tocar_indice
+from sync.rollups import (
+    id_origem, origem_do_mapeamento, origens_disponiveis, saldo_ate, serie_mensal, serie_saldo, somar_mes,
+)
+from sync.saldos import id_livro, livro_do_mapeamento, livros_disponiveis, saldo_do_livro, serie_do_livro
+from sync.versao import versao_dados
+
+SALDO_EM_CAIXA = "Saldo em Caixa"
+# Resultados de indicadores guardados em memória (somando todos os arquivos e usuários)
+CACHE_KPI_MAX_ITENS = 5000
+# Tamanho padrão e máximo das séries mensais
+MESES_SERIE = 24
+MAX_MESES_SERIE = 120
+# Consultas compiladas guardadas (uma por formato de mapeamento, não por período)
+CONSULTAS_COMPILADAS_MAX_ITENS = 1000
+# Threads do pool de leitura dos indicadores; cada uma mantém a sua conexão de
+# leitura por arquivo (sync.banco_local), então é também o limite de conexões
+LEITORES_KPI = 4
+# Aquecimento depois de cada sincronização: tempo máximo e fração de um núcleo
+AQUECIMENTO_SEGUNDOS = 60
+AQUECIMENTO_CARGA = 0.5
+# Instruções do SQLite entre as verificações do prazo do aquecimento durante uma consulta
+AQUECIMENTO_PASSOS_PRAZO = 10_000
+
+# Indicadores básicos de cada setor (cards do dashboard)
+INDICADORES_POR_SETOR = {
+    "Financeiro": ["Receitas do mês", "Despesas do mês", "Saldo em Caixa"],
+    "Comercial": ["Vendas no mês", "Clientes Ativos", "Novos Leads"],
+    "Produção": ["Produção do mês", "Modelos produzidos", "Mais produzido"],
+}
+
+CAMPOS_MAPEAMENTO = (
+    "indicador", "tabela", "coluna_valor", "coluna_data", "coluna_tipo", "valores_entrada", "valores_saida",
+    "coluna_filtro", "valor_filtro", "formula_sql",
+)
+
+
+class CacheKPI:
+    """
+    Resultados de indicadores por (arquivo, versão dos dados, hash do mapeamento,
+    período), com descarte do menos usado (LRU) ao passar de max_itens. A versão
+    dos dados muda a cada sincronização, então não há invalidação explícita: as
+    entradas antigas só deixam de ser pedidas e saem pelo LRU.
+    """
+
+    def __init__(self, max_itens=CACHE_KPI_MAX_ITENS):
+        self.max_itens = max_itens
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.descartes = 0
+
+    def obter(self, chave):
+        with self._lock:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return self._itens[chave]
+            self.falhas += 1
+            return None
+
+    def guardar(self, chave, valor):
+        with self._lock:
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+                self.descartes += 1
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def situacao(self):
+        with self._lock:
+            total = self.acertos + self.falhas
+            return {
+                "itens": len(self._itens),
+                "max_itens": self.max_itens,
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "descartes": self.descartes,
+                "taxa_acerto": round(self.acertos / total, 3) if total else None,
+            }
+
+
+# Cache do processo, usado pelo dashboard (Streamlit) e pelo backend
+cache_kpi = CacheKPI()
+# Consultas dos indicadores já compiladas (SQL com parâmetros; ver compilar_grupo)
+consultas_compiladas = CacheKPI(CONSULTAS_COMPILADAS_MAX_ITENS)
+
+_pool = None
+_lock_pool = threading.Lock()
+
+
+def pool_leitura():
+    """
+    Pool compartilhado (LEITORES_KPI threads) para avaliar indicadores em paralelo.
+    """
+    global _pool
+    with _lock_pool:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=LEITORES_KPI, thread_name_prefix="kpi")
+        return _pool
+
+
+# Parâmetro preenchido na execução (período, início, fim), no lugar de um valor fixo do mapeamento
+Marcador = namedtuple("Marcador", "nome")
+
+
+def hash_mapeamento(m):
+    return hashlib.sha1(json.dumps([m.get(c) for c in CAMPOS_MAPEAMENTO], default=str).encode()).hexdigest()
+
+
+def separar_valores(texto):
+    return [v.strip() for v in (texto or "").split(",") if v.strip()]
+
+
+def carregar_mapeamentos(conn, usuario_id, setor):
+    """
+    Todos os mapeamentos de um (usuario, setor) em uma consulta: {indicador: mapeamento}.
+    """
+    if not tabela_existe(conn, "indicador_mapeamento"):
+        return {}
+    rows = conn.execute(
+        f"SELECT {', '.join(CAMPOS_MAPEAMENTO)} FROM indicador_mapeamento WHERE usuario_id=? AND setor=? "
+        "ORDER BY id",
+        (usuario_id, setor)
+    ).fetchall()
+    mapeamentos = {}
+    for row in rows:
+        # Se o indicador foi configurado mais de uma vez, vale o primeiro (como na consulta antiga)
+        mapeamentos.setdefault(row[0], dict(zip(CAMPOS_MAPEAMENTO, row)))
+    return mapeamentos
+
+
+def _em(coluna, valores, modelo):
+    modelo.extend(valores)
+    return f"{citar(coluna)} IN ({', '.join('?' for _ in valores)})"
+
+
+def _movimento_saldo(m, modelo):
+    # Entradas somam e saídas subtraem; outros tipos não entram no saldo
+    casos = []
+    entradas = separar_valores(m["valores_entrada"])
+    saidas = separar_valores(m["valores_saida"])
+    valor = citar(m["coluna_valor"])
+    if entradas:
+        casos.append(f"WHEN {_em(m['coluna_tipo'], entradas, modelo)} THEN {valor}")
+    if saidas:
+        casos.append(f"WHEN {_em(m['coluna_tipo'], saidas, modelo)} THEN -1*{valor}")
+    return f"CASE {' '.join(casos)} ELSE 0 END" if casos else "0"
+
+
+def _condicao_filtro(m, condicoes, modelo):
+    if m["coluna_filtro"] and m["valor_filtro"]:
+        condicoes.append(f"{citar(m['coluna_filtro'])} = ?")
+        modelo.append(m["valor_filtro"])
+
+
+def _condicoes(m, mes, modelo):
+    # Linhas que entram no indicador: o mês do período (até ele, no Saldo em Caixa),
+    # os tipos de entrada e o valor do filtro
+    saldo = m["indicador"] == SALDO_EM_CAIXA
+    condicoes = [f"{mes} <= ?" if saldo else f"{mes} = ?"]
+    modelo.append(Marcador("periodo"))
+    entradas = separar_valores(m["valores_entrada"])
+    if not saldo and m["coluna_tipo"] and entradas:
+        condicoes.append(_em(m["coluna_tipo"], entradas, modelo))
+    _condicao_filtro(m, condicoes, modelo)
+    return condicoes
+
+
+def compilar_expressao(m, mes, modelo):
+    """
+    SUM condicional de um indicador, para ser calculado junto com outros da mesma
+    tabela na mesma varredura. Saldo em Caixa acumula até o período (entradas
+    menos saídas); os demais somam o valor do período. mes é o operando com o mês
+    AAAAMM da coluna de data (ver sync.datas.chave_mes). Os parâmetros são
+    acrescentados a modelo na ordem em que aparecem no SQL.
+    """
+    condicoes = _condicoes(m, mes, modelo)
+    saldo = m["indicador"] == SALDO_EM_CAIXA
+    valor = _movimento_saldo(m, modelo) if saldo else citar(m["coluna_valor"])
+    return f"SUM(CASE WHEN {' AND '.join(condicoes)} THEN {valor} END)"
+
+
+def compilar_grupo(tabela, mapeamentos, meses):
+    """
+    Uma consulta por tabela com uma coluna por indicador. O WHERE repete as
+    condições de cada indicador (ligadas por OR), cada uma com o mês da sua
+    coluna de data, e o SQLite busca cada uma no índice do indicador (ixa_, ver
+    sync.indices) em vez de varrer o histórico. meses: {coluna_data: operando do
+    mês AAAAMM}. Devolve (sql, modelo dos parâmetros).
+    """
+    modelo = []
+    colunas = [compilar_expressao(m, meses[m["coluna_data"]], modelo) for m in mapeamentos]
+    alternativas = {}
+    for m in mapeamentos:
+        parametros = []
+        condicoes = _condicoes(m, meses[m["coluna_data"]], parametros)
+        alternativas.setdefault((" AND ".join(condicoes), tuple(parametros)), None)
+    sql = f"SELECT {', '.join(colunas)} FROM {citar(tabela)} WHERE " + " OR ".join(f"({t})" for t, _ in alternativas)
+    modelo.extend(p for _, parametros in alternativas for p in parametros)
+    return sql, modelo
+
+
+def compilar_serie(m, mes):
+    """
+    Consulta agrupada por mês (mes é o operando AAAAMM da data) entre :inicio e
+    :fim; para Saldo em Caixa, o acumulado até :fim vem de uma janela sobre os
+    totais mensais. Devolve (sql, modelo dos parâmetros).
+    """
+    modelo = []
+    if m["indicador"] == SALDO_EM_CAIXA:
+        movimento = _movimento_saldo(m, modelo)
+        condicoes = [f"{mes} <= ?"]
+        modelo.append(Marcador("fim"))
+        _condicao_filtro(m, condicoes, modelo)
+        sql = (
+            f"SELECT mes, SUM(variacao) OVER (ORDER BY mes) AS saldo FROM ("
+            f"SELECT {mes} AS mes, SUM({movimento}) AS variacao FROM {citar(m['tabela'])} "
+            f"WHERE {' AND '.join(condicoes)} GROUP BY 1) AS mensal"
+        )
+    else:
+        condicoes = [f"{mes} BETWEEN ? AND ?"]
+        modelo.extend([Marcador("inicio"), Marcador("fim")])
+        _condicao_filtro(m, condicoes, modelo)
+        entradas = separar_valores(m["valores_entrada"])
+        if m["coluna_tipo"] and entradas:
+            condicoes.append(_em(m["coluna_tipo"], entradas, modelo))
+        sql = (
+            f"SELECT {mes} AS mes, SUM({citar(m['coluna_valor'])}) AS valor FROM {citar(m['tabela'])} "
+            f"WHERE {' AND '.join(condicoes)} GROUP BY 1"
+        )
+    return sql, modelo
+
+
+def compilada(chave, compilar, *args):
+    """
+    A consulta compilada da chave, montada só na primeira vez. Como o texto do SQL
+    não muda com o período nem com os valores, a conexão de leitura (reaproveitada
+    por thread) também reaproveita o statement já preparado pelo SQLite.
+    """
+    consulta = consultas_compiladas.obter(chave)
+    if consulta is None:
+        consulta = compilar(*args)
+        consultas_compiladas.guardar(chave, consulta)
+    return consulta
+
+
+def vincular(modelo, **valores):
+    """
+    Parâmetros da execução: os marcadores do modelo trocados pelos valores informados.
+    """
+    return [valores[p.nome] if isinstance(p, Marcador) else p for p in modelo]
+
+
+def _valor_filtro(m):
+    return m["valor_filtro"] if m["coluna_filtro"] and m["valor_filtro"] else None
+
+
+def _livro(m, livros):
+    # Chave do livro de saldos do mapeamento (ver sync.saldos), se ele já foi montado
+    livro = livro_do_mapeamento(m)
+    chave = id_livro(livro) if livro else None
+    return chave if chave in livros else None
+
+
+def valor_do_rollup(conn, chave, m, periodo):
+    """
+    O indicador calculado sobre o rollup mensal da sua origem (ver sync.rollups).
+    """
+    valor_filtro = _valor_filtro(m)
+    entradas = separar_valores(m["valores_entrada"])
+    if m["indicador"] == SALDO_EM_CAIXA:
+        return saldo_ate(conn, chave, periodo, entradas, separar_valores(m["valores_saida"]), valor_filtro)
+    return somar_mes(conn, chave, periodo, entradas if m["coluna_tipo"] else None, valor_filtro)
+
+
+def _planejar(conn, caminho_sqlite, mapeamentos, indicadores, periodo, cache):
+    """
+    Resolve o que é barato na hora (cache, livro de saldos, rollup) e devolve as
+    tarefas que leem as tabelas: uma varredura por tabela de origem, com agregação
+    condicional, e uma por fórmula SQL própria. Devolve (resultados, tarefas,
+    chaves do cache a preencher).
+    """
+    resultados = {}
+    chaves_cache = {}
+    if cache is not None:
+        versao = versao_dados(conn)
+        for indicador in indicadores:
+            m = mapeamentos.get(indicador)
+            if m is None:
+                continue
+            chave = (caminho_sqlite, versao, hash_mapeamento(m), periodo)
+            guardado = cache.obter(chave)
+            if guardado is not None:
+                resultados[indicador] = dict(guardado, fonte="cache", segundos=0.0)
+            else:
+                chaves_cache[indicador] = chave
+    pendentes = [i for i in indicadores if i in mapeamentos and i not in resultados]
+    disponiveis = origens_disponiveis(conn) if pendentes else set()
+    livros = livros_disponiveis(conn) if pendentes else set()
+    tarefas = []
+    grupos = {}
+    for indicador in pendentes:
+        m = mapeamentos[indicador]
+        if m["formula_sql"]:
+            tarefas.append(partial(_executar, caminho_sqlite, m["formula_sql"], [indicador], fonte="formula"))
+            continue
+        inicio = time.perf_counter()
+        livro = _livro(m, livros)
+        if livro:
+            try:
+                valor = saldo_do_livro(conn, livro, chave_do_periodo(periodo), _valor_filtro(m))
+                if valor is not None:
+                    resultados[indicador] = {"valor": _valor(valor), "erro": None, "fonte": "livro",
+                                             "segundos": round(time.perf_counter() - inicio, 4)}
+                    continue
+                # Nenhuma linha no livro até o período: o rollup ou a tabela confirmam o valor
+            except Exception:
+                # Livro com problema: segue para o rollup ou a tabela
+                pass
+        origem = origem_do_mapeamento(m)
+        chave = id_origem(origem) if origem else None
+        if chave in disponiveis:
+            try:
+                valor = valor_do_rollup(conn, chave, m, periodo)
+                resultados[indicador] = {"valor": _valor(valor), "erro": None, "fonte": "rollup",
+                                         "segundos": round(time.perf_counter() - inicio, 4)}
+                continue
+            except Exception:
+                # Rollup com problema: calcula pela tabela
+                pass
+        # Saldos acumulam o histórico: ficam fora da varredura do mês dos demais
+        grupos.setdefault((m["tabela"], m["indicador"] == SALDO_EM_CAIXA), []).append(m)
+    for (tabela, _), grupo in grupos.items():
+        meses = {m["coluna_data"]: chave_mes(conn, tabela, m["coluna_data"]) for m in grupo}
+        tarefas.append(partial(_executar_grupo, caminho_sqlite, tabela, grupo, meses, chave_do_periodo(periodo)))
+    return resultados, tarefas, chaves_cache
+
+
+def _consulta_grupo(tabela, grupo, meses, chave_periodo):
+    meses = {m["coluna_data"]: meses[m["coluna_data"]] for m in grupo}
+    chave = ("grupo", tabela, tuple(hash_mapeamento(m) for m in grupo), tuple(meses.items()))
+    sql, modelo = compilada(chave, compilar_grupo, tabela, grupo, meses)
+    return sql, vincular(modelo, periodo=chave_periodo)
+
+
+def _executar_grupo(caminho_sqlite, tabela, grupo, meses, chave_periodo):
+    """
+    Varredura da tabela para os indicadores do grupo. Se a consulta falhar (ex.:
+    coluna renomeada em um dos mapeamentos), cada indicador roda sozinho, para
+    que o erro fique só com o que o causou.
+    """
+    sql, params = _consulta_grupo(tabela, grupo, meses, chave_periodo)
+    resultados = _executar(caminho_sqlite, sql, [m["indicador"] for m in grupo], params)
+    if len(grupo) < 2 or all(r["erro"] is None for r in resultados.values()):
+        return resultados
+    for m in grupo:
+        sql, params = _consulta_grupo(tabela, [m], meses, chave_periodo)
+        resultados.update(_executar(caminho_sqlite, sql, [m["indicador"]], params))
+    return resultados
+
+
+def _cronometrar(tarefa):
+    # Indicadores da mesma varredura recebem o tempo dela
+    inicio = time.perf_counter()
+    resultados = tarefa()
+    segundos = round(time.perf_counter() - inicio, 4)
+    for resultado in resultados.values():
+        resultado["segundos"] = segundos
+    return resultados
+
+
+def _rodar(tarefas, executor=None):
+    if executor is None or len(tarefas) < 2:
+        return [_cronometrar(t) for t in tarefas]
+    return list(executor.map(_cronometrar, tarefas))
+
+
+def _guardar(cache, chaves_cache, resultados):
+    for indicador, chave in chaves_cache.items():
+        resultado = resultados.get(indicador)
+        if resultado is not None and resultado["erro"] is None:
+            cache.guardar(chave, {"valor": resultado["valor"], "erro": None})
+
+
+def avaliar_indicadores(caminho_sqlite, usuario_id, setor, indicadores, periodo, cache=cache_kpi, executor=None):
+    """
+    Calcula os indicadores de um (usuario, setor) no período: lê os mapeamentos
+    de uma vez e usa o livro de saldos (Saldo em Caixa) ou o rollup mensal de
+    cada um quando existirem. Os demais são agrupados pela tabela de origem, com
+    uma varredura por tabela e agregação condicional. Fórmulas SQL próprias rodam
+    à parte. Com executor (ex.: pool_leitura()), as varreduras rodam em paralelo.
+
+    Resultados já calculados para a mesma versão dos dados, mapeamento e período
+    vêm do cache (cache=None desliga); erros não são guardados.
+
+    Devolve {indicador: {"valor", "erro", "fonte", "segundos"}}, com fonte entre
+    cache, livro, rollup, tabela e formula; indicadores sem mapeamento ficam fora.
+    """
+    with ler(caminho_sqlite) as conn:
+        mapeamentos = carregar_mapeamentos(conn, usuario_id, setor)
+        resultados, tarefas, chaves_cache = _planejar(conn, caminho_sqlite, mapeamentos, indicadores, periodo, cache)
+    for parcial in _rodar(tarefas, executor):
+        resultados.update(parcial)
+    if cache is not None:
+        _guardar(cache, chaves_cache, resultados)
+    return resultados
+
+
+def avaliar_setores(caminho_sqlite, usuario_id, setores, periodo, cache=cache_kpi, executor=None):
+    """
+    Indicadores de vários setores do usuário de uma vez: as varreduras de todos
+    os setores vão juntas para o executor. setores: {setor: [indicadores] ou None
+    (todos os mapeados)}. Devolve {setor: resultados de avaliar_indicadores}.
+    """
+    planos = {}
+    with ler(caminho_sqlite) as conn:
+        for setor, indicadores in setores.items():
+            mapeamentos = carregar_mapeamentos(conn, usuario_id, setor)
+            nomes = list(mapeamentos) if indicadores is None else indicadores
+            planos[setor] = _planejar(conn, caminho_sqlite, mapeamentos, nomes, periodo, cache)
+    tarefas = [(setor, tarefa) for setor, (_, lista, _) in planos.items() for tarefa in lista]
+    for (setor, _), parcial in zip(tarefas, _rodar([t for _, t in tarefas], executor)):
+        planos[setor][0].update(parcial)
+    if cache is not None:
+        for resultados, _, chaves_cache in planos.values():
+            _guardar(cache, chaves_cache, resultados)
+    return {setor: plano[0] for setor, plano in planos.items()}
+
+
+def _executar(caminho_sqlite, sql, indicadores, params=None, fonte="tabela"):
+    try:
+        df = consultar(caminho_sqlite, sql, params)
+    except Exception as e:
+        return {indicador: {"valor": None, "erro": str(e), "fonte": fonte} for indicador in indicadores}
+    linha = df.iloc[0].tolist() if not df.empty else [None] * len(indicadores)
+    return {
+        indicador: {"valor": _valor(valor), "erro": None, "fonte": fonte}
+        for indicador, valor in zip(indicadores, linha)
+    }
+
+
+def _valor(valor):
+    # SUM sem linhas vem como None (SQLite) ou NaN (DuckDB); tipos do numpy viram nativos
+    if valor is None or pd.isna(valor):
+        return 0
+    return valor.item() if hasattr(valor, "item") else valor
+
+
+def deslocar_mes(periodo, meses):
+    ano, mes = (int(p) for p in periodo.split("-"))
+    total = ano * 12 + (mes - 1) + meses
+    return f"{total // 12:04d}-{total % 12 + 1:02d}"
+
+
+def _variacao(atual, anterior):
+    if anterior is None:
+        return None, None
+    delta = atual - anterior
+    return delta, (round(delta / abs(anterior) * 100, 2) if anterior else None)
+
+
+def _serie_da_tabela(caminho_sqlite, m, inicio, fim, mes):
+    """
+    {mes: valor} lendo a tabela de origem com a consulta compilada do indicador.
+    """
+    sql, modelo = compilada(("serie", hash_mapeamento(m), mes), compilar_serie, m, mes)
+    params = vincular(modelo, inicio=chave_do_periodo(inicio), fim=chave_do_periodo(fim))
+    df = consultar(caminho_sqlite, sql, params)
+    return {
+        periodo_da_chave(int(linha[0])): _valor(linha[1])
+        for linha in df.itertuples(index=False) if not pd.isna(linha[0])
+    }
+
+
+def _serie_do_rollup(conn, chave, m, inicio, fim):
+    valor_filtro = _valor_filtro(m)
+    entradas = separar_valores(m["valores_entrada"])
+    if m["indicador"] == SALDO_EM_CAIXA:
+        valores = serie_saldo(conn, chave, fim, entradas, separar_valores(m["valores_saida"]), valor_filtro)
+    else:
+        valores = serie_mensal(conn, chave, inicio, fim, entradas if m["coluna_tipo"] else None, valor_filtro)
+    return {mes: _valor(valor) for mes, valor in valores.items()}
+
+
+def montar_serie(m, valores, periodos):
+    """
+    Pontos da série com variação sobre o mês anterior (MoM) e sobre o mesmo mês
+    do ano anterior (YoY). periodos inclui os 12 meses anteriores ao intervalo,
+    usados só como base das variações. Meses sem movimento valem 0, ou o último
+    saldo no caso de Saldo em Caixa.
+    """
+    saldo = m["indicador"] == SALDO_EM_CAIXA
+    por_mes = {}
+    anterior = 0
+    for mes in sorted(valores):
+        if mes < periodos[0]:
+            anterior = valores[mes]
+    for mes in periodos:
+        if mes in valores:
+            anterior = valores[mes]
+        por_mes[mes] = anterior if saldo else valores.get(mes, 0)
+    pontos = []
+    for mes in periodos[12:]:
+        mom, mom_pct = _variacao(por_mes[mes], por_mes.get(deslocar_mes(mes, -1)))
+        yoy, yoy_pct = _variacao(por_mes[mes], por_mes.get(deslocar_mes(mes, -12)))
+        pontos.append({"periodo": mes, "valor": por_mes[mes], "mom": mom, "mom_pct": mom_pct,
+                       "yoy": yoy, "yoy_pct": yoy_pct})
+    return pontos
+
+
+def series_indicadores(caminho_sqlite, usuario_id, setor, indicadores=None, ate=None, meses=MESES_SERIE,
+                       cache=cache_kpi):
+    """
+    Série mensal de cada indicador nos `meses` meses até `ate` ('YYYY-MM'), com
+    MoM e YoY. Cada indicador custa uma consulta agrupada por mês (no rollup
+    quando existir), com 12 meses a mais para a base do YoY.
+
+    indicadores=None traz todos os mapeados do setor; ate=None é o mês atual.
+    Devolve {indicador: {"pontos": [...], "erro": ...}}; indicadores sem
+    mapeamento ficam fora e os de fórmula SQL própria voltam com erro.
+    """
+    ate = ate or datetime.now().strftime("%Y-%m")
+    meses = max(1, min(int(meses), MAX_MESES_SERIE))
+    periodos = [deslocar_mes(ate, -i) for i in range(meses + 11, -1, -1)]
+    inicio = periodos[0]
+    resultados = {}
+    with ler(caminho_sqlite) as conn:
+        mapeamentos = carregar_mapeamentos(conn, usuario_id, setor)
+        versao = versao_dados(conn)
+        disponiveis = origens_disponiveis(conn)
+        livros = livros_disponiveis(conn)
+        for indicador in (indicadores if indicadores is not None else list(mapeamentos)):
+            m = mapeamentos.get(indicador)
+            if m is None:
+                continue
+            if m["formula_sql"]:
+                resultados[indicador] = {"pontos": [], "erro": "Indicador com fórmula SQL própria não tem série mensal."}
+                continue
+            chave_cache = (caminho_sqlite, versao, hash_mapeamento(m), "serie", inicio, ate)
+            guardado = cache.obter(chave_cache) if cache is not None else None
+            if guardado is not None:
+                resultados[indicador] = {"pontos": [dict(p) for p in guardado], "erro": None}
+                continue
+            origem = origem_do_mapeamento(m)
+            livro = _livro(m, livros)
+            try:
+                valores = None
+                if livro:
+                    saldos = serie_do_livro(conn, livro, chave_do_periodo(ate), _valor_filtro(m))
+                    # Livro sem linhas até o fim (ex.: valor do filtro que ele não tem): rollup ou tabela
+                    if saldos:
+                        valores = {periodo_da_chave(mes): _valor(saldo) for mes, saldo in saldos.items()}
+                if valores is None and origem and id_origem(origem) in disponiveis:
+                    valores = _serie_do_rollup(conn, id_origem(origem), m, inicio, ate)
+                elif valores is None:
+                    valores = _serie_da_tabela(caminho_sqlite, m, inicio, ate,
+                                               chave_mes(conn, m["tabela"], m["coluna_data"]))
+            except Exception as e:
+                resultados[indicador] = {"pontos": [], "erro": str(e)}
+                continue
+            pontos = montar_serie(m, valores, periodos)
+            if cache is not None:
+                cache.guardar(chave_cache, pontos)
+            resultados[indicador] = {"pontos": pontos, "erro": None}
+    return resultados
+
+
+
+def _pausar(inicio, carga, prazo):
+    # Dorme o proporcional ao trabalho feito para ficar em `carga` de um núcleo
+    gasto = time.monotonic() - inicio
+    time.sleep(max(0, min(gasto * (1 / carga - 1), prazo - time.monotonic())))
+
+
+@contextmanager
+def _com_prazo(caminho_sqlite, prazo):
+    """
+    Interrompe as consultas desta thread que passarem do prazo: o SQLite pelo
+    progress handler da conexão de leitura, o DuckDB por um timer.
+    """
+    timer = threading.Timer(max(0, prazo - time.monotonic()), interruptor_duckdb())
+    timer.daemon = True
+    with ler(caminho_sqlite) as conn:
+        conn.set_progress_handler(lambda: time.monotonic() >= prazo, AQUECIMENTO_PASSOS_PRAZO)
+        timer.start()
+        try:
+            yield
+        finally:
+            timer.cancel()
+            conn.set_progress_handler(None, 0)
+
+
+def aquecer(caminho_sqlite, periodo=None, orcamento_segundos=AQUECIMENTO_SEGUNDOS, carga=AQUECIMENTO_CARGA,
+            cache=cache_kpi):
+    """
+    Prepara o dashboard depois de uma sincronização: calcula todos os indicadores
+    mapeados (de todos os usuários e setores) no período atual e no anterior,
+    deixando-os no cache com a versão nova dos dados, e lê os índices usados
+    pelas consultas. Roda numa thread só, sem o pool de leitura, pausando entre
+    os passos para usar no máximo `carga` de um núcleo. Ao passar de
+    orcamento_segundos, a consulta em andamento é interrompida e o aquecimento
+    para. Devolve um relatório.
+    """
+    inicio = time.monotonic()
+    prazo = inicio + orcamento_segundos
+    periodo = periodo or datetime.now().strftime("%Y-%m")
+    relatorio = {"periodos": [periodo, deslocar_mes(periodo, -1)], "avaliados": 0, "erros": 0, "indices": 0,
+                 "interrompido": False, "segundos": 0}
+    with ler(caminho_sqlite) as conn:
+        if not tabela_existe(conn, "indicador_mapeamento"):
+            return relatorio
+        pares = conn.execute(
+            "SELECT DISTINCT usuario_id, setor FROM indicador_mapeamento ORDER BY usuario_id, setor"
+        ).fetchall()
+        indices = indices_quentes(conn)
+    passos = [partial(avaliar_setores, caminho_sqlite, usuario_id, {setor: None}, p, cache)
+              for p in relatorio["periodos"] for usuario_id, setor in pares]
+    passos += [partial(_tocar, caminho_sqlite, nome, tabela) for nome, tabela in indices]
+    with _com_prazo(caminho_sqlite, prazo):
+        for passo in passos:
+            if time.monotonic() >= prazo:
+                relatorio["interrompido"] = True
+                break
+            t0 = time.monotonic()
+            try:
+                feito = passo()
+            except Exception:
+                if time.monotonic() < prazo:
+                    raise
+                feito = None
+            if time.monotonic() >= prazo:
+                # Consulta interrompida no meio do passo: o que ele devolveu não conta
+                relatorio["interrompido"] = True
+                break
+            if feito is None:
+                relatorio["indices"] += 1
+            else:
+                for resultados in feito.values():
+                    relatorio["avaliados"] += len(resultados)
+                    relatorio["erros"] += sum(1 for r in resultados.values() if r["erro"])
+            _pausar(t0, carga, prazo)
+    relatorio["segundos"] = round(time.monotonic() - inicio, 3)
+    return relatorio
+
+
+def _tocar(caminho_sqlite, nome, tabela):
+    with ler(caminho_sqlite) as conn:
+        tocar_indice(conn, nome, tabela)
@@ -2,6 +2,7 @@ import requests
 import streamlit as st
 import sqlite3
 import pandas as pd
+from sync.colunar import consultar
 
 USE_LOCAL_OLLAMA = True  # True = IA local (Ollama), False = OpenRouter
 
@@ -113,7 +114,7 @@ def executar_pergunta(pergunta, sqlite_path):
         st.code(sql_sugerido, language="sql")
         # Tenta executar o SQL!
         try:
-            df_result = pd.read_sql(sql_sugerido, sqlite3.connect(sqlite_path))
+            df_result = consultar(sqlite_path, sql_sugerido)
             if not df_result.empty:
                 st.dataframe(df_result)
             else:
@@ -1,9 +1,40 @@
 from fastapi import FastAPI, HTTPException, Query, Path, Body
 from fastapi.middleware.cors import CORSMiddleware
-import sqlite3
-from typing import Dict, List
-import pymysql
-import pandas as pd
+from fastapi.responses import StreamingResponse
+import os
+import json
+import re
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+# Permite importar os pacotes compartilhados da raiz do projeto (sync/, app/)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.indicadores import (
+    CAMPOS_MAPEAMENTO, INDICADORES_POR_SETOR, MAX_MESES_SERIE, MESES_SERIE, aquecer, avaliar_setores,
+    carregar_mapeamentos as mapeamentos_do_setor, pool_leitura, series_indicadores,
+)
+from sync.copia import colunas_locais, tabela_existe, ORCAMENTO_MEMORIA_MB
+from sync.tipos import descobrir_chave_primaria
+from sync.paralelo import sincronizar_paralelo, resumir, WORKERS_PADRAO
+from sync.agendador import AgendadorSincronismo
+from sync.jobs import GerenciadorJobs, JobDuplicado
+from sync.conexoes import PoolsPorChave
+from sync.banco_local import gerenciador
+from sync.colunar import colunar_ativo, exportar_tabelas
+from sync.datas import garantir_chaves_data
+from sync.indices import (
+    aplicar_indices, carregar_mapeamentos, carregar_relacionamentos, garantir_tabela_mapeamentos, listar_indices,
+    planejar_indices,
+)
+from sync.catalogo import CacheCatalogo, ler_catalogo_remoto, nomes_do_catalogo
+from sync.rollups import atualizar_rollups
+from sync.saldos import atualizar_saldos
+from sync.versao import incrementar_versao
+from sync.telemetria import (
+    RETENCAO_EXECUCOES, ULTIMAS_EXECUCOES, garantir_tabelas_log, historico, registrar_execucao,
+)
 
 app = FastAPI()
 app.add_middleware(
@@ -14,14 +45,54 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Banco de controle (usuários, empresas, metadados); os dados sincronizados ficam em um arquivo por empresa
 DB_PATH = "database.db"
+DADOS_DIR = "dados"
+# Sobrescreve os ajustes de sync.banco_local.CONFIG_SQLITE (ex.: {"mmap_size": 0})
+CONFIG_SQLITE_BACKEND = {}
+# Sincronização automática em segundo plano (intervalo_sync de cada empresa, em minutos)
+AGENDADOR_ATIVO = True
+INTERVALO_SYNC_PADRAO = 60
+
+# Conexões reaproveitáveis com o MySQL de cada empresa (chave: empresa_id)
+pools_mysql = PoolsPorChave()
+# Tabelas, views e colunas do MySQL de cada empresa (chave: empresa_id)
+catalogos = CacheCatalogo()
+
+def caminho_dados_empresa(empresa_id):
+    return os.path.join(DADOS_DIR, f"empresa_{int(empresa_id)}.db")
+
+def banco(empresa_id=None):
+    """
+    Sem empresa_id, o banco de controle; com empresa_id, o arquivo de dados da
+    empresa. Cada empresa tem o seu lock de escrita: a sincronização de uma não
+    bloqueia as outras nem os logins.
+    """
+    if empresa_id is None:
+        return gerenciador(DB_PATH, **CONFIG_SQLITE_BACKEND)
+    os.makedirs(DADOS_DIR, exist_ok=True)
+    return gerenciador(caminho_dados_empresa(empresa_id), **CONFIG_SQLITE_BACKEND)
+
+def get_conn(empresa_id=None):
+    # Conexão de leitura reaproveitada pela thread da requisição
+    return banco(empresa_id).leitura()
+
+def get_conn_escrita(empresa_id=None):
+    # Gravador único do arquivo; commit ao sair do "with"
+    return banco(empresa_id).escrita()
+
+def separar_colunas(texto):
+    return [c.strip() for c in (texto or "").split(",") if c.strip()]
 
-def get_conn():
-    return sqlite3.connect(DB_PATH)
+
+def garantir_coluna(conn, tabela, coluna, definicao):
+    colunas = [c[1] for c in conn.execute(f"PRAGMA table_info({tabela})").fetchall()]
+    if coluna not in colunas:
+        conn.execute(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {definicao}")
 
 @app.on_event("startup")
 def init_db():
-    with get_conn() as conn:
+    with get_conn_escrita() as conn:
         conn.execute("""
             CREATE TABLE IF NOT EXISTS empresas (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -31,9 +102,13 @@ def init_db():
                 porta TEXT,
                 usuario_banco TEXT,
                 senha_banco TEXT,
-                schema TEXT
+                schema TEXT,
+                intervalo_sync INTEGER DEFAULT 60,   -- minutos; 0 desativa a sincronização automática
+                ultimo_sync TIMESTAMP
             )
         """)
+        garantir_coluna(conn, "empresas", "intervalo_sync", f"INTEGER DEFAULT {INTERVALO_SYNC_PADRAO}")
+        garantir_coluna(conn, "empresas", "ultimo_sync", "TIMESTAMP")
         conn.execute("""
             CREATE TABLE IF NOT EXISTS usuarios (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -51,9 +126,24 @@ def init_db():
                 empresa_id INTEGER,
                 nome_tabela TEXT,
                 ultima_sincronizacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                modo TEXT DEFAULT 'completo',    -- 'completo' ou 'incremental'
+                coluna_watermark TEXT,           -- ex: updated_at ou id crescente
+                ultimo_watermark TEXT,
+                chave_primaria TEXT,             -- colunas separadas por vírgula
+                fingerprint TEXT,                -- impressão digital remota da última cópia
+                ultima_duracao REAL,             -- segundos da última cópia
+                colunas_centavos TEXT,           -- DECIMAL gravados como inteiro em centavos, separadas por vírgula
                 UNIQUE(empresa_id, nome_tabela)
             )
         """)
+        # Bancos criados antes do modo incremental
+        garantir_coluna(conn, "tabelas_sincronizadas", "modo", "TEXT DEFAULT 'completo'")
+        garantir_coluna(conn, "tabelas_sincronizadas", "coluna_watermark", "TEXT")
+        garantir_coluna(conn, "tabelas_sincronizadas", "ultimo_watermark", "TEXT")
+        garantir_coluna(conn, "tabelas_sincronizadas", "chave_primaria", "TEXT")
+        garantir_coluna(conn, "tabelas_sincronizadas", "fingerprint", "TEXT")
+        garantir_coluna(conn, "tabelas_sincronizadas", "ultima_duracao", "REAL")
+        garantir_coluna(conn, "tabelas_sincronizadas", "colunas_centavos", "TEXT")
         # Tabela de relacionamentos
         conn.execute("""
             CREATE TABLE IF NOT EXISTS relacionamentos (
@@ -67,6 +157,7 @@ def init_db():
                 UNIQUE(empresa_id, tabela_origem, coluna_origem, tabela_destino, coluna_destino)
             )
         """)
+        garantir_tabelas_log(conn)
         conn.commit()
 
 def get_current_user(email: str, senha: str):
@@ -102,7 +193,7 @@ def cadastrar_empresa(dados: dict = Body(...)):
     if not empresa or not usuario:
         raise HTTPException(status_code=400, detail="Dados incompletos.")
 
-    with get_conn() as conn:
+    with get_conn_escrita() as conn:
         # Cria empresa
         cur = conn.cursor()
         cur.execute(
@@ -133,7 +224,7 @@ def dados_empresa(empresa_id: int, email: str = Query(...), senha: str = Query(.
         raise HTTPException(status_code=403, detail="Acesso negado.")
     with get_conn() as conn:
         row = conn.execute("""
-            SELECT id, nome, tipo_banco, host, porta, usuario_banco, senha_banco, schema
+            SELECT id, nome, tipo_banco, host, porta, usuario_banco, senha_banco, schema, intervalo_sync, ultimo_sync
             FROM empresas WHERE id=?
         """, (empresa_id,)).fetchone()
         if not row:
@@ -146,7 +237,9 @@ def dados_empresa(empresa_id: int, email: str = Query(...), senha: str = Query(.
             "porta": row[4],
             "usuario_banco": row[5],
             "senha_banco": row[6],
-            "schema": row[7]
+            "schema": row[7],
+            "intervalo_sync": row[8],
+            "ultimo_sync": row[9]
         }
 
 # --- ATUALIZAR CONEXÃO DA EMPRESA ---
@@ -160,7 +253,7 @@ def atualizar_conexao(
     user = get_current_user(email=email, senha=senha)
     if user["perfil"] != "admin_geral" and user["empresa_id"] != empresa_id:
         raise HTTPException(status_code=403, detail="Acesso negado.")
-    with get_conn() as conn:
+    with get_conn_escrita() as conn:
         conn.execute("""
             UPDATE empresas SET
                 tipo_banco = ?,
@@ -168,14 +261,18 @@ def atualizar_conexao(
                 porta = ?,
                 usuario_banco = ?,
                 senha_banco = ?,
-                schema = ?
+                schema = ?,
+                intervalo_sync = COALESCE(?, intervalo_sync)
             WHERE id = ?
         """, (
             dados.get("tipo_banco"), dados.get("host"), dados.get("porta"),
             dados.get("usuario_banco"), dados.get("senha_banco"), dados.get("schema"),
-            empresa_id
+            dados.get("intervalo_sync"), empresa_id
         ))
         conn.commit()
+    # Conexões abertas com as credenciais antigas não são mais reaproveitadas
+    pools_mysql.invalidar(empresa_id)
+    catalogos.invalidar(empresa_id)
     return {"ok": True}
 
 # --- ENDPOINT DE LISTA DE TABELAS PARA SINCRONISMO ---
@@ -183,7 +280,8 @@ def atualizar_conexao(
 def listar_tabelas_sincronismo(
     empresa_id: int = Query(...),
     email: str = Query(...),
-    senha: str = Query(...)
+    senha: str = Query(...),
+    atualizar: bool = Query(False)
 ):
     user = get_current_user(email=email, senha=senha)
     if user["perfil"] != "admin_geral" and user["empresa_id"] != empresa_id:
@@ -202,44 +300,40 @@ def listar_tabelas_sincronismo(
     tipo_banco, host, porta, usuario_banco, senha_banco, schema = empresa_row
 
     novas_tabelas = []
+    catalogo = None
+    do_cache = False
     if tipo_banco == "mysql":
+        def carregar():
+            with pools_mysql.conexao(empresa_id, host, porta, usuario_banco, senha_banco, schema) as conn_mysql:
+                return ler_catalogo_remoto(conn_mysql)
+
         try:
-            conn_mysql = pymysql.connect(
-                host=host, port=int(porta), user=usuario_banco, password=senha_banco,
-                database=schema, charset='utf8mb4'
-            )
-            with conn_mysql.cursor() as cur:
-                cur.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = %s", (schema,))
-                resultado_tabelas = [row[0] for row in cur.fetchall()]
-                cur.execute("SELECT table_name FROM information_schema.views WHERE table_schema = %s", (schema,))
-                resultado_views = [row[0] for row in cur.fetchall()]
-            conn_mysql.close()
-            todas = resultado_tabelas + resultado_views
-            novas_tabelas = [t for t in todas if t not in sincronizadas]
+            catalogo, do_cache = catalogos.obter(empresa_id, carregar, atualizar=atualizar)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Erro ao conectar MySQL: {str(e)}")
-    else:
-        novas_tabelas = []
+        novas_tabelas = [t for t in nomes_do_catalogo(catalogo) if t not in sincronizadas]
 
     return {
         "sincronizadas": sincronizadas,
-        "novas": novas_tabelas
+        "novas": novas_tabelas,
+        "catalogo": catalogo["tabelas"] if catalogo else [],
+        "catalogo_lido_em": catalogo["lido_em"] if catalogo else None,
+        "do_cache": do_cache,
     }
 
-# --- SINCRONIZAR NOVAS TABELAS ---
-@app.post("/sincronismo/sincronizar-novas")
-def sincronizar_novas(
-    body: dict = Body(...)
-):
-    empresa_id = body.get("empresa_id")
-    tabelas = body.get("tabelas", [])
-    email = body.get("email")
-    senha = body.get("senha")
-
-    user = get_current_user(email=email, senha=senha)
-    if user["perfil"] != "admin_geral" and user["empresa_id"] != empresa_id:
-        raise HTTPException(status_code=403, detail="Acesso negado.")
+# --- SINCRONIZAÇÃO (usada pelos jobs e pelo agendador) ---
+_tabelas_sincronizando = set()   # (empresa_id, tabela)
+_lock_sincronizando = threading.Lock()
 
+def executar_sincronizacao(empresa_id, tabelas=None, workers=WORKERS_PADRAO, memoria_mb=ORCAMENTO_MEMORIA_MB,
+                           ao_progresso=None, origem="job"):
+    """
+    Sincroniza as tabelas informadas (ou todas as já sincronizadas da empresa)
+    e atualiza tabelas_sincronizadas e empresas.ultimo_sync. Uma mesma tabela
+    nunca tem duas sincronizações ao mesmo tempo. Cada execução fica registrada
+    em sync_execucoes/sync_log (ver /sincronismo/historico). Se todas as tabelas
+    falharem, ultimo_sync não avança e a execução termina com erro.
+    """
     with get_conn() as conn:
         empresa = conn.execute(
             "SELECT tipo_banco, host, porta, usuario_banco, senha_banco, schema FROM empresas WHERE id=?",
@@ -252,33 +346,417 @@ def sincronizar_novas(
     if tipo_banco != "mysql":
         raise HTTPException(status_code=400, detail="Sincronização suportada apenas para MySQL.")
 
+    with get_conn() as conn:
+        rows = conn.execute(
+            "SELECT nome_tabela, modo, coluna_watermark, ultimo_watermark, chave_primaria, fingerprint, ultima_duracao, "
+            "colunas_centavos FROM tabelas_sincronizadas WHERE empresa_id=?",
+            (empresa_id,)
+        ).fetchall()
+    config = {r[0]: r[1:] for r in rows}
+    if tabelas is None:
+        tabelas = list(config)
+
+    reservadas = {(empresa_id, t) for t in tabelas}
+    with _lock_sincronizando:
+        if reservadas & _tabelas_sincronizando:
+            raise HTTPException(status_code=409, detail="Já existe uma sincronização em andamento para estas tabelas.")
+        _tabelas_sincronizando.update(reservadas)
     try:
-        conn_mysql = pymysql.connect(
-            host=host, port=int(porta), user=usuario_banco, password=senha_banco,
-            database=schema, charset='utf8mb4'
-        )
-        tabelas_sincronizadas = []
+        tarefas = []
         for tabela in tabelas:
-            df = pd.read_sql(f"SELECT * FROM `{tabela}`", conn_mysql)
-            with sqlite3.connect(DB_PATH) as conn_sqlite:
-                df.to_sql(tabela, conn_sqlite, if_exists='replace', index=False)
-            tabelas_sincronizadas.append(tabela)
-        conn_mysql.close()
+            (modo, coluna_watermark, ultimo_watermark, chave_primaria, fingerprint, _,
+             colunas_centavos) = config.get(tabela, (None,) * 7)
+            tarefas.append({
+                "tabela": tabela,
+                "modo": modo,
+                "coluna_watermark": coluna_watermark,
+                "ultimo_watermark": ultimo_watermark,
+                "chave_primaria": separar_colunas(chave_primaria),
+                "fingerprint": fingerprint,
+                "colunas_centavos": separar_colunas(colunas_centavos),
+            })
+
+        def abrir_conexao_remota():
+            return pools_mysql.conexao(empresa_id, host, porta, usuario_banco, senha_banco, schema)
+
+        iniciada_em = time.time()
+        try:
+            conn_sqlite = banco(empresa_id).conectar()
+            try:
+                detalhes = sincronizar_paralelo(
+                    tarefas, abrir_conexao_remota, conn_sqlite, host=f"{host}:{porta}",
+                    workers=workers, orcamento_memoria_mb=memoria_mb, ao_progresso=ao_progresso
+                )
+                ajustar_chaves_data(empresa_id, conn_sqlite)
+                ajustar_rollups(empresa_id, conn_sqlite, detalhes, tarefas)
+                if any(not r["erro"] and not r["pulada"] for r in detalhes):
+                    # Resultados de indicadores em cache deixam de valer
+                    incrementar_versao(conn_sqlite)
+                    conn_sqlite.commit()
+                inicio_indices = time.monotonic()
+                ajustar_indices(empresa_id, conn_sqlite)
+                segundos_indices = round(time.monotonic() - inicio_indices, 3)
+            finally:
+                conn_sqlite.close()
+        except Exception as e:
+            with get_conn_escrita() as conn:
+                registrar_execucao(conn, empresa_id, None, iniciada_em, origem, erro=str(e))
+            raise HTTPException(status_code=500, detail=f"Erro ao sincronizar: {str(e)}")
+
+        with get_conn_escrita() as conn:
+            for resultado in detalhes:
+                if resultado["erro"]:
+                    continue
+                if resultado["pulada"]:
+                    # Sem mudança desde a última cópia: mantém watermark e duração
+                    resultado["ultima_duracao"] = config.get(resultado["tabela"], (None,) * 7)[5]
+                    conn.execute(
+                        "UPDATE tabelas_sincronizadas SET ultima_sincronizacao = CURRENT_TIMESTAMP "
+                        "WHERE empresa_id = ? AND nome_tabela = ?",
+                        (empresa_id, resultado["tabela"])
+                    )
+                    continue
+                watermark = resultado["watermark"]
+                conn.execute(
+                    """
+                    INSERT INTO tabelas_sincronizadas
+                        (empresa_id, nome_tabela, ultima_sincronizacao, ultimo_watermark, fingerprint, ultima_duracao)
+                    VALUES (?, ?, CURRENT_TIMESTAMP, ?, ?, ?)
+                    ON CONFLICT(empresa_id, nome_tabela) DO UPDATE SET
+                        ultima_sincronizacao = CURRENT_TIMESTAMP,
+                        ultimo_watermark = excluded.ultimo_watermark,
+                        fingerprint = excluded.fingerprint,
+                        ultima_duracao = excluded.ultima_duracao
+                    """,
+                    (empresa_id, resultado["tabela"], str(watermark) if watermark is not None else None,
+                     resultado["fingerprint"], resultado["segundos"])
+                )
+            sincronizou = any(not r["erro"] for r in detalhes)
+            if sincronizou:
+                conn.execute("UPDATE empresas SET ultimo_sync = CURRENT_TIMESTAMP WHERE id = ?", (empresa_id,))
+            registrar_execucao(conn, empresa_id, detalhes, iniciada_em, origem, segundos_indices)
+            conn.commit()
+        if detalhes and not sincronizou:
+            # Falha total: ultimo_sync fica como estava e o agendador espera antes de tentar de novo
+            falhas = "; ".join(f"{r['tabela']}: {r['erro']}" for r in detalhes)
+            raise HTTPException(status_code=500, detail=f"Erro ao sincronizar: nenhuma tabela copiada ({falhas})")
+        copiadas = [r["tabela"] for r in detalhes if not r["erro"] and not r["pulada"]]
+        for tabela, erro in exportar_tabelas(caminho_dados_empresa(empresa_id), copiadas).items():
+            print(f"Empresa {empresa_id}: Parquet de {tabela} não gerado: {erro}")
+        if copiadas and colunar_ativo():
+            # Consultas no DuckDB durante a exportação leram o Parquet antigo e guardaram
+            # o resultado com a versão nova: outra versão descarta esses resultados
+            with get_conn_escrita(empresa_id) as conn:
+                incrementar_versao(conn)
+        return detalhes
+    finally:
+        with _lock_sincronizando:
+            _tabelas_sincronizando.difference_update(reservadas)
+
+def ajustar_chaves_data(empresa_id, conn_sqlite):
+    """
+    Recria as chaves de data derivadas (mês AAAAMM e dia) das colunas de data
+    mapeadas; a cópia completa publica a tabela sem elas.
+    """
+    try:
+        for item in garantir_chaves_data(conn_sqlite, carregar_mapeamentos(conn_sqlite)):
+            print(f"Empresa {empresa_id}: chave de data {item['coluna']} criada em {item['tabela']}")
+    except Exception as e:
+        conn_sqlite.rollback()
+        print(f"Empresa {empresa_id}: erro ao criar chaves de data: {e}")
+
+def ajustar_rollups(empresa_id, conn_sqlite, detalhes, tarefas):
+    """
+    Refaz os rollups mensais e os livros de saldo dos indicadores das tabelas que
+    mudaram; nas cópias incrementais, só os meses trazidos pelo delta.
+    """
+    por_tabela = {t["tabela"]: t for t in tarefas}
+    alteradas = {}
+    for resultado in detalhes:
+        if resultado["erro"] or resultado["pulada"]:
+            continue
+        tarefa = por_tabela[resultado["tabela"]]
+        if resultado["modo"] == "incremental":
+            if resultado["linhas"]:
+                alteradas[resultado["tabela"]] = (tarefa["coluna_watermark"], tarefa["ultimo_watermark"])
+        else:
+            alteradas[resultado["tabela"]] = None
+    try:
+        mapeamentos = carregar_mapeamentos(conn_sqlite)
+        for item in atualizar_rollups(conn_sqlite, mapeamentos, alteradas):
+            print(f"Empresa {empresa_id}: rollup {item['origem']} ({item['tabela']}) {item['acao']}")
+        for item in atualizar_saldos(conn_sqlite, mapeamentos, alteradas):
+            print(f"Empresa {empresa_id}: livro de saldos {item['livro']} ({item['tabela']}) {item['acao']}")
+    except Exception as e:
+        conn_sqlite.rollback()
+        print(f"Empresa {empresa_id}: erro ao atualizar rollups: {e}")
+
+def ajustar_indices(empresa_id, conn_sqlite):
+    """
+    Cria/remove os índices do assistente conforme os mapeamentos de indicadores e
+    os relacionamentos da empresa. Uma falha aqui não derruba a sincronização.
+    """
+    try:
+        with get_conn() as conn:
+            relacionamentos = carregar_relacionamentos(conn, empresa_id)
+        planejados = planejar_indices(conn_sqlite, carregar_mapeamentos(conn_sqlite), relacionamentos)
+        for item in aplicar_indices(conn_sqlite, planejados):
+            if item["acao"] != "mantido":
+                print(f"Empresa {empresa_id}: índice {item['indice']} {item['acao']} ({item['motivo'] or 'sem uso'})")
+    except Exception as e:
+        print(f"Empresa {empresa_id}: erro ao ajustar índices: {e}")
+
+def aquecer_empresa(empresa_id, detalhes):
+    """
+    Depois da sincronização (já fora da reserva das tabelas), deixa no cache os
+    indicadores mapeados do período atual e do anterior e lê os índices usados
+    por eles (ver app.indicadores.aquecer). Roda numa thread em segundo plano:
+    o job termina e a empresa fica livre para outra sincronização sem esperar o
+    aquecimento. Só roda se algo foi copiado; devolve a thread (ou None).
+    """
+    if not any(not r["erro"] and not r["pulada"] for r in detalhes):
+        return None
+    thread = threading.Thread(target=_aquecer_empresa, args=(empresa_id,), name=f"aquecer-{empresa_id}", daemon=True)
+    thread.start()
+    return thread
+
+def _aquecer_empresa(empresa_id):
+    # Uma falha aqui não derruba a sincronização, que já terminou
+    try:
+        relatorio = aquecer(caminho_dados_empresa(empresa_id))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao sincronizar: {str(e)}")
+        print(f"Empresa {empresa_id}: erro no aquecimento dos indicadores: {e}")
+        return
+    print(f"Empresa {empresa_id}: {relatorio['avaliados']} indicadores e {relatorio['indices']} índices aquecidos "
+          f"em {relatorio['segundos']}s{' (interrompido pelo limite de tempo)' if relatorio['interrompido'] else ''}")
+
+# --- JOBS DE SINCRONIZAÇÃO ---
+jobs = GerenciadorJobs()
+
+def iniciar_job_sincronizacao(body):
+    empresa_id = body.get("empresa_id")
+    tabelas = body.get("tabelas", [])
+    email = body.get("email")
+    senha = body.get("senha")
+    memoria_mb = int(body.get("memoria_mb") or ORCAMENTO_MEMORIA_MB)
+    workers = int(body.get("workers") or WORKERS_PADRAO)
+
+    user = get_current_user(email=email, senha=senha)
+    if user["perfil"] != "admin_geral" and user["empresa_id"] != empresa_id:
+        raise HTTPException(status_code=403, detail="Acesso negado.")
+    if not tabelas:
+        raise HTTPException(status_code=400, detail="Informe ao menos uma tabela.")
+
+    def executar(job):
+        detalhes = executar_sincronizacao(
+            empresa_id, tabelas, workers=workers, memoria_mb=memoria_mb, ao_progresso=job.atualizar_tabela
+        )
+        aquecer_empresa(empresa_id, detalhes)
+        return detalhes
+
+    try:
+        job = jobs.criar(empresa_id, tabelas, executar)
+    except JobDuplicado as e:
+        raise HTTPException(status_code=409, detail={"mensagem": str(e), "job_id": e.job.id})
+    return {"ok": True, "job_id": job.id, "status": job.status}
+
+def obter_job_autorizado(job_id, email, senha):
+    user = get_current_user(email=email, senha=senha)
+    job = jobs.obter(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+    if user["perfil"] != "admin_geral" and user["empresa_id"] != job.empresa_id:
+        raise HTTPException(status_code=403, detail="Acesso negado.")
+    return job
+
+# --- SINCRONIZAR NOVAS TABELAS ---
+@app.post("/sincronismo/sincronizar-novas")
+def sincronizar_novas(
+    body: dict = Body(...)
+):
+    return iniciar_job_sincronizacao(body)
+
+# --- ATUALIZAR TABELAS JÁ SINCRONIZADAS ---
+@app.post("/sincronismo/atualizar")
+def atualizar_sincronizadas(body: dict = Body(...)):
+    return iniciar_job_sincronizacao(body)
+
+@app.get("/sincronismo/jobs")
+def listar_jobs(empresa_id: int = Query(...), email: str = Query(...), senha: str = Query(...)):
+    user = get_current_user(email=email, senha=senha)
+    if user["perfil"] != "admin_geral" and user["empresa_id"] != empresa_id:
+        raise HTTPException(status_code=403, detail="Acesso negado.")
+    return [j.como_dict() for j in jobs.listar(empresa_id)]
+
+@app.get("/sincronismo/jobs/{job_id}")
+def status_job(job_id: str, email: str = Query(...), senha: str = Query(...)):
+    return obter_job_autorizado(job_id, email, senha).como_dict()
+
+@app.get("/sincronismo/jobs/{job_id}/eventos")
+def eventos_job(job_id: str, email: str = Query(...), senha: str = Query(...)):
+    """
+    Server-Sent Events com o progresso do job até ele terminar.
+    """
+    job = obter_job_autorizado(job_id, email, senha)
+
+    def gerar():
+        versao = -1
+        while True:
+            versao = job.aguardar_mudanca(versao)
+            estado = job.como_dict()
+            yield f"data: {json.dumps(estado)}\n\n"
+            if estado["status"] not in ("pendente", "executando"):
+                break
+
+    return StreamingResponse(gerar(), media_type="text/event-stream")
 
+# --- HISTÓRICO DAS SINCRONIZAÇÕES (sync_log) ---
+@app.get("/sincronismo/historico")
+def historico_sincronizacoes(
+    empresa_id: int = Query(...), email: str = Query(...), senha: str = Query(...),
+    ultimas: int = Query(ULTIMAS_EXECUCOES, ge=1, le=RETENCAO_EXECUCOES), tabela: Optional[str] = Query(None)
+):
+    """
+    Últimas execuções e, por tabela, p50/p95 de duração, leitura, gravação,
+    índices e latência de conexão, vazão e falhas nessas execuções.
+    """
+    user = get_current_user(email=email, senha=senha)
+    if user["perfil"] != "admin_geral" and user["empresa_id"] != empresa_id:
+        raise HTTPException(status_code=403, detail="Acesso negado.")
     with get_conn() as conn:
-        for tabela in tabelas_sincronizadas:
-            conn.execute(
-                """
-                INSERT OR REPLACE INTO tabelas_sincronizadas (empresa_id, nome_tabela, ultima_sincronizacao)
-                VALUES (?, ?, CURRENT_TIMESTAMP)
-                """,
-                (empresa_id, tabela)
-            )
-        conn.commit()
+        return historico(conn, empresa_id, ultimas, tabela)
+
+# --- AGENDADOR DE SINCRONIZAÇÃO (intervalo_sync / ultimo_sync) ---
+def listar_empresas_vencidas():
+    with get_conn() as conn:
+        rows = conn.execute("""
+            SELECT e.id FROM empresas e
+            WHERE e.tipo_banco = 'mysql'
+              AND COALESCE(e.intervalo_sync, 0) > 0
+              AND EXISTS (SELECT 1 FROM tabelas_sincronizadas t WHERE t.empresa_id = e.id)
+              AND (e.ultimo_sync IS NULL
+                   OR datetime(e.ultimo_sync, '+' || e.intervalo_sync || ' minutes') <= datetime('now'))
+        """).fetchall()
+    return [r[0] for r in rows]
+
+def sincronizar_empresa_agendada(empresa_id):
+    detalhes = executar_sincronizacao(empresa_id, origem="agendador")
+    aquecer_empresa(empresa_id, detalhes)
+    resumo = resumir(detalhes)
+    falhas = [d["tabela"] for d in detalhes if d["erro"]]
+    if falhas:
+        print(f"Agendador: empresa {empresa_id} sincronizada com falhas em {', '.join(falhas)}")
+    print(f"Agendador: empresa {empresa_id}: {resumo['copiadas']} copiadas, {resumo['puladas']} sem mudança "
+          f"(~{resumo['segundos_economizados']}s economizados)")
+
+agendador = AgendadorSincronismo(listar_empresas_vencidas, sincronizar_empresa_agendada)
+
+@app.on_event("startup")
+def iniciar_agendador():
+    if AGENDADOR_ATIVO:
+        agendador.iniciar()
+
+@app.on_event("shutdown")
+def parar_agendador():
+    agendador.parar()
+    jobs.encerrar()
+    pools_mysql.fechar_todos()
+
+@app.get("/sincronismo/agendador")
+def situacao_agendador(email: str = Query(...), senha: str = Query(...)):
+    user = get_current_user(email=email, senha=senha)
+    if user["perfil"] != "admin_geral":
+        raise HTTPException(status_code=403, detail="Acesso negado.")
+    return {"ativo": AGENDADOR_ATIVO, **agendador.situacao()}
+
+def colunas_mapeadas(empresa_id, tabela):
+    """
+    Colunas da tabela usadas nos mapeamentos de indicadores (de todos os usuários).
+    """
+    if not dados_da_empresa(empresa_id):
+        return set()
+    with get_conn(empresa_id) as conn:
+        mapeamentos = carregar_mapeamentos(conn)
+    return {
+        m[c] for m in mapeamentos if m["tabela"] == tabela
+        for c in ("coluna_valor", "coluna_data", "coluna_tipo", "coluna_filtro") if m[c]
+    }
+
+def colunas_em_centavos(empresa_id, tabela):
+    with get_conn() as conn:
+        row = conn.execute(
+            "SELECT colunas_centavos FROM tabelas_sincronizadas WHERE empresa_id = ? AND nome_tabela = ?",
+            (empresa_id, tabela)
+        ).fetchone()
+    return set(separar_colunas(row[0] if row else None))
+
+# --- CONFIGURAR MODO INCREMENTAL DE UMA TABELA ---
+@app.put("/sincronismo/tabelas/modo")
+def configurar_modo_sincronismo(body: dict = Body(...)):
+    empresa_id = body.get("empresa_id")
+    tabela = body.get("tabela")
+    modo = body.get("modo", "completo")
+    coluna_watermark = body.get("coluna_watermark")
+    chave_primaria = body.get("chave_primaria")
+    colunas_centavos = body.get("colunas_centavos")
+    email = body.get("email")
+    senha = body.get("senha")
+
+    user = get_current_user(email=email, senha=senha)
+    if user["perfil"] != "admin_geral" and user["empresa_id"] != empresa_id:
+        raise HTTPException(status_code=403, detail="Acesso negado.")
+    if modo not in ("completo", "incremental"):
+        raise HTTPException(status_code=400, detail="Modo deve ser 'completo' ou 'incremental'.")
+    if modo == "incremental" and not coluna_watermark:
+        raise HTTPException(status_code=400, detail="Modo incremental exige coluna_watermark.")
+
+    if modo == "incremental" and not chave_primaria:
+        # Tabelas com PRIMARY KEY no MySQL não precisam informar a chave
+        with get_conn() as conn:
+            empresa = conn.execute(
+                "SELECT tipo_banco, host, porta, usuario_banco, senha_banco, schema FROM empresas WHERE id=?",
+                (empresa_id,)
+            ).fetchone()
+        if not empresa:
+            raise HTTPException(status_code=404, detail="Empresa não encontrada.")
+        tipo_banco, host, porta, usuario_banco, senha_banco, schema = empresa
+        if tipo_banco == "mysql":
+            try:
+                with pools_mysql.conexao(empresa_id, host, porta, usuario_banco, senha_banco, schema) as conn_mysql:
+                    chave_primaria = ",".join(descobrir_chave_primaria(conn_mysql, tabela))
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Erro ao conectar MySQL: {str(e)}")
+    if isinstance(chave_primaria, list):
+        chave_primaria = ",".join(chave_primaria)
+    if isinstance(colunas_centavos, list):
+        colunas_centavos = ",".join(colunas_centavos)
+    # Os indicadores somam o valor gravado: uma coluna em centavos sairia 100 vezes maior
+    em_uso = sorted(set(separar_colunas(colunas_centavos)) & colunas_mapeadas(empresa_id, tabela))
+    if em_uso:
+        raise HTTPException(status_code=400, detail=f"Colunas usadas em indicadores não podem ser gravadas "
+                                                    f"em centavos: {', '.join(em_uso)}.")
 
-    return {"ok": True, "sincronizadas": tabelas_sincronizadas}
+    with get_conn_escrita() as conn:
+        # Mudar colunas_centavos muda o tipo gravado: zera o fingerprint para forçar nova cópia
+        conn.execute(
+            """
+            INSERT INTO tabelas_sincronizadas (empresa_id, nome_tabela, modo, coluna_watermark, chave_primaria,
+                                               colunas_centavos, ultimo_watermark)
+            VALUES (?, ?, ?, ?, ?, ?, NULL)
+            ON CONFLICT(empresa_id, nome_tabela) DO UPDATE SET
+                modo = excluded.modo,
+                coluna_watermark = excluded.coluna_watermark,
+                chave_primaria = excluded.chave_primaria,
+                colunas_centavos = excluded.colunas_centavos,
+                ultimo_watermark = NULL,
+                fingerprint = NULL
+            """,
+            (empresa_id, tabela, modo, coluna_watermark if modo == "incremental" else None, chave_primaria or None,
+             colunas_centavos or None)
+        )
+        conn.commit()
+    return {"ok": True, "tabela": tabela, "modo": modo, "chave_primaria": chave_primaria or None,
+            "colunas_centavos": colunas_centavos or None}
 
 # ===============================
 # === ENDPOINTS DE RELACIONAMENTOS ===
@@ -315,7 +793,7 @@ def adicionar_relacionamento(body: dict = Body(...)):
     user = get_current_user(email=email, senha=senha)
     if user["empresa_id"] != empresa_id and user["perfil"] != "admin_geral":
         raise HTTPException(status_code=403, detail="Acesso negado.")
-    with get_conn() as conn:
+    with get_conn_escrita() as conn:
         conn.execute(
             "INSERT OR REPLACE INTO relacionamentos "
             "(empresa_id, tabela_origem, coluna_origem, tabela_destino, coluna_destino, tipo_relacionamento) "
@@ -328,18 +806,222 @@ def adicionar_relacionamento(body: dict = Body(...)):
 @app.delete("/relacionamentos/{relacionamento_id}")
 def excluir_relacionamento(relacionamento_id: int, email: str = Query(...), senha: str = Query(...)):
     user = get_current_user(email=email, senha=senha)
-    with get_conn() as conn:
+    with get_conn_escrita() as conn:
         conn.execute("DELETE FROM relacionamentos WHERE id=?", (relacionamento_id,))
         conn.commit()
     return {"ok": True}
 
 # Utilidade: retornar colunas de uma tabela do SQLite
 @app.get("/tabelas/colunas")
-def listar_colunas(tabela: str = Query(...)):
-    with get_conn() as conn:
+def listar_colunas(tabela: str = Query(...), empresa_id: int = Query(...)):
+    with get_conn(empresa_id) as conn:
         cols = conn.execute(f"PRAGMA table_info({tabela})").fetchall()
     return [c[1] for c in cols]
 
+# Índices da base de dados da empresa, com tamanho (os "ixa_" são mantidos pelo assistente)
+@app.get("/tabelas/indices")
+def listar_indices_empresa(empresa_id: int = Query(...), email: str = Query(...), senha: str = Query(...)):
+    user = get_current_user(email=email, senha=senha)
+    if user["perfil"] != "admin_geral" and user["empresa_id"] != empresa_id:
+        raise HTTPException(status_code=403, detail="Acesso negado.")
+    with get_conn(empresa_id) as conn:
+        return listar_indices(conn)
+
+# --- INDICADORES ---
+RE_PERIODO = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+def empresa_do_usuario(user, usuario_id):
+    """
+    empresa_id do usuário dono dos indicadores, conferindo o acesso de quem pede.
+    """
+    if user["perfil"] != "admin_geral" and user["id"] != usuario_id:
+        raise HTTPException(status_code=403, detail="Acesso negado.")
+    with get_conn() as conn:
+        row = conn.execute("SELECT empresa_id FROM usuarios WHERE id = ?", (usuario_id,)).fetchone()
+    if not row:
+        raise HTTPException(status_code=404, detail="Usuário não encontrado.")
+    return row[0]
+
+def dados_da_empresa(empresa_id):
+    """
+    Caminho do arquivo de dados da empresa, ou None se ela ainda não sincronizou
+    (as leituras não devem criar um arquivo vazio).
+    """
+    caminho = caminho_dados_empresa(empresa_id)
+    return caminho if os.path.exists(caminho) else None
+
+def validar_periodo(periodo, nome="periodo"):
+    if periodo and not RE_PERIODO.match(periodo):
+        raise HTTPException(status_code=400, detail=f"Use {nome} no formato AAAA-MM.")
+    return periodo or time.strftime("%Y-%m")
+
+def indicadores_do_setor(setor, resultados):
+    """
+    Resultados de um setor: primeiro os indicadores básicos do setor, depois os
+    demais mapeados; básicos sem mapeamento voltam com valor None.
+    """
+    basicos = INDICADORES_POR_SETOR.get(setor, [])
+    nomes = basicos + [n for n in resultados if n not in basicos]
+    sem_mapeamento = {"valor": None, "erro": "Indicador sem mapeamento.", "fonte": None, "segundos": None}
+    return [{"nome": nome, **resultados.get(nome, sem_mapeamento)} for nome in nomes]
+
+@app.get("/indicadores")
+def indicadores_por_setor(
+    setor: str = Query(...), email: str = Query(...), senha: str = Query(...),
+    usuario_id: Optional[int] = Query(None), periodo: Optional[str] = Query(None)
+):
+    """
+    Indicadores de um ou mais setores (separados por vírgula) do usuário (padrão:
+    quem pede) no período, avaliados em paralelo no pool de leitura. Cada
+    indicador vem com valor, erro, fonte e segundos.
+    """
+    periodo = validar_periodo(periodo)
+    user = get_current_user(email=email, senha=senha)
+    usuario_id = usuario_id or user["id"]
+    empresa_id = empresa_do_usuario(user, usuario_id)
+    setores = separar_colunas(setor)
+    inicio = time.perf_counter()
+    caminho = dados_da_empresa(empresa_id)
+    resultados = {s: {} for s in setores}
+    if caminho:
+        resultados = avaliar_setores(caminho, usuario_id, {s: None for s in setores}, periodo, executor=pool_leitura())
+    por_setor = {s: indicadores_do_setor(s, resultados[s]) for s in setores}
+    return {
+        "usuario_id": usuario_id,
+        "periodo": periodo,
+        "segundos": round(time.perf_counter() - inicio, 4),
+        "setores": {
+            s: {"valores": {i["nome"]: i["valor"] for i in lista}, "indicadores": lista}
+            for s, lista in por_setor.items()
+        },
+    }
+
+@app.get("/indicadores/{usuario_id}/{setor}")
+def indicadores_do_usuario(
+    usuario_id: int, setor: str, email: str = Query(...), senha: str = Query(...),
+    periodo: Optional[str] = Query(None)
+):
+    """
+    Os indicadores de um setor do usuário, em uma chamada: lista com nome, valor,
+    erro, fonte e segundos de cada um.
+    """
+    periodo = validar_periodo(periodo)
+    empresa_id = empresa_do_usuario(get_current_user(email=email, senha=senha), usuario_id)
+    caminho = dados_da_empresa(empresa_id)
+    if not caminho:
+        return indicadores_do_setor(setor, {})
+    resultados = avaliar_setores(caminho, usuario_id, {setor: None}, periodo, executor=pool_leitura())
+    return indicadores_do_setor(setor, resultados[setor])
+
+@app.get("/indicadores/{usuario_id}/{setor}/series")
+def series_do_setor(
+    usuario_id: int, setor: str, email: str = Query(...), senha: str = Query(...),
+    indicadores: Optional[str] = Query(None), meses: int = Query(MESES_SERIE, ge=1, le=MAX_MESES_SERIE),
+    ate: Optional[str] = Query(None)
+):
+    """
+    Séries mensais (com MoM e YoY) dos indicadores do setor em uma chamada, para
+    os sparklines. indicadores: nomes separados por vírgula (padrão: todos os mapeados).
+    """
+    if ate:
+        validar_periodo(ate, "ate")
+    empresa_id = empresa_do_usuario(get_current_user(email=email, senha=senha), usuario_id)
+    nomes = separar_colunas(indicadores) or None
+    caminho = dados_da_empresa(empresa_id)
+    series = series_indicadores(caminho, usuario_id, setor, nomes, ate, meses) if caminho else {}
+    return {"setor": setor, "meses": meses, "ate": ate, "series": series}
+
+# --- MAPEAMENTO DOS INDICADORES (gravado no arquivo de dados da empresa) ---
+def preparar_mapeamentos(empresa_id, conn_sqlite):
+    """
+    Depois de mudar os mapeamentos, os mesmos passos da sincronização: chaves de
+    data, rollups, livros de saldo e índices dos indicadores já ficam prontos.
+    """
+    ajustar_chaves_data(empresa_id, conn_sqlite)
+    ajustar_rollups(empresa_id, conn_sqlite, [], [])
+    ajustar_indices(empresa_id, conn_sqlite)
+
+@app.get("/indicadores/{usuario_id}/{setor}/mapeamentos")
+def listar_mapeamentos(usuario_id: int, setor: str, email: str = Query(...), senha: str = Query(...)):
+    empresa_id = empresa_do_usuario(get_current_user(email=email, senha=senha), usuario_id)
+    caminho = dados_da_empresa(empresa_id)
+    if not caminho:
+        return []
+    with get_conn(empresa_id) as conn:
+        return list(mapeamentos_do_setor(conn, usuario_id, setor).values())
+
+@app.put("/indicadores/{usuario_id}/{setor}/mapeamentos")
+def salvar_mapeamento(usuario_id: int, setor: str, body: dict = Body(...)):
+    """
+    Cria ou substitui o mapeamento de um indicador do setor. Colunas da tabela
+    sincronizada; fórmula SQL própria só para admin_geral. valores_entrada e
+    valores_saida aceitam lista ou texto separado por vírgula.
+    """
+    user = get_current_user(email=body.get("email"), senha=body.get("senha"))
+    empresa_id = empresa_do_usuario(user, usuario_id)
+    mapeamento = {}
+    for campo in CAMPOS_MAPEAMENTO:
+        valor = body.get(campo)
+        if isinstance(valor, list):
+            valor = ",".join(str(v) for v in valor)
+        mapeamento[campo] = str(valor).strip() if valor not in (None, "") else None
+    if not mapeamento["indicador"]:
+        raise HTTPException(status_code=400, detail="Informe o indicador.")
+    if mapeamento["formula_sql"] and user["perfil"] != "admin_geral":
+        raise HTTPException(status_code=403, detail="Fórmula SQL só pode ser definida por admin_geral.")
+    caminho = dados_da_empresa(empresa_id)
+    if not mapeamento["formula_sql"]:
+        if not (mapeamento["tabela"] and mapeamento["coluna_valor"] and mapeamento["coluna_data"]):
+            raise HTTPException(status_code=400, detail="Informe tabela, coluna_valor e coluna_data.")
+        if not caminho:
+            raise HTTPException(status_code=400, detail="Sincronize a tabela antes de mapear o indicador.")
+        with get_conn(empresa_id) as conn:
+            colunas = set(colunas_locais(conn, mapeamento["tabela"])) if tabela_existe(conn, mapeamento["tabela"]) else None
+        if colunas is None:
+            raise HTTPException(status_code=400, detail=f"Tabela {mapeamento['tabela']} não sincronizada.")
+        faltando = [
+            mapeamento[c] for c in ("coluna_valor", "coluna_data", "coluna_tipo", "coluna_filtro")
+            if mapeamento[c] and mapeamento[c] not in colunas
+        ]
+        if faltando:
+            raise HTTPException(status_code=400, detail=f"Colunas inexistentes: {', '.join(faltando)}.")
+        em_centavos = sorted(
+            {mapeamento[c] for c in ("coluna_valor", "coluna_data", "coluna_tipo", "coluna_filtro") if mapeamento[c]}
+            & colunas_em_centavos(empresa_id, mapeamento["tabela"])
+        )
+        if em_centavos:
+            raise HTTPException(status_code=400, detail=f"Colunas gravadas em centavos não podem ser usadas "
+                                                        f"em indicadores: {', '.join(em_centavos)}.")
+    with get_conn_escrita(empresa_id) as conn:
+        garantir_tabela_mapeamentos(conn)
+        conn.execute(
+            "DELETE FROM indicador_mapeamento WHERE usuario_id = ? AND setor = ? AND indicador = ?",
+            (usuario_id, setor, mapeamento["indicador"])
+        )
+        conn.execute(
+            f"INSERT INTO indicador_mapeamento (usuario_id, setor, {', '.join(CAMPOS_MAPEAMENTO)}) "
+            f"VALUES (?, ?, {', '.join('?' for _ in CAMPOS_MAPEAMENTO)})",
+            (usuario_id, setor, *(mapeamento[c] for c in CAMPOS_MAPEAMENTO))
+        )
+        conn.commit()
+        preparar_mapeamentos(empresa_id, conn)
+    return {"ok": True, "mapeamento": mapeamento}
+
+@app.delete("/indicadores/{usuario_id}/{setor}/mapeamentos/{indicador}")
+def excluir_mapeamento(usuario_id: int, setor: str, indicador: str, email: str = Query(...), senha: str = Query(...)):
+    empresa_id = empresa_do_usuario(get_current_user(email=email, senha=senha), usuario_id)
+    if not dados_da_empresa(empresa_id):
+        return {"ok": True}
+    with get_conn_escrita(empresa_id) as conn:
+        garantir_tabela_mapeamentos(conn)
+        conn.execute(
+            "DELETE FROM indicador_mapeamento WHERE usuario_id = ? AND setor = ? AND indicador = ?",
+            (usuario_id, setor, indicador)
+        )
+        conn.commit()
+        preparar_mapeamentos(empresa_id, conn)
+    return {"ok": True}
+
 # Utilidade: listar tabelas sincronizadas para seleção de relacionamento
 @app.get("/tabelas/listar")
 def listar_tabelas_sync(empresa_id: int = Query(...)):
@@ -1,11 +1,20 @@
 import streamlit as st
 import sqlite3
 import os
+import threading
 import pandas as pd
 import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
+from app.indicadores import INDICADORES_POR_SETOR, aquecer, avaliar_indicadores, pool_leitura
 from app.query_handler import executar_pergunta
-from sync.sync_db import sync_mysql_to_sqlite, obter_lista_tabelas_views_remotas
+from sync.banco_local import escrever, ler
+from sync.colunar import remover_parquet
+from sync.datas import garantir_chaves_data
+from sync.indices import garantir_tabela_mapeamentos
+from sync.rollups import remover_rollups_da_tabela
+from sync.saldos import remover_saldos_da_tabela
+from sync.versao import incrementar_versao
+from sync.sync_db import sync_mysql_to_sqlite, obter_lista_tabelas_views_remotas, invalidar_conexao_remota
 
 DB_PATH = "data/database.db"
 os.makedirs("data", exist_ok=True)
@@ -16,28 +25,12 @@ st.set_page_config(page_title="IA KPI", layout="wide", initial_sidebar_state="ex
 #########################
 
 def garantir_tabela_indicador_mapeamento(path):
-    with sqlite3.connect(path) as conn:
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS indicador_mapeamento (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                usuario_id INTEGER,
-                setor TEXT,
-                indicador TEXT,
-                tabela TEXT,
-                coluna_valor TEXT,
-                coluna_data TEXT,
-                coluna_tipo TEXT,
-                valores_entrada TEXT,
-                valores_saida TEXT,
-                coluna_filtro TEXT,
-                valor_filtro TEXT,
-                formula_sql TEXT
-            )
-        ''')
+    with escrever(path) as conn:
+        garantir_tabela_mapeamentos(conn)
         conn.commit()
 
 def garantir_tabela_relacionamentos(path):
-    with sqlite3.connect(path) as conn:
+    with escrever(path) as conn:
         conn.execute('''
             CREATE TABLE IF NOT EXISTS relacionamentos (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -68,13 +61,13 @@ if "tabelas_marcadas" not in st.session_state:
     st.session_state["tabelas_marcadas"] = {}
 
 def autenticar(email, senha):
-    with sqlite3.connect(DB_PATH, timeout=10) as conn:
+    with ler(DB_PATH) as conn:
         c = conn.cursor()
         c.execute("SELECT * FROM usuarios WHERE email = ? AND senha = ?", (email, senha))
         return c.fetchone()
 
 def atualizar_usuario_campo(id_usuario, campo, valor):
-    with sqlite3.connect(DB_PATH, timeout=10) as conn:
+    with escrever(DB_PATH) as conn:
         c = conn.cursor()
         c.execute(f"UPDATE usuarios SET {campo} = ? WHERE id = ?", (valor, id_usuario))
         conn.commit()
@@ -84,8 +77,8 @@ def atualizar_usuario_campo(id_usuario, campo, valor):
 ###############################
 
 def detectar_relacionamentos_automaticos(sqlite_path):
-    with sqlite3.connect(sqlite_path) as conn:
-        tabelas = pd.read_sql("SELECT name FROM sqlite_master WHERE type='table'", conn)["name"].tolist()
+    with ler(sqlite_path) as conn:
+        tabelas = pd.read_sql("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE '\\_stg\\_%' ESCAPE '\\' AND name NOT LIKE '\\_sync\\_%' ESCAPE '\\'", conn)["name"].tolist()
         sugestoes = []
         for i, tabela1 in enumerate(tabelas):
             colunas1 = pd.read_sql(f"PRAGMA table_info({tabela1})", conn)[["name", "type"]]
@@ -113,7 +106,7 @@ def aprovar_relacionamentos(sqlite_path):
     garantir_tabela_relacionamentos(sqlite_path)
     st.subheader("Relacionamentos sugeridos entre tabelas")
     sugestoes = detectar_relacionamentos_automaticos(sqlite_path)
-    with sqlite3.connect(sqlite_path) as conn:
+    with ler(sqlite_path) as conn:
         existentes = pd.read_sql("SELECT * FROM relacionamentos WHERE ativo=1", conn)
     for i, s in enumerate(sugestoes):
         ja_existe = (
@@ -130,7 +123,7 @@ def aprovar_relacionamentos(sqlite_path):
             tipo = st.selectbox("Tipo do relacionamento", ["1:1", "1:N", "N:1", "N:N"], index=3, key=f"tipo_rel_{i}")
             aprovar = st.form_submit_button("Aprovar relacionamento")
             if aprovar:
-                with sqlite3.connect(sqlite_path) as conn:
+                with escrever(sqlite_path) as conn:
                     conn.execute('''
                         INSERT INTO relacionamentos (tabela_origem, coluna_origem, tabela_destino, coluna_destino, tipo_relacionamento, ativo)
                         VALUES (?, ?, ?, ?, ?, 1)
@@ -140,7 +133,7 @@ def aprovar_relacionamentos(sqlite_path):
                 st.rerun()
 
 def montar_relacionamentos_prompt(sqlite_path):
-    with sqlite3.connect(sqlite_path) as conn:
+    with ler(sqlite_path) as conn:
         rels = pd.read_sql("SELECT * FROM relacionamentos WHERE ativo=1", conn)
     if rels.empty:
         return ""
@@ -156,13 +149,13 @@ def montar_relacionamentos_prompt(sqlite_path):
 def wizard_mapeamento_indicadores(usuario_id, setor, indicador, sqlite_path, DB_PATH):
     garantir_tabela_indicador_mapeamento(sqlite_path)
     st.info(f"Configuração do indicador: {setor} - {indicador}")
-    with sqlite3.connect(sqlite_path) as conn:
-        tabelas = pd.read_sql("SELECT name FROM sqlite_master WHERE type='table'", conn)["name"].tolist()
+    with ler(sqlite_path) as conn:
+        tabelas = pd.read_sql("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE '\\_stg\\_%' ESCAPE '\\' AND name NOT LIKE '\\_sync\\_%' ESCAPE '\\'", conn)["name"].tolist()
     tabela = st.selectbox("Tabela:", tabelas, key=f"tb_{setor}_{indicador}")
 
     colunas = []
     if tabela:
-        with sqlite3.connect(sqlite_path) as conn:
+        with ler(sqlite_path) as conn:
             colunas = pd.read_sql(f"PRAGMA table_info({tabela})", conn)["name"].tolist()
 
     coluna_valor = st.selectbox("Coluna de valor:", colunas, key=f"col_val_{setor}_{indicador}")
@@ -193,7 +186,7 @@ def wizard_mapeamento_indicadores(usuario_id, setor, indicador, sqlite_path, DB_
 
     if st.button("Salvar indicador", key=f"save_{setor}_{indicador}"):
         garantir_tabela_indicador_mapeamento(sqlite_path)
-        with sqlite3.connect(sqlite_path) as conn:
+        with escrever(sqlite_path) as conn:
             conn.execute(
                 "INSERT INTO indicador_mapeamento (usuario_id, setor, indicador, tabela, coluna_valor, coluna_data, coluna_tipo, valores_entrada, valores_saida, coluna_filtro, valor_filtro, formula_sql) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
                 (usuario_id, setor, indicador, tabela, coluna_valor, coluna_data,
@@ -203,78 +196,55 @@ def wizard_mapeamento_indicadores(usuario_id, setor, indicador, sqlite_path, DB_
                  formula_sql)
             )
             conn.commit()
+            # Chave de mês já disponível para as consultas; o índice vem na próxima sincronização
+            garantir_chaves_data(conn, [{"tabela": tabela, "coluna_data": coluna_data}])
         st.success("Indicador configurado!")
         st.rerun()
 
+def mostrar_wizard_sem_mapeamento(usuario_id, setor, indicador, sqlite_path, DB_PATH):
+    st.warning(f"Mapeamento não encontrado para {setor} - {indicador}. Preencha o mapeamento abaixo para continuar.")
+    st.markdown("---")
+    wizard_mapeamento_indicadores(usuario_id, setor, indicador, sqlite_path, DB_PATH)
+    st.stop()
+
 def carregar_indicador_configurado(usuario_id, setor, indicador, periodo, sqlite_path, DB_PATH):
     garantir_tabela_indicador_mapeamento(sqlite_path)
-    with sqlite3.connect(sqlite_path) as conn:
-        row = conn.execute(
-            "SELECT tabela, coluna_valor, coluna_data, coluna_tipo, valores_entrada, valores_saida, coluna_filtro, valor_filtro, formula_sql FROM indicador_mapeamento WHERE usuario_id=? AND setor=? AND indicador=?",
-            (usuario_id, setor, indicador)
-        ).fetchone()
-    if not row:
-        st.warning(f"Mapeamento não encontrado para {setor} - {indicador}. Preencha o mapeamento abaixo para continuar.")
-        st.markdown("---")
-        wizard_mapeamento_indicadores(usuario_id, setor, indicador, sqlite_path, DB_PATH)
-        st.stop()
+    resultado = avaliar_indicadores(sqlite_path, usuario_id, setor, [indicador], periodo).get(indicador)
+    if resultado is None:
+        mostrar_wizard_sem_mapeamento(usuario_id, setor, indicador, sqlite_path, DB_PATH)
         return "-"
-    tabela, col_valor, col_data, col_tipo, vals_entrada, vals_saida, col_filtro, val_filtro, formula_sql = row
-    if formula_sql:
-        sql = formula_sql
-    elif indicador == "Saldo em Caixa":
-        condicoes = [f"strftime('%Y-%m', {col_data}) <= '{periodo}'"]
-        if col_filtro and val_filtro:
-            condicoes.append(f"{col_filtro} = '{val_filtro}'")
-        entrada_list = [v.strip() for v in (vals_entrada or "").split(",") if v.strip()]
-        saida_list = [v.strip() for v in (vals_saida or "").split(",") if v.strip()]
-        cases = []
-        if entrada_list:
-            entries = ", ".join([f"'{v}'" for v in entrada_list])
-            cases.append(f"WHEN {col_tipo} IN ({entries}) THEN {col_valor}")
-        if saida_list:
-            exits = ", ".join([f"'{v}'" for v in saida_list])
-            cases.append(f"WHEN {col_tipo} IN ({exits}) THEN -1*{col_valor}")
-        cases.append("ELSE 0")
-        sql = f"""
-            SELECT SUM(CASE
-                {' '.join(cases)}
-            END) as saldo
-            FROM {tabela}
-            WHERE {' AND '.join(condicoes)}
-        """
-    else:
-        condicoes = [f"strftime('%Y-%m', {col_data}) = '{periodo}'"]
-        if col_tipo and vals_entrada:
-            entradas = ", ".join([f"'{v.strip()}'" for v in vals_entrada.split(",") if v.strip()])
-            condicoes.append(f"{col_tipo} IN ({entradas})")
-        if col_filtro and val_filtro:
-            condicoes.append(f"{col_filtro} = '{val_filtro}'")
-        sql = f"SELECT SUM({col_valor}) FROM {tabela} WHERE {' AND '.join(condicoes)}"
-    try:
-        with sqlite3.connect(sqlite_path) as conn:
-            df = pd.read_sql(sql, conn)
-            if not df.empty:
-                return df.iloc[0, 0] or 0
-            return 0
-    except Exception as e:
-        st.error(f"Erro ao buscar indicador: {e}")
+    if resultado["erro"]:
+        st.error(f"Erro ao buscar indicador: {resultado['erro']}")
         return "-"
+    return resultado["valor"]
 
 def exibir_indicadores_basicos(usuario_id, setor, indicadores, sqlite_path, DB_PATH):
     garantir_tabela_indicador_mapeamento(sqlite_path)
     periodo = datetime.now().strftime('%Y-%m')
+    # Todos os indicadores do setor de uma vez: uma varredura por tabela de origem, em paralelo
+    resultados = avaliar_indicadores(sqlite_path, usuario_id, setor, indicadores, periodo, executor=pool_leitura())
     colunas = st.columns(len(indicadores))
     for i, indicador in enumerate(indicadores):
-        valor = carregar_indicador_configurado(usuario_id, setor, indicador, periodo, sqlite_path, DB_PATH)
+        resultado = resultados.get(indicador)
+        if resultado is None:
+            mostrar_wizard_sem_mapeamento(usuario_id, setor, indicador, sqlite_path, DB_PATH)
+        if resultado["erro"]:
+            st.error(f"Erro ao buscar indicador: {resultado['erro']}")
+            valor = "-"
+        else:
+            valor = resultado["valor"]
         colunas[i].metric(indicador, valor)
 
 def excluir_tabelas_sqlite(sqlite_path, tabelas_excluir):
     try:
-        with sqlite3.connect(sqlite_path, timeout=10) as conn:
+        with escrever(sqlite_path) as conn:
             c = conn.cursor()
             for tabela in tabelas_excluir:
                 c.execute(f"DROP TABLE IF EXISTS `{tabela}`")
+                remover_rollups_da_tabela(conn, tabela)
+                remover_saldos_da_tabela(conn, tabela)
+                remover_parquet(sqlite_path, tabela)
+            incrementar_versao(conn)
             conn.commit()
         st.success(f"Tabela(s) excluída(s) com sucesso: {', '.join(tabelas_excluir)}")
     except Exception as e:
@@ -302,8 +272,8 @@ if st.session_state.get("logado"):
         st.subheader("Excluir tabelas locais:")
         sqlite_path = st.session_state.get("sqlite_path", None)
         if sqlite_path and os.path.exists(sqlite_path):
-            with sqlite3.connect(sqlite_path) as conn:
-                tabelas = pd.read_sql("SELECT name FROM sqlite_master WHERE type='table'", conn)["name"].tolist()
+            with ler(sqlite_path) as conn:
+                tabelas = pd.read_sql("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE '\\_stg\\_%' ESCAPE '\\' AND name NOT LIKE '\\_sync\\_%' ESCAPE '\\'", conn)["name"].tolist()
             if tabelas:
                 tabelas_excluir = []
                 for tb in tabelas:
@@ -370,7 +340,7 @@ elif st.session_state["pagina"] == "cadastro" and not st.session_state["logado"]
             if not (nome and email and senha):
                 st.error("Preencha todos os campos.")
             else:
-                with sqlite3.connect(DB_PATH, timeout=10) as conn:
+                with escrever(DB_PATH) as conn:
                     c = conn.cursor()
                     try:
                         c.execute(
@@ -407,13 +377,14 @@ elif st.session_state.get("pagina") == "conexao":
         intervalo_sync = st.selectbox("Intervalo de sincronização (min):", [5,10,15,30,60,120,240,1440], index=4)
         submitted = st.form_submit_button("Salvar conexão")
         if submitted:
-            with sqlite3.connect(DB_PATH, timeout=10) as conn:
+            with escrever(DB_PATH) as conn:
                 c = conn.cursor()
                 c.execute(
                     "UPDATE usuarios SET host = ?, porta = ?, usuario_banco = ?, senha_banco = ?, schema = ?, intervalo_sync = ? WHERE id = ?",
                     (host, porta, usuario_banco, senha_banco, schema, intervalo_sync, usuario["id"])
                 )
                 conn.commit()
+            invalidar_conexao_remota(host, porta, schema)
             st.session_state["usuario"].update({
                 "host": host,
                 "porta": porta,
@@ -440,8 +411,9 @@ elif st.session_state.get("pagina") == "dashboard_sync":
     usuario = st.session_state["usuario"]
     id_usuario = usuario["id"]
     sqlite_path = st.session_state["sqlite_path"]
-    tabelas_disponiveis = obter_lista_tabelas_views_remotas()
     st.title("Sincronizar tabelas/views do banco")
+    atualizar_lista = st.button("🔄 Recarregar lista do servidor")
+    tabelas_disponiveis = obter_lista_tabelas_views_remotas(atualizar=atualizar_lista)
     if not st.session_state["tabelas_marcadas"] or set(st.session_state["tabelas_marcadas"].keys()) != set(tabelas_disponiveis):
         st.session_state["tabelas_marcadas"] = {tb: False for tb in tabelas_disponiveis}
     col1, col2 = st.columns([1,1])
@@ -465,6 +437,9 @@ elif st.session_state.get("pagina") == "dashboard_sync":
         if st.button("Confirmar e sincronizar"):
             if tabelas_sync:
                 sync_mysql_to_sqlite(tabelas_sync)
+                # Em segundo plano: o dashboard abre já, sem esperar o aquecimento
+                threading.Thread(target=aquecer, args=(st.session_state["sqlite_path"],),
+                                 name="aquecer", daemon=True).start()
                 novo_sync = datetime.now().isoformat()
                 atualizar_usuario_campo(id_usuario, "ultimo_sync", novo_sync)
                 st.session_state["usuario"]["ultimo_sync"] = novo_sync
@@ -496,11 +471,7 @@ elif st.session_state.get("logado") and st.session_state.get("pagina") == "dashb
     if st.button("🔄 Sincronizar agora"):
         st.session_state["pagina"] = "dashboard_sync"
         st.rerun()
-    setores = {
-        "Financeiro": ["Receitas do mês", "Despesas do mês", "Saldo em Caixa"],
-        "Comercial": ["Vendas no mês", "Clientes Ativos", "Novos Leads"],
-        "Produção": ["Produção do mês", "Modelos produzidos", "Mais produzido"]
-    }
+    setores = INDICADORES_POR_SETOR
     if "setor_ativo" not in st.session_state:
         st.session_state["setor_ativo"] = list(setores.keys())[0]
     cols = st.columns(len(setores))
@@ -3,14 +3,47 @@ import axios from "axios";
 
 const SETORES = ["Financeiro", "Comercial", "Produção"];
 
+function Sparkline({ pontos, largura = 120, altura = 28 }) {
+  const valores = (pontos || []).map(p => p.valor || 0);
+  if (valores.length < 2) return null;
+  const min = Math.min(...valores);
+  const faixa = Math.max(...valores) - min || 1;
+  const passo = largura / (valores.length - 1);
+  const linha = valores
+    .map((v, i) => `${(i * passo).toFixed(1)},${(altura - ((v - min) / faixa) * altura).toFixed(1)}`)
+    .join(" ");
+  return (
+    <svg width={largura} height={altura}>
+      <polyline points={linha} fill="none" stroke="#0a7" strokeWidth="1.5" />
+    </svg>
+  );
+}
+
+function variacao(ponto) {
+  if (!ponto || ponto.mom_pct === null || ponto.mom_pct === undefined) return "";
+  return `${ponto.mom_pct > 0 ? "+" : ""}${ponto.mom_pct.toFixed(1)}% m/m`;
+}
+
 function Indicators() {
   const usuario = JSON.parse(localStorage.getItem("usuario") || "{}");
   const [setor, setSetor] = useState(SETORES[0]);
   const [indicadores, setIndicadores] = useState([]);
+  const [series, setSeries] = useState({});
 
   useEffect(() => {
-    axios.get(`http://localhost:8000/indicadores/${usuario.id}/${setor}`).then(r => setIndicadores(r.data));
-  }, [setor, usuario.id]);
+    const credenciais = { email: usuario.email, senha: usuario.senha };
+    axios
+      .get(`http://localhost:8000/indicadores/${usuario.id}/${setor}`, { params: credenciais })
+      .then(r => setIndicadores(r.data))
+      .catch(() => setIndicadores([]));
+    // Todas as séries do setor numa única chamada
+    axios
+      .get(`http://localhost:8000/indicadores/${usuario.id}/${setor}/series`, {
+        params: { ...credenciais, meses: 12 },
+      })
+      .then(r => setSeries(r.data.series || {}))
+      .catch(() => setSeries({}));
+  }, [setor, usuario.id, usuario.email, usuario.senha]);
 
   return (
     <div style={{ maxWidth: 800, margin: "0 auto" }}>
@@ -24,14 +57,19 @@ function Indicators() {
         <thead>
           <tr>
             <th>Nome</th>
-            <th>Valor/Mapeamento</th>
+            <th>Valor</th>
+            <th>Últimos 12 meses</th>
           </tr>
         </thead>
         <tbody>
           {indicadores.map(ind => (
-            <tr key={ind.id}>
+            <tr key={ind.nome}>
               <td>{ind.nome}</td>
-              <td>{ind.mapeamento}</td>
+              <td title={ind.erro || ""}>{ind.valor ?? "--"}</td>
+              <td>
+                <Sparkline pontos={series[ind.nome]?.pontos} />
+                <small style={{ marginLeft: 8 }}>{variacao(series[ind.nome]?.pontos?.slice(-1)[0])}</small>
+              </td>
             </tr>
           ))}
         </tbody>
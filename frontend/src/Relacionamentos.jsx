@@ -45,7 +45,7 @@ export default function Relacionamentos({ user }) {
   // Carregar colunas ao escolher tabela
   useEffect(() => {
     if (form.tabela_origem)
-      api.get('/tabelas/colunas', { params: { tabela: form.tabela_origem } })
+      api.get('/tabelas/colunas', { params: { tabela: form.tabela_origem, empresa_id: user.empresa_id } })
         .then(res => setColunasOrigem(res.data || []));
     else
       setColunasOrigem([]);
@@ -53,7 +53,7 @@ export default function Relacionamentos({ user }) {
   }, [form.tabela_origem]);
   useEffect(() => {
     if (form.tabela_destino)
-      api.get('/tabelas/colunas', { params: { tabela: form.tabela_destino } })
+      api.get('/tabelas/colunas', { params: { tabela: form.tabela_destino, empresa_id: user.empresa_id } })
         .then(res => setColunasDestino(res.data || []));
     else
       setColunasDestino([]);
@@ -12,17 +12,19 @@ export default function SincronizarTabelas({ user, onLogout }) {
   const [selSync, setSelSync] = useState([]);
   const [selNovas, setSelNovas] = useState([]);
   const [loading, setLoading] = useState(false);
+  const [progresso, setProgresso] = useState('');
   const [msg, setMsg] = useState({ open: false, text: '', severity: 'success' });
   const navigate = useNavigate();
 
-  // Carrega listas
-  const fetchTabelas = () => {
+  // Carrega listas (atualizar=true relê o catálogo no servidor do cliente)
+  const fetchTabelas = (atualizar = false) => {
     setLoading(true);
     api.get(`/sincronismo/tabelas`, {
       params: {
         empresa_id: user.empresa_id,
         email: user.email,
-        senha: user.senha
+        senha: user.senha,
+        atualizar
       }
     }).then(res => {
       setSincronizadas(res.data.sincronizadas || []);
@@ -34,7 +36,7 @@ export default function SincronizarTabelas({ user, onLogout }) {
     }).finally(() => setLoading(false));
   };
 
-  useEffect(fetchTabelas, [user.empresa_id]);
+  useEffect(() => fetchTabelas(), [user.empresa_id]);
 
   // Selecionar tudo/desmarcar
   const toggleAllSync = () =>
@@ -57,6 +59,53 @@ export default function SincronizarTabelas({ user, onLogout }) {
         : [...prev, tabela]
     );
 
+  // Acompanha o job de sincronização até terminar
+  const acompanharJob = (jobId, textoOk) => {
+    const consultar = () => {
+      api.get(`/sincronismo/jobs/${jobId}`, {
+        params: { email: user.email, senha: user.senha }
+      }).then(res => {
+        const { status, tabelas } = res.data;
+        if (status === 'pendente' || status === 'executando') {
+          const lista = Object.values(tabelas);
+          const concluidas = lista.filter(t => t.status === 'concluida' || t.status === 'sem_mudanca').length;
+          const linhas = lista.reduce((soma, t) => soma + (t.linhas || 0), 0);
+          setProgresso(`${concluidas}/${lista.length} tabelas, ${linhas} linhas copiadas...`);
+          setTimeout(consultar, 1500);
+          return;
+        }
+        setLoading(false);
+        setProgresso('');
+        fetchTabelas();
+        if (status === 'concluido') {
+          const { puladas, segundos_economizados } = res.data.resumo || {};
+          const texto = puladas ? `${textoOk} ${puladas} tabela(s) sem mudança puladas (~${Math.round(segundos_economizados)}s economizados).` : textoOk;
+          setMsg({ open: true, text: texto, severity: 'success' });
+        } else if (status === 'concluido_com_falhas') {
+          const falhas = Object.keys(tabelas).filter(t => tabelas[t].status === 'falhou');
+          setMsg({ open: true, text: `Concluído com falhas: ${falhas.join(', ')}`, severity: 'warning' });
+        } else {
+          setMsg({ open: true, text: "Erro ao sincronizar.", severity: 'error' });
+        }
+      }).catch(() => {
+        setLoading(false);
+        setProgresso('');
+        setMsg({ open: true, text: "Erro ao consultar o andamento.", severity: 'error' });
+      });
+    };
+    consultar();
+  };
+
+  const falhaAoIniciar = err => {
+    setLoading(false);
+    const emAndamento = err.response && err.response.status === 409;
+    setMsg({
+      open: true,
+      text: emAndamento ? "Já existe uma sincronização em andamento para estas tabelas." : "Erro ao sincronizar.",
+      severity: emAndamento ? 'warning' : 'error'
+    });
+  };
+
   // Sincronizar/atualizar
   const atualizar = () => {
     if (!selSync.length) return setMsg({ open: true, text: "Selecione ao menos uma tabela sincronizada!", severity: 'warning' });
@@ -67,12 +116,8 @@ export default function SincronizarTabelas({ user, onLogout }) {
       email: user.email,
       senha: user.senha
     })
-      .then(() => {
-        fetchTabelas();
-        setMsg({ open: true, text: "Atualizado com sucesso!", severity: 'success' });
-      })
-      .catch(() => setMsg({ open: true, text: "Erro ao atualizar.", severity: 'error' }))
-      .finally(() => setLoading(false));
+      .then(res => acompanharJob(res.data.job_id, "Atualizado com sucesso!"))
+      .catch(falhaAoIniciar);
   };
   const atualizarTodas = () => {
     if (!sincronizadas.length) return setMsg({ open: true, text: "Não há tabelas sincronizadas!", severity: 'warning' });
@@ -83,12 +128,8 @@ export default function SincronizarTabelas({ user, onLogout }) {
       email: user.email,
       senha: user.senha
     })
-      .then(() => {
-        fetchTabelas();
-        setMsg({ open: true, text: "Todas atualizadas!", severity: 'success' });
-      })
-      .catch(() => setMsg({ open: true, text: "Erro ao atualizar.", severity: 'error' }))
-      .finally(() => setLoading(false));
+      .then(res => acompanharJob(res.data.job_id, "Todas atualizadas!"))
+      .catch(falhaAoIniciar);
   };
   const sincronizarNovas = () => {
     if (!selNovas.length) return setMsg({ open: true, text: "Selecione ao menos uma nova tabela!", severity: 'warning' });
@@ -99,12 +140,8 @@ export default function SincronizarTabelas({ user, onLogout }) {
       email: user.email,
       senha: user.senha
     })
-      .then(() => {
-        fetchTabelas();
-        setMsg({ open: true, text: "Sincronizado com sucesso!", severity: 'success' });
-      })
-      .catch(() => setMsg({ open: true, text: "Erro ao sincronizar.", severity: 'error' }))
-      .finally(() => setLoading(false));
+      .then(res => acompanharJob(res.data.job_id, "Sincronizado com sucesso!"))
+      .catch(falhaAoIniciar);
   };
 
   return (
@@ -119,9 +156,15 @@ export default function SincronizarTabelas({ user, onLogout }) {
       }}
     >
       <Stack direction="row" spacing={2} mb={4} alignItems="center" width="100%" maxWidth={900} justifyContent="flex-end">
+        <Button variant="text" color="primary" onClick={() => fetchTabelas(true)} disabled={loading}>
+          Recarregar do servidor
+        </Button>
         <Button variant="text" color="primary" onClick={() => navigate("/dashboard")}>Voltar ao Dashboard</Button>
         <Button variant="text" color="secondary" onClick={onLogout}>Sair</Button>
       </Stack>
+      {progresso && (
+        <Typography color="text.secondary" mb={2}>{progresso}</Typography>
+      )}
       <Stack direction={{ xs: 'column', md: 'row' }} spacing={4} width="100%" maxWidth={900}>
         {/* Tabelas Sincronizadas */}
         <Card sx={{ flex: 1, minWidth: 300 }}>
@@ -24,9 +24,12 @@ export default function IndicadoresSetor({ setor }) {
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
+    const user = JSON.parse(localStorage.getItem("user") || "{}");
     setLoading(true);
-    api.get(`/indicadores?setor=${encodeURIComponent(setor)}`)
-      .then(res => setDados(res.data))
+    // Todos os cards do setor numa única chamada
+    api.get("/indicadores", { params: { setor, email: user.email, senha: user.senha } })
+      .then(res => setDados(res.data.setores[setor]?.valores || {}))
+      .catch(() => setDados({}))
       .finally(() => setLoading(false));
   }, [setor]);
 
@@ -0,0 +1,103 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Segundos entre verificações de sincronizações vencidas
+INTERVALO_VERIFICACAO = 30
+# Atraso aleatório máximo antes de iniciar uma sincronização vencida
+JITTER_SEGUNDOS = 60
+# Sincronizações agendadas rodando ao mesmo tempo (todas as empresas)
+MAX_CONCORRENTES = 2
+# Espera antes de tentar de novo uma empresa cuja sincronização falhou
+ESPERA_APOS_FALHA = 300
+
+
+class AgendadorSincronismo:
+    """
+    Roda em segundo plano as sincronizações vencidas de cada empresa.
+
+    listar_vencidas() devolve os ids das empresas com sincronização vencida
+    (intervalo_sync/ultimo_sync); executar(empresa_id) faz a sincronização.
+    Cada empresa vencida recebe um atraso aleatório (jitter), nunca roda duas
+    vezes ao mesmo tempo e o total de execuções simultâneas é limitado.
+    """
+
+    def __init__(self, listar_vencidas, executar, intervalo_verificacao=INTERVALO_VERIFICACAO,
+                 jitter_segundos=JITTER_SEGUNDOS, max_concorrentes=MAX_CONCORRENTES,
+                 espera_apos_falha=ESPERA_APOS_FALHA):
+        self.listar_vencidas = listar_vencidas
+        self.executar = executar
+        self.intervalo_verificacao = intervalo_verificacao
+        self.jitter_segundos = jitter_segundos
+        self.max_concorrentes = max_concorrentes
+        self.espera_apos_falha = espera_apos_falha
+        self._parar = threading.Event()
+        self._lock = threading.Lock()
+        self._agendadas = {}      # empresa_id -> instante (monotonic) para iniciar
+        self._em_execucao = set()
+        self._adiadas = {}        # empresa_id -> instante até quando não tentar de novo
+        self._thread = None
+        self._executor = None
+
+    def iniciar(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._parar.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concorrentes, thread_name_prefix="sync-agendado")
+        self._thread = threading.Thread(target=self._loop, name="agendador-sincronismo", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        if self._executor:
+            self._executor.shutdown(wait=False)
+
+    def situacao(self):
+        with self._lock:
+            return {
+                "em_execucao": sorted(self._em_execucao),
+                "agendadas": sorted(self._agendadas),
+                "adiadas": sorted(self._adiadas),
+            }
+
+    def _loop(self):
+        while not self._parar.is_set():
+            try:
+                self._verificar()
+            except Exception as e:
+                print(f"Agendador: erro ao verificar sincronizações vencidas: {e}")
+            self._parar.wait(self.intervalo_verificacao)
+
+    def _verificar(self):
+        agora = time.monotonic()
+        vencidas = self.listar_vencidas()
+        with self._lock:
+            for empresa_id in vencidas:
+                if empresa_id in self._em_execucao or empresa_id in self._agendadas:
+                    continue
+                if self._adiadas.get(empresa_id, 0) > agora:
+                    continue
+                self._adiadas.pop(empresa_id, None)
+                self._agendadas[empresa_id] = agora + random.uniform(0, self.jitter_segundos)
+            prontas = sorted(
+                (quando, empresa_id) for empresa_id, quando in self._agendadas.items() if quando <= agora
+            )
+            vagas = self.max_concorrentes - len(self._em_execucao)
+            for _, empresa_id in prontas[:max(0, vagas)]:
+                del self._agendadas[empresa_id]
+                self._em_execucao.add(empresa_id)
+                self._executor.submit(self._rodar, empresa_id)
+
+    def _rodar(self, empresa_id):
+        try:
+            self.executar(empresa_id)
+        except Exception as e:
+            print(f"Agendador: falha ao sincronizar empresa {empresa_id}: {e}")
+            with self._lock:
+                self._adiadas[empresa_id] = time.monotonic() + self.espera_apos_falha
+        finally:
+            with self._lock:
+                self._em_execucao.discard(empresa_id)
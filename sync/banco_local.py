@@ -0,0 +1,103 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Ajustes aplicados a toda conexão SQLite aberta pelo gerenciador
+CONFIG_SQLITE = {
+    "journal_mode": "WAL",          # leitores não bloqueiam o gravador (nem o contrário)
+    "synchronous": "NORMAL",        # seguro com WAL; só a última transação pode se perder numa queda de energia
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,       # negativo = KiB (64 MB por conexão)
+    "temp_store": "MEMORY",
+    "busy_timeout": 30000,          # ms esperando o lock antes de "database is locked"
+}
+
+
+def configurar_conexao(conn, config=None):
+    config = {**CONFIG_SQLITE, **(config or {})}
+    for pragma in ("journal_mode", "synchronous", "mmap_size", "cache_size", "temp_store", "busy_timeout"):
+        valor = config.get(pragma)
+        if valor is not None:
+            conn.execute(f"PRAGMA {pragma} = {valor}")
+    return conn
+
+
+class GerenciadorSQLite:
+    """
+    Conexões ajustadas para um arquivo SQLite: uma conexão de leitura reaproveitada
+    por thread e um único gravador compartilhado, usado por uma thread de cada vez.
+    """
+
+    def __init__(self, caminho, **config):
+        self.caminho = caminho
+        self.config = {**CONFIG_SQLITE, **config}
+        self._local = threading.local()
+        self._lock_escrita = threading.RLock()
+        self._gravador = None
+
+    def conectar(self, check_same_thread=True):
+        """
+        Conexão nova e exclusiva de quem chamou (ex.: a thread gravadora de uma sincronização).
+        """
+        timeout = (self.config.get("busy_timeout") or 5000) / 1000
+        conn = sqlite3.connect(self.caminho, timeout=timeout, check_same_thread=check_same_thread)
+        return configurar_conexao(conn, self.config)
+
+    @contextmanager
+    def leitura(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self.conectar()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+
+    @contextmanager
+    def escrita(self):
+        """
+        Empresta o gravador compartilhado; commit ao sair, rollback se houver erro.
+        """
+        with self._lock_escrita:
+            if self._gravador is None:
+                self._gravador = self.conectar(check_same_thread=False)
+            conn = self._gravador
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    def fechar(self):
+        with self._lock_escrita:
+            if self._gravador is not None:
+                self._gravador.close()
+                self._gravador = None
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+_gerenciadores = {}
+_lock_gerenciadores = threading.Lock()
+
+
+def gerenciador(caminho, **config):
+    """
+    Gerenciador compartilhado do arquivo (um por caminho no processo).
+    """
+    with _lock_gerenciadores:
+        if caminho not in _gerenciadores:
+            _gerenciadores[caminho] = GerenciadorSQLite(caminho, **config)
+        return _gerenciadores[caminho]
+
+
+def ler(caminho):
+    return gerenciador(caminho).leitura()
+
+
+def escrever(caminho):
+    return gerenciador(caminho).escrita()
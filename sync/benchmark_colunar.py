@@ -0,0 +1,118 @@
+"""
+Compara SQLite e DuckDB/Parquet nas consultas padrão dos KPIs.
+
+    python -m sync.benchmark_colunar --linhas 2000000
+    python -m sync.benchmark_colunar --sqlite data/cliente_1.db --tabela notas \\
+        --valor valor_total --data data_emissao --tipo tipo --valores-tipo VENDA
+
+Sem --sqlite gera uma tabela sintética de movimentos em um arquivo temporário.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+from sync import colunar
+from sync.banco_local import configurar_conexao
+
+
+def gerar_movimentos(caminho, linhas):
+    conn = configurar_conexao(sqlite3.connect(caminho))
+    conn.execute("DROP TABLE IF EXISTS movimentos")
+    conn.execute("CREATE TABLE movimentos (id INTEGER PRIMARY KEY, data DATE, tipo TEXT, conta TEXT, valor REAL)")
+    inicio = date(2020, 1, 1)
+    aleatorio = random.Random(42)
+    lote = []
+    for i in range(linhas):
+        lote.append((
+            i, (inicio + timedelta(days=aleatorio.randrange(5 * 365))).isoformat(),
+            aleatorio.choice(("RECEBER", "PAGAR")), aleatorio.choice(("BANCO1", "BANCO2", "COFRE")),
+            round(aleatorio.uniform(1, 5000), 2),
+        ))
+        if len(lote) == 50000:
+            conn.executemany("INSERT INTO movimentos VALUES (?, ?, ?, ?, ?)", lote)
+            lote = []
+    conn.executemany("INSERT INTO movimentos VALUES (?, ?, ?, ?, ?)", lote)
+    conn.commit()
+    conn.close()
+
+
+def consultas_kpi(tabela, valor, data, tipo=None, valores_tipo=("RECEBER",), periodo="2024-06"):
+    """
+    Os formatos de SQL montados por carregar_indicador_configurado (dashboard.py).
+    """
+    entradas = ", ".join(f"'{v}'" for v in valores_tipo)
+    consultas = {
+        "soma_do_mes": f"SELECT SUM({valor}) FROM {tabela} WHERE strftime('%Y-%m', {data}) = '{periodo}'",
+        "serie_mensal": f"SELECT strftime('%Y-%m', {data}) AS mes, SUM({valor}) FROM {tabela} GROUP BY 1 ORDER BY 1",
+    }
+    if tipo:
+        consultas["soma_do_mes_por_tipo"] = (
+            f"SELECT SUM({valor}) FROM {tabela} "
+            f"WHERE strftime('%Y-%m', {data}) = '{periodo}' AND {tipo} IN ({entradas})"
+        )
+        consultas["saldo_acumulado"] = (
+            f"SELECT SUM(CASE WHEN {tipo} IN ({entradas}) THEN {valor} ELSE -1*{valor} END) "
+            f"FROM {tabela} WHERE strftime('%Y-%m', {data}) <= '{periodo}'"
+        )
+    return consultas
+
+
+def medir(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sqlite")
+    parser.add_argument("--tabela", default="movimentos")
+    parser.add_argument("--valor", default="valor")
+    parser.add_argument("--data", default="data")
+    parser.add_argument("--tipo", default="tipo")
+    parser.add_argument("--valores-tipo", default="RECEBER")
+    parser.add_argument("--periodo", default="2024-06")
+    parser.add_argument("--linhas", type=int, default=1_000_000)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    args = parser.parse_args()
+
+    if not colunar.COLUNAR_DISPONIVEL:
+        raise SystemExit("Instale duckdb e pyarrow para comparar os motores.")
+
+    caminho = args.sqlite
+    if not caminho:
+        caminho = os.path.join(tempfile.mkdtemp(prefix="bench_kpi_"), "dados.db")
+        print(f"Gerando {args.linhas} linhas em {caminho}...")
+        gerar_movimentos(caminho, args.linhas)
+
+    conn = configurar_conexao(sqlite3.connect(caminho))
+    inicio = time.perf_counter()
+    colunar.exportar_parquet(conn, caminho, args.tabela)
+    conn.close()
+    tamanho_sqlite = os.path.getsize(caminho) / 1024 / 1024
+    tamanho_parquet = os.path.getsize(colunar.caminho_parquet(caminho, args.tabela)) / 1024 / 1024
+    print(f"Exportação Parquet: {time.perf_counter() - inicio:.2f}s "
+          f"(SQLite {tamanho_sqlite:.1f} MB, Parquet {tamanho_parquet:.1f} MB)")
+
+    consultas = consultas_kpi(args.tabela, args.valor, args.data, args.tipo or None,
+                              [v.strip() for v in args.valores_tipo.split(",") if v.strip()], args.periodo)
+    print(f"{'consulta':<24}{'sqlite (s)':>12}{'duckdb (s)':>12}{'ganho':>8}")
+    for nome, sql in consultas.items():
+        # Primeira execução fora da medição (cache de páginas / criação das views)
+        colunar.consultar(caminho, sql, motor="sqlite")
+        colunar.consultar(caminho, sql, motor="duckdb")
+        t_sqlite = medir(lambda: colunar.consultar(caminho, sql, motor="sqlite"), args.repeticoes)
+        t_duckdb = medir(lambda: colunar.consultar(caminho, sql, motor="duckdb"), args.repeticoes)
+        print(f"{nome:<24}{t_sqlite:>12.4f}{t_duckdb:>12.4f}{t_sqlite / t_duckdb:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
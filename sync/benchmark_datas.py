@@ -0,0 +1,122 @@
+"""
+Compara o filtro de mês com strftime() e com as chaves de data derivadas
+(sync.datas) na consulta de um KPI, mostrando o plano de cada uma. A consulta
+pela chave é a que o dashboard roda (app.indicadores.compilar_grupo), para dois
+indicadores da mesma tabela, como Receitas e Despesas do mês.
+
+    python -m sync.benchmark_datas --linhas 1000000
+    python -m sync.benchmark_datas --sqlite data/cliente_1.db --tabela notas \\
+        --valor valor_total --data data_emissao --tipo tipo --valores-tipo VENDA --outros-valores-tipo ""
+
+Sem --sqlite gera uma tabela sintética de movimentos em um arquivo temporário,
+com parte das datas em 'dd/mm/aaaa'. Os índices são os que a sincronização
+criaria (sync.indices). Sai com erro se o índice usado pela consulta pela chave
+não restringir a chave de mês (ex.: "_mes_data=?") ou se o plano ainda varrer
+a tabela, para servir de teste de regressão: um SEARCH só pelo tipo (como o do
+strftime) não basta.
+"""
+import argparse
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+from datetime import date, timedelta
+
+from sync.banco_local import configurar_conexao
+from sync.benchmark_colunar import medir
+from sync.datas import PREFIXO_MES, chave_do_periodo, chave_mes, garantir_chaves_data
+from sync.indices import aplicar_indices, planejar_indices
+
+
+def gerar_movimentos(caminho, linhas, fracao_br=0.2):
+    conn = configurar_conexao(sqlite3.connect(caminho))
+    conn.execute("DROP TABLE IF EXISTS movimentos")
+    conn.execute("CREATE TABLE movimentos (id INTEGER PRIMARY KEY, data TEXT, tipo TEXT, conta TEXT, valor REAL)")
+    inicio = date(2020, 1, 1)
+    aleatorio = random.Random(42)
+    lote = []
+    for i in range(linhas):
+        dia = inicio + timedelta(days=aleatorio.randrange(5 * 365))
+        lote.append((
+            i, dia.strftime("%d/%m/%Y") if aleatorio.random() < fracao_br else dia.isoformat(),
+            aleatorio.choice(("RECEBER", "PAGAR")), aleatorio.choice(("BANCO1", "BANCO2", "COFRE")),
+            round(aleatorio.uniform(1, 5000), 2),
+        ))
+        if len(lote) == 50000:
+            conn.executemany("INSERT INTO movimentos VALUES (?, ?, ?, ?, ?)", lote)
+            lote = []
+    conn.executemany("INSERT INTO movimentos VALUES (?, ?, ?, ?, ?)", lote)
+    conn.commit()
+    conn.close()
+
+
+def plano(conn, sql, params=()):
+    return " | ".join(r[3] for r in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sqlite")
+    parser.add_argument("--tabela", default="movimentos")
+    parser.add_argument("--valor", default="valor")
+    parser.add_argument("--data", default="data")
+    parser.add_argument("--tipo", default="tipo")
+    parser.add_argument("--valores-tipo", default="RECEBER")
+    parser.add_argument("--outros-valores-tipo", default="PAGAR",
+                        help="tipos de um segundo indicador na mesma consulta (vazio: só um)")
+    parser.add_argument("--periodo", default="2024-06")
+    parser.add_argument("--linhas", type=int, default=1_000_000)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    args = parser.parse_args()
+
+    caminho = args.sqlite
+    if not caminho:
+        caminho = os.path.join(tempfile.mkdtemp(prefix="bench_datas_"), "dados.db")
+        print(f"Gerando {args.linhas} linhas em {caminho}...")
+        gerar_movimentos(caminho, args.linhas)
+
+    # Import local: o pacote sync não depende de app, só este benchmark
+    from app.indicadores import compilar_grupo, vincular
+
+    conn = configurar_conexao(sqlite3.connect(caminho))
+    mapeamentos = [
+        {"indicador": f"benchmark {n}", "tabela": args.tabela, "coluna_valor": args.valor,
+         "coluna_data": args.data, "coluna_tipo": args.tipo or None, "valores_entrada": valores,
+         "valores_saida": None, "coluna_filtro": None, "valor_filtro": None, "formula_sql": None}
+        for n, valores in enumerate((args.valores_tipo, args.outros_valores_tipo)) if n == 0 or valores
+    ]
+    garantir_chaves_data(conn, mapeamentos)
+    aplicar_indices(conn, planejar_indices(conn, mapeamentos, []))
+
+    tipos = ", ".join("'" + v.strip().replace("'", "''") + "'" for v in args.valores_tipo.split(",") if v.strip())
+    filtro_tipo = f" AND {args.tipo} IN ({tipos})" if args.tipo and tipos else ""
+    sql_chave, modelo = compilar_grupo(args.tabela, mapeamentos, {args.data: chave_mes(conn, args.tabela, args.data)})
+    consultas = {
+        "strftime": (
+            f"SELECT SUM({args.valor}) FROM {args.tabela} "
+            f"WHERE strftime('%Y-%m', {args.data}) = '{args.periodo}'{filtro_tipo}",
+            [],
+        ),
+        "chave_mes": (sql_chave, vincular(modelo, periodo=chave_do_periodo(args.periodo))),
+    }
+    planos = {}
+    print(f"{'consulta':<12}{'tempo (s)':>12}{'valor':>18}  plano")
+    for nome, (sql, params) in consultas.items():
+        valor = conn.execute(sql, params).fetchone()[0]
+        tempo = medir(lambda: conn.execute(sql, params).fetchone(), args.repeticoes)
+        planos[nome] = plano(conn, sql, params)
+        print(f"{nome:<12}{tempo:>12.4f}{valor or 0:>18.2f}  {planos[nome]}")
+    conn.close()
+
+    # A restrição do índice aparece no plano entre parênteses: "(tipo=? AND _mes_data=?)"; um
+    # SCAN da tabela (ou do índice inteiro), mesmo ao lado de uma busca, lê o histórico todo
+    if (not re.search(rf"\(.*\b{re.escape(PREFIXO_MES + args.data)}[=<>]", planos["chave_mes"])
+            or re.search(rf"\bSCAN {re.escape(args.tabela)}\b", planos["chave_mes"])):
+        print("Regressão: a consulta pela chave de mês não busca pela chave no índice.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
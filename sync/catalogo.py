@@ -0,0 +1,91 @@
+import threading
+import time
+
+# Segundos que o catálogo remoto de uma empresa vale antes de ser lido de novo
+CATALOGO_TTL = 600
+
+
+def ler_catalogo_remoto(conn_mysql):
+    """
+    Lê do information_schema as tabelas e views do schema atual, com colunas,
+    tipos e estimativa de linhas. São só duas consultas, qualquer que seja o
+    número de tabelas.
+    """
+    with conn_mysql.cursor() as cur:
+        cur.execute(
+            "SELECT table_name, table_type, table_rows FROM information_schema.tables "
+            "WHERE table_schema = DATABASE() ORDER BY table_name"
+        )
+        tabelas = {
+            nome: {
+                "nome": nome,
+                "tipo": "view" if tipo == "VIEW" else "tabela",
+                "linhas_estimadas": linhas if tipo != "VIEW" else None,
+                "colunas": [],
+            }
+            for nome, tipo, linhas in cur.fetchall()
+        }
+        cur.execute(
+            "SELECT table_name, column_name, data_type, column_type, column_key FROM information_schema.columns "
+            "WHERE table_schema = DATABASE() ORDER BY table_name, ordinal_position"
+        )
+        for tabela, coluna, data_type, column_type, column_key in cur.fetchall():
+            if tabela in tabelas:
+                tabelas[tabela]["colunas"].append({
+                    "nome": coluna,
+                    "tipo": data_type,
+                    "tipo_completo": column_type,
+                    "chave_primaria": column_key == "PRI",
+                })
+    return {"tabelas": list(tabelas.values()), "lido_em": time.time()}
+
+
+def nomes_do_catalogo(catalogo):
+    return [t["nome"] for t in catalogo["tabelas"]]
+
+
+class CacheCatalogo:
+    """
+    Catálogo remoto em memória por chave (ex.: empresa_id), válido por ttl
+    segundos. Leituras simultâneas da mesma chave esperam uma única consulta
+    ao servidor.
+    """
+
+    def __init__(self, ttl=CATALOGO_TTL):
+        self.ttl = ttl
+        self._catalogos = {}      # chave -> catálogo
+        self._locks = {}          # chave -> lock da leitura em andamento
+        self._lock = threading.Lock()
+
+    def obter(self, chave, carregar, atualizar=False):
+        """
+        Devolve (catálogo, veio_do_cache). carregar() lê o catálogo do servidor;
+        atualizar=True ignora o que estiver em cache.
+        """
+        if not atualizar:
+            catalogo = self._valido(chave)
+            if catalogo is not None:
+                return catalogo, True
+        with self._lock:
+            lock_chave = self._locks.setdefault(chave, threading.Lock())
+        with lock_chave:
+            # Outra requisição pode ter acabado de ler enquanto esperávamos
+            if not atualizar:
+                catalogo = self._valido(chave)
+                if catalogo is not None:
+                    return catalogo, True
+            catalogo = carregar()
+            with self._lock:
+                self._catalogos[chave] = catalogo
+            return catalogo, False
+
+    def invalidar(self, chave):
+        with self._lock:
+            self._catalogos.pop(chave, None)
+
+    def _valido(self, chave):
+        with self._lock:
+            catalogo = self._catalogos.get(chave)
+        if catalogo is not None and time.time() - catalogo["lido_em"] < self.ttl:
+            return catalogo
+        return None
@@ -0,0 +1,187 @@
+import os
+import re
+import threading
+
+import pandas as pd
+
+from sync.banco_local import ler
+
+try:
+    import duckdb
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    COLUNAR_DISPONIVEL = True
+except ImportError:
+    duckdb = pa = pq = None
+    COLUNAR_DISPONIVEL = False
+
+# Motor colunar opcional: depois de cada sincronização as tabelas copiadas são exportadas
+# para Parquet e consultar() roda o mesmo SQL no DuckDB, caindo no SQLite quando não der.
+# Exige duckdb e pyarrow.
+MOTOR_COLUNAR_ATIVO = False
+LINHAS_POR_GRUPO = 100_000
+
+_local = threading.local()
+
+
+def pasta_colunar(caminho_sqlite):
+    return os.path.splitext(caminho_sqlite)[0] + "_parquet"
+
+
+def caminho_parquet(caminho_sqlite, tabela):
+    return os.path.join(pasta_colunar(caminho_sqlite), f"{tabela}.parquet")
+
+
+def colunar_ativo():
+    return MOTOR_COLUNAR_ATIVO and COLUNAR_DISPONIVEL
+
+
+def tipo_arrow(tipo_declarado):
+    tipo = (tipo_declarado or "").upper()
+    if "INT" in tipo:
+        return pa.int64()
+    if any(t in tipo for t in ("REAL", "FLOA", "DOUB")):
+        return pa.float64()
+    if "BLOB" in tipo:
+        return pa.binary()
+    return pa.string()
+
+
+def exportar_parquet(conn_sqlite, caminho_sqlite, tabela, linhas_por_grupo=LINHAS_POR_GRUPO):
+    """
+    Grava a tabela local em Parquet, em grupos de linhas, sem carregar tudo na memória.
+    O esquema vem dos tipos declarados no SQLite (ver sync.tipos). O arquivo é escrito
+    ao lado e trocado no final: os leitores nunca veem um Parquet pela metade.
+    """
+    destino = caminho_parquet(caminho_sqlite, tabela)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    temporario = destino + ".tmp"
+    # table_xinfo inclui as colunas geradas (chaves de data de sync.datas), que SELECT * também traz
+    info = conn_sqlite.execute(f'PRAGMA table_xinfo("{tabela}")').fetchall()
+    esquema = pa.schema([(c[1], tipo_arrow(c[2])) for c in info])
+    cursor = conn_sqlite.execute(f'SELECT * FROM "{tabela}"')
+    try:
+        with pq.ParquetWriter(temporario, esquema) as escritor:
+            while True:
+                linhas = cursor.fetchmany(linhas_por_grupo)
+                if not linhas:
+                    break
+                colunas = list(zip(*linhas))
+                escritor.write_table(pa.Table.from_arrays(
+                    [pa.array(valores, type=campo.type) for valores, campo in zip(colunas, esquema)],
+                    schema=esquema,
+                ))
+    except Exception:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    os.replace(temporario, destino)
+    return destino
+
+
+def exportar_tabelas(caminho_sqlite, tabelas):
+    """
+    Exporta as tabelas informadas (ex.: as copiadas numa sincronização). Devolve
+    {tabela: erro} das que falharam; falhar aqui não invalida a sincronização,
+    só faz consultar() usar o SQLite para essas tabelas.
+    """
+    if not colunar_ativo():
+        return {}
+    falhas = {}
+    with ler(caminho_sqlite) as conn:
+        for tabela in tabelas:
+            try:
+                exportar_parquet(conn, caminho_sqlite, tabela)
+            except Exception as e:
+                remover_parquet(caminho_sqlite, tabela)
+                falhas[tabela] = str(e)
+    return falhas
+
+
+def remover_parquet(caminho_sqlite, tabela):
+    arquivo = caminho_parquet(caminho_sqlite, tabela)
+    if os.path.exists(arquivo):
+        os.remove(arquivo)
+
+
+RE_STRFTIME = re.compile(r"strftime\(\s*('[^']*')\s*,\s*([^()]+?)\s*\)", re.IGNORECASE)
+
+
+def traduzir_para_duckdb(sql):
+    """
+    Ajusta o dialeto SQLite usado nos KPIs: strftime('%Y-%m', col) do SQLite vira
+    strftime(CAST(col AS TIMESTAMP), '%Y-%m') no DuckDB (datas ficam como texto ISO).
+    """
+    sql = RE_STRFTIME.sub(lambda m: f"strftime(CAST({m.group(2)} AS TIMESTAMP), {m.group(1)})", sql)
+    return sql.replace("`", '"')
+
+
+def _conexao_duckdb(caminho_sqlite):
+    """
+    Conexão DuckDB em memória (uma por thread e arquivo) com uma view por Parquet.
+    Quando algum Parquet muda, a conexão é refeita.
+    """
+    pasta = pasta_colunar(caminho_sqlite)
+    arquivos = sorted(f for f in os.listdir(pasta) if f.endswith(".parquet")) if os.path.isdir(pasta) else []
+    assinatura = tuple((f, os.path.getmtime(os.path.join(pasta, f))) for f in arquivos)
+    cache = getattr(_local, "duckdb", None)
+    if cache is None:
+        cache = _local.duckdb = {}
+    atual = cache.get(caminho_sqlite)
+    if atual and atual[0] == assinatura:
+        return atual[1]
+    if atual:
+        atual[1].close()
+    conn = duckdb.connect()
+    for f in arquivos:
+        tabela = f[:-len(".parquet")].replace('"', '""')
+        arquivo = os.path.join(pasta, f).replace("'", "''")
+        conn.execute(f"CREATE VIEW \"{tabela}\" AS SELECT * FROM read_parquet('{arquivo}')")
+    # As consultas (inclusive fórmulas SQL dos mapeamentos) só leem os Parquet da empresa
+    pasta_permitida = os.path.abspath(pasta).replace("'", "''")
+    conn.execute(f"SET allowed_directories = ['{pasta_permitida}']")
+    conn.execute("SET enable_external_access = false")
+    conn.execute("SET lock_configuration = true")
+    cache[caminho_sqlite] = (assinatura, conn)
+    return conn
+
+
+def interruptor_duckdb():
+    """
+    Função que, chamada de outra thread, interrompe as consultas DuckDB em
+    andamento na thread atual (ex.: prazo do aquecimento em app.indicadores).
+    """
+    cache = getattr(_local, "duckdb", None)
+    if cache is None:
+        cache = _local.duckdb = {}
+
+    def interromper():
+        for _, conn in list(cache.values()):
+            conn.interrupt()
+    return interromper
+
+
+def consultar_sqlite(caminho_sqlite, sql, params=None):
+    with ler(caminho_sqlite) as conn:
+        return pd.read_sql(sql, conn, params=params)
+
+
+def consultar_duckdb(caminho_sqlite, sql, params=None):
+    conn = _conexao_duckdb(caminho_sqlite)
+    return conn.execute(traduzir_para_duckdb(sql), list(params or [])).df()
+
+
+def consultar(caminho_sqlite, sql, params=None, motor=None):
+    """
+    Interface única de consulta: devolve um DataFrame. motor=None escolhe o DuckDB
+    quando disponível (com fallback para o SQLite); "sqlite" ou "duckdb" força o motor.
+    """
+    if motor == "sqlite" or (motor is None and not colunar_ativo()):
+        return consultar_sqlite(caminho_sqlite, sql, params)
+    if motor == "duckdb":
+        return consultar_duckdb(caminho_sqlite, sql, params)
+    try:
+        return consultar_duckdb(caminho_sqlite, sql, params)
+    except Exception:
+        # Tabela sem Parquet ou SQL que só roda no SQLite
+        return consultar_sqlite(caminho_sqlite, sql, params)
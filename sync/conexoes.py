@@ -0,0 +1,210 @@
+import threading
+import time
+
+import pymysql
+
+# Conexões abertas ao mesmo tempo por empresa (emprestadas + ociosas)
+MAX_CONEXOES = 8
+# Conexões ociosas há mais tempo que isso são fechadas
+OCIOSA_MAX_SEGUNDOS = 300
+# Conexões ociosas há mais tempo que isso recebem um ping antes de serem emprestadas
+VALIDAR_APOS_SEGUNDOS = 30
+# Espera máxima por uma conexão livre quando o pool está cheio
+ESPERA_MAXIMA_SEGUNDOS = 60
+
+
+class PoolEsgotado(Exception):
+    pass
+
+
+class ConexaoEmprestada:
+    """
+    Conexão emprestada de um PoolConexoes. Se comporta como a conexão pymysql;
+    close() devolve a conexão ao pool em vez de fechá-la.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, nome):
+        if self._conn is None:
+            raise pymysql.err.InterfaceError("Conexão já devolvida ao pool.")
+        return getattr(self._conn, nome)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.devolver(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PoolConexoes:
+    """
+    Pool de conexões com um servidor MySQL. Conexões ociosas são reaproveitadas
+    (com ping se ficaram paradas), fechadas depois de OCIOSA_MAX_SEGUNDOS e o
+    total aberto nunca passa de max_conexoes.
+    """
+
+    def __init__(self, abrir, max_conexoes=MAX_CONEXOES, ociosa_max=OCIOSA_MAX_SEGUNDOS,
+                 validar_apos=VALIDAR_APOS_SEGUNDOS, espera_maxima=ESPERA_MAXIMA_SEGUNDOS):
+        self._abrir = abrir
+        self.max_conexoes = max_conexoes
+        self.ociosa_max = ociosa_max
+        self.validar_apos = validar_apos
+        self.espera_maxima = espera_maxima
+        self._ociosas = []        # (conexão, instante em que ficou ociosa)
+        self._abertas = 0
+        self._fechado = False
+        self._cond = threading.Condition()
+
+    def conexao(self):
+        """
+        Empresta uma conexão; use com "with" ou chame close() para devolver.
+        """
+        prazo = time.monotonic() + self.espera_maxima
+        while True:
+            with self._cond:
+                if self._fechado:
+                    raise PoolEsgotado("Pool de conexões fechado.")
+                self._expurgar()
+                if self._ociosas:
+                    conn, desde = self._ociosas.pop()
+                elif self._abertas < self.max_conexoes:
+                    self._abertas += 1
+                    conn, desde = None, None
+                else:
+                    restante = prazo - time.monotonic()
+                    if restante <= 0:
+                        raise PoolEsgotado(f"Nenhuma das {self.max_conexoes} conexões ficou livre a tempo.")
+                    self._cond.wait(restante)
+                    continue
+            if conn is not None and time.monotonic() - desde > self.validar_apos and not self._saudavel(conn):
+                # Conexão caiu enquanto estava ociosa: abre outra no mesmo lugar
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                conn = None
+            if conn is None:
+                try:
+                    conn = self._abrir()
+                except Exception:
+                    with self._cond:
+                        self._abertas -= 1
+                        self._cond.notify()
+                    raise
+            return ConexaoEmprestada(self, conn)
+
+    def devolver(self, conn):
+        # Leitura com SSCursor interrompida: reaproveitar obrigaria a ler o resto do resultado
+        resultado = getattr(conn, "_result", None)
+        reaproveitavel = not (resultado is not None and getattr(resultado, "unbuffered_active", False))
+        if reaproveitavel:
+            try:
+                # Encerra a transação para a próxima leitura não ver um snapshot antigo
+                conn.rollback()
+            except Exception:
+                reaproveitavel = False
+        with self._cond:
+            if reaproveitavel and not self._fechado:
+                self._ociosas.append((conn, time.monotonic()))
+                self._cond.notify()
+                return
+        self._fechar(conn)
+
+    def fechar(self):
+        with self._cond:
+            self._fechado = True
+            ociosas, self._ociosas = self._ociosas, []
+        for conn, _ in ociosas:
+            self._fechar(conn)
+
+    def situacao(self):
+        with self._cond:
+            return {"abertas": self._abertas, "ociosas": len(self._ociosas), "max_conexoes": self.max_conexoes}
+
+    def _expurgar(self):
+        # Chamado com o lock; as mais antigas ficam no começo da lista
+        limite = time.monotonic() - self.ociosa_max
+        while self._ociosas and self._ociosas[0][1] < limite:
+            conn, _ = self._ociosas.pop(0)
+            self._abertas -= 1
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _saudavel(self, conn):
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _fechar(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._abertas -= 1
+            self._cond.notify()
+
+
+class PoolsPorChave:
+    """
+    Um PoolConexoes por chave (ex.: empresa_id). Se os parâmetros de conexão da
+    chave mudarem, o pool antigo é fechado e outro é criado.
+    """
+
+    def __init__(self, **opcoes_pool):
+        self.opcoes_pool = opcoes_pool
+        self._pools = {}      # chave -> (parâmetros, pool)
+        self._lock = threading.Lock()
+
+    def obter(self, chave, host, porta, usuario, senha, schema):
+        parametros = (host, int(porta), usuario, senha, schema)
+        antigo = None
+        with self._lock:
+            atual = self._pools.get(chave)
+            if atual and atual[0] == parametros:
+                return atual[1]
+            if atual:
+                antigo = atual[1]
+            pool = PoolConexoes(lambda: abrir_mysql(*parametros), **self.opcoes_pool)
+            self._pools[chave] = (parametros, pool)
+        if antigo:
+            antigo.fechar()
+        return pool
+
+    def conexao(self, chave, host, porta, usuario, senha, schema):
+        return self.obter(chave, host, porta, usuario, senha, schema).conexao()
+
+    def invalidar(self, chave):
+        with self._lock:
+            atual = self._pools.pop(chave, None)
+        if atual:
+            atual[1].fechar()
+
+    def fechar_todos(self):
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for _, pool in pools.values():
+            pool.fechar()
+
+    def situacao(self):
+        with self._lock:
+            return {chave: pool.situacao() for chave, (_, pool) in self._pools.items()}
+
+
+def abrir_mysql(host, porta, usuario, senha, schema):
+    return pymysql.connect(
+        host=host, port=int(porta), user=usuario, password=senha,
+        database=schema, charset='utf8mb4'
+    )
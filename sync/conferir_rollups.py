@@ -0,0 +1,114 @@
+"""
+Confere que os rollups mensais (sync.rollups) e o livro de saldos (sync.saldos)
+dão o mesmo resultado que a varredura da tabela, com colunas de tipo e de filtro
+INTEGER, REAL, NUMERIC e TEXT e os valores do mapeamento em texto, como vêm de
+indicador_mapeamento.
+
+    python -m sync.conferir_rollups
+
+Gera as tabelas em um arquivo temporário e sai com erro se algum valor divergir.
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+
+from sync.banco_local import configurar_conexao
+from sync.datas import chave_do_periodo, chave_mes
+from sync.rollups import (
+    atualizar_rollups, id_origem, origem_do_mapeamento, saldo_ate, serie_mensal, serie_saldo, somar_mes,
+)
+from sync.saldos import INDICADOR_SALDO, atualizar_saldos, id_livro, livro_do_mapeamento, saldo_do_livro, serie_do_livro
+
+# (tipo declarado do tipo, do filtro, valores de tipo, valores de filtro)
+CASOS = (
+    ("INTEGER", "INTEGER", (1, 2), (7, 8)),
+    ("REAL", "REAL", (1.0, 2.5), (7.0, 8.0)),
+    ("NUMERIC", "INTEGER", (1, 2), (7, 8)),
+    ("TEXT", "TEXT", ("RECEBER", "PAGAR"), ("BANCO1", "BANCO2")),
+    ("INTEGER", "TEXT", (1, 2), ("07", "8")),
+)
+PERIODO = "2024-04"
+
+
+def texto(valor):
+    # Como o valor chega do mapeamento: texto, sem o ".0" dos reais inteiros
+    return str(valor)[:-2] if isinstance(valor, float) and valor.is_integer() else str(valor)
+
+
+def varredura(conn, tabela, periodo, tipos=None, valor_filtro=None, saidas=None):
+    mes = chave_mes(conn, tabela, "data")
+    params = []
+    if saidas is None:
+        sql = f"SELECT SUM(valor) FROM {tabela} WHERE {mes} = ?"
+        params.append(chave_do_periodo(periodo))
+        if tipos:
+            sql += f" AND tipo IN ({', '.join('?' for _ in tipos)})"
+            params.extend(tipos)
+    else:
+        sinal = (f"CASE WHEN tipo IN ({', '.join('?' for _ in tipos)}) THEN valor "
+                 f"WHEN tipo IN ({', '.join('?' for _ in saidas)}) THEN -valor ELSE 0 END")
+        sql = f"SELECT SUM({sinal}) FROM {tabela} WHERE {mes} <= ?"
+        params.extend(list(tipos) + list(saidas) + [chave_do_periodo(periodo)])
+    if valor_filtro is not None:
+        sql += " AND conta = ?"
+        params.append(valor_filtro)
+    return conn.execute(sql, params).fetchone()[0] or 0
+
+
+def conferir(conn, n, decl_tipo, decl_filtro, tipos, filtros):
+    tabela = f"mov{n}"
+    conn.execute(f"CREATE TABLE {tabela} (id INTEGER PRIMARY KEY, data TEXT, tipo {decl_tipo}, "
+                 f"conta {decl_filtro}, valor REAL)")
+    conn.executemany(
+        f"INSERT INTO {tabela} VALUES (?, ?, ?, ?, ?)",
+        [(i, f"2024-{i % 5 + 1:02d}-10", tipos[i % 2], filtros[i // 2 % 2], float(i * (1 + i % 3)))
+         for i in range(60)]
+    )
+    mapeamento = {"indicador": "conferir", "tabela": tabela, "coluna_data": "data", "coluna_valor": "valor",
+                  "coluna_tipo": "tipo", "coluna_filtro": "conta"}
+    atualizar_rollups(conn, [mapeamento], {})
+    chave = id_origem(origem_do_mapeamento(mapeamento))
+    entrada, saida, filtro = texto(tipos[0]), texto(tipos[1]), texto(filtros[0])
+    saldo = dict(mapeamento, indicador=INDICADOR_SALDO, valores_entrada=entrada, valores_saida=saida)
+    atualizar_saldos(conn, [saldo], {})
+    livro = id_livro(livro_do_mapeamento(saldo))
+    mes = chave_do_periodo(PERIODO)
+    comparacoes = {
+        "soma": (somar_mes(conn, chave, PERIODO), varredura(conn, tabela, PERIODO)),
+        "soma por tipo": (somar_mes(conn, chave, PERIODO, [entrada]), varredura(conn, tabela, PERIODO, [entrada])),
+        "soma por filtro": (somar_mes(conn, chave, PERIODO, [entrada], filtro),
+                            varredura(conn, tabela, PERIODO, [entrada], filtro)),
+        "saldo": (saldo_ate(conn, chave, PERIODO, [entrada], [saida], filtro),
+                  varredura(conn, tabela, PERIODO, [entrada], filtro, [saida])),
+        "série": (serie_mensal(conn, chave, "2024-01", "2024-05", [entrada], filtro).get(PERIODO),
+                  varredura(conn, tabela, PERIODO, [entrada], filtro)),
+        "série do saldo": (serie_saldo(conn, chave, PERIODO, [entrada], [saida], filtro).get(PERIODO),
+                           varredura(conn, tabela, PERIODO, [entrada], filtro, [saida])),
+        "livro": (saldo_do_livro(conn, livro, mes), varredura(conn, tabela, PERIODO, [entrada], None, [saida])),
+        "livro por filtro": (saldo_do_livro(conn, livro, mes, filtro),
+                             varredura(conn, tabela, PERIODO, [entrada], filtro, [saida])),
+        "série do livro": (serie_do_livro(conn, livro, mes, filtro).get(mes),
+                           varredura(conn, tabela, PERIODO, [entrada], filtro, [saida])),
+    }
+    divergentes = 0
+    for nome, (rollup, tabela_valor) in comparacoes.items():
+        igual = (rollup or 0) == tabela_valor
+        divergentes += not igual
+        print(f"{decl_tipo:<9}{decl_filtro:<9}{nome:<17}{rollup or 0:>10}{tabela_valor:>10}  {'ok' if igual else 'DIVERGE'}")
+    return divergentes
+
+
+def main():
+    caminho = os.path.join(tempfile.mkdtemp(prefix="conferir_rollups_"), "dados.db")
+    conn = configurar_conexao(sqlite3.connect(caminho))
+    print(f"{'tipo':<9}{'filtro':<9}{'consulta':<17}{'rollup':>10}{'tabela':>10}")
+    divergentes = sum(conferir(conn, n, *caso) for n, caso in enumerate(CASOS))
+    conn.close()
+    if divergentes:
+        print(f"Regressão: {divergentes} resultado(s) do rollup ou do livro diferentes da varredura da tabela.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
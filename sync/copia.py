@@ -0,0 +1,459 @@
+import json
+import re
+import sqlite3
+import sys
+import time
+
+import pymysql.cursors
+
+from sync.tipos import alinhar_ao_cursor, converter_valor, ler_esquema_remoto, tipo_sqlite
+
+# Memória máxima (MB) ocupada pelos lotes em trânsito em uma sincronização
+ORCAMENTO_MEMORIA_MB = 64
+LOTE_INICIAL = 1000
+LOTE_MINIMO = 100
+LOTE_MAXIMO = 50000
+# As cargas são gravadas em uma tabela de staging e trocadas no final, em uma transação curta
+PREFIXO_STAGING = "_stg_"
+# Tabelas grandes com chave primária são lidas em faixas da chave (keyset), cada uma
+# em uma consulta curta; o progresso fica em TABELA_CHECKPOINT e uma nova tentativa
+# continua da última faixa gravada
+LIMIAR_PAGINACAO_LINHAS = 500_000
+LINHAS_POR_FAIXA = 100_000
+TABELA_CHECKPOINT = "_sync_checkpoint"
+
+
+def citar(nome):
+    return "`" + str(nome).replace("`", "``") + "`"
+
+
+def estimar_bytes_linha(linhas, amostra=50):
+    if not linhas:
+        return 0
+    passo = max(1, len(linhas) // amostra)
+    medidas = [
+        sys.getsizeof(linha) + sum(sys.getsizeof(v) for v in linha)
+        for linha in linhas[::passo]
+    ]
+    return sum(medidas) / len(medidas)
+
+
+def ajustar_lote(linhas, orcamento_bytes):
+    """
+    Calcula o próximo tamanho de lote para caber no orçamento de memória.
+    O fator 2 cobre a cópia convertida que existe junto com a linha original.
+    """
+    bytes_linha = estimar_bytes_linha(linhas)
+    if not bytes_linha:
+        return LOTE_INICIAL
+    tamanho = int(orcamento_bytes // (bytes_linha * 2))
+    return max(LOTE_MINIMO, min(LOTE_MAXIMO, tamanho))
+
+
+def ler_lotes(cursor, orcamento_bytes, conversores=None):
+    """
+    Lê o resultado de um cursor no servidor (SSCursor) em lotes adaptativos,
+    já convertidos para o sqlite3 (um conversor por coluna, se informado).
+    """
+    tamanho = LOTE_INICIAL
+    while True:
+        linhas = cursor.fetchmany(tamanho)
+        if not linhas:
+            break
+        if conversores:
+            lote = [tuple(f(v) for f, v in zip(conversores, linha)) for linha in linhas]
+        else:
+            lote = [tuple(converter_valor(v) for v in linha) for linha in linhas]
+        del linhas
+        yield lote
+        tamanho = ajustar_lote(lote, orcamento_bytes)
+
+
+def colunas_do_cursor(cursor):
+    return [(d[0], tipo_sqlite(d[1])) for d in cursor.description]
+
+
+def criar_tabela_destino(conn_sqlite, tabela, colunas, chave_primaria=None):
+    definicoes = ", ".join(f"{citar(nome)} {tipo}" for nome, tipo in colunas)
+    if chave_primaria:
+        definicoes += f", PRIMARY KEY ({', '.join(citar(c) for c in chave_primaria)})"
+    conn_sqlite.execute(f"DROP TABLE IF EXISTS {citar(tabela)}")
+    conn_sqlite.execute(f"CREATE TABLE {citar(tabela)} ({definicoes})")
+
+
+def sql_insert(tabela, nomes_colunas, substituir=False):
+    campos = ", ".join(citar(c) for c in nomes_colunas)
+    marcadores = ", ".join("?" for _ in nomes_colunas)
+    verbo = "INSERT OR REPLACE" if substituir else "INSERT"
+    return f"{verbo} INTO {citar(tabela)} ({campos}) VALUES ({marcadores})"
+
+
+def tabela_existe(conn_sqlite, tabela):
+    row = conn_sqlite.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (tabela,)
+    ).fetchone()
+    return row is not None
+
+
+def colunas_locais(conn_sqlite, tabela):
+    return [c[1] for c in conn_sqlite.execute(f"PRAGMA table_info({citar(tabela)})").fetchall()]
+
+
+def nome_staging(tabela):
+    return PREFIXO_STAGING + tabela
+
+
+def nome_indice_staging(nome):
+    # Alterna entre "ix" e "_stg_ix" a cada carga, já que o índice antigo ainda existe
+    if nome.startswith(PREFIXO_STAGING):
+        return nome[len(PREFIXO_STAGING):]
+    return PREFIXO_STAGING + nome
+
+
+RE_CREATE_INDEX = re.compile(
+    r'^\s*CREATE\s+(UNIQUE\s+)?INDEX\s+(?:IF\s+NOT\s+EXISTS\s+)?'
+    r'(?:"[^"]*"|`[^`]*`|\[[^\]]*\]|\S+)\s+ON\s+(?:"[^"]*"|`[^`]*`|\[[^\]]*\]|[^\s(]+)\s*(\(.*)$',
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def recriar_indices(conn_sqlite, origem, destino):
+    """
+    Recria em destino os índices declarados em origem (a tabela publicada),
+    para que a tabela de staging já entre no ar indexada.
+    """
+    # sync.datas importa este módulo
+    from sync.datas import PREFIXO_DIA, PREFIXO_MES
+
+    indices = conn_sqlite.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL",
+        (origem,)
+    ).fetchall()
+    for nome, sql in indices:
+        match = RE_CREATE_INDEX.match(sql)
+        if not match:
+            continue
+        unico, resto = match.groups()
+        try:
+            conn_sqlite.execute(
+                f"CREATE {'UNIQUE ' if unico else ''}INDEX IF NOT EXISTS {citar(nome_indice_staging(nome))} "
+                f"ON {citar(destino)} {resto}"
+            )
+        except sqlite3.OperationalError:
+            # Índice sobre as chaves de data de sync.datas, que a staging ainda não
+            # tem: é refeito depois da sincronização, junto com elas
+            if PREFIXO_MES in resto or PREFIXO_DIA in resto:
+                continue
+            raise
+
+
+def garantir_indice_chave(conn_sqlite, tabela, chave):
+    nome = "ux_" + tabela + "_pk"
+    existentes = {
+        r[0] for r in conn_sqlite.execute(
+            "SELECT name FROM sqlite_master WHERE type='index' AND tbl_name=?", (tabela,)
+        ).fetchall()
+    }
+    if nome in existentes or nome_indice_staging(nome) in existentes:
+        return
+    campos = ", ".join(citar(c) for c in chave)
+    conn_sqlite.execute(f"CREATE UNIQUE INDEX {citar(nome)} ON {citar(tabela)} ({campos})")
+
+
+def descartar_staging(conn_sqlite, tabela):
+    conn_sqlite.rollback()
+    conn_sqlite.execute(f"DROP TABLE IF EXISTS {citar(nome_staging(tabela))}")
+    conn_sqlite.commit()
+
+
+def trocar_tabela(conn_sqlite, tabela, modo="completo", substituir=False):
+    """
+    Publica a carga da tabela de staging. Na cópia completa os índices são criados
+    na staging antes da troca e a troca é só DROP + RENAME; na incremental o delta
+    é aplicado sobre a tabela publicada. Leitores continuam na versão antiga até o commit.
+    """
+    staging = nome_staging(tabela)
+    if modo == "completo":
+        recriar_indices(conn_sqlite, tabela, staging)
+        conn_sqlite.commit()
+    conn_sqlite.execute("BEGIN IMMEDIATE")
+    try:
+        if modo == "completo":
+            conn_sqlite.execute(f"DROP TABLE IF EXISTS {citar(tabela)}")
+            conn_sqlite.execute(f"ALTER TABLE {citar(staging)} RENAME TO {citar(tabela)}")
+        else:
+            verbo = "INSERT OR REPLACE" if substituir else "INSERT"
+            conn_sqlite.execute(f"{verbo} INTO {citar(tabela)} SELECT * FROM {citar(staging)}")
+            conn_sqlite.execute(f"DROP TABLE {citar(staging)}")
+        conn_sqlite.commit()
+    except Exception:
+        conn_sqlite.rollback()
+        raise
+
+
+def maior_valor(atual, lote, indice):
+    for linha in lote:
+        valor = linha[indice]
+        if valor is not None and (atual is None or valor > atual):
+            atual = valor
+    return atual
+
+
+def _transferir(cursor, conn_sqlite, sql, nomes, orcamento_bytes, coluna_watermark=None, conversores=None):
+    """
+    Grava os lotes do cursor com o insert informado. Se houver coluna de watermark,
+    acompanha o maior valor visto para a próxima sincronização incremental.
+    """
+    indice = nomes.index(coluna_watermark) if coluna_watermark else None
+    total_linhas = 0
+    total_lotes = 0
+    watermark = None
+    for lote in ler_lotes(cursor, orcamento_bytes, conversores):
+        conn_sqlite.executemany(sql, lote)
+        if indice is not None:
+            watermark = maior_valor(watermark, lote, indice)
+        total_linhas += len(lote)
+        total_lotes += 1
+    return total_linhas, total_lotes, watermark
+
+
+def copiar_tabela(conn_mysql, conn_sqlite, tabela, orcamento_memoria_mb=ORCAMENTO_MEMORIA_MB,
+                  coluna_watermark=None, colunas_centavos=()):
+    """
+    Copia uma tabela/view do MySQL para o SQLite em streaming: cursor no servidor,
+    lotes limitados pelo orçamento de memória e inserts com executemany dentro de
+    uma única transação na tabela de staging, publicada no final com trocar_tabela.
+    Os tipos e a chave primária vêm do information_schema (ver sync.tipos).
+    Retorna as estatísticas da cópia.
+    """
+    inicio = time.monotonic()
+    orcamento_bytes = orcamento_memoria_mb * 1024 * 1024
+    staging = nome_staging(tabela)
+    esquema = ler_esquema_remoto(conn_mysql, tabela, colunas_centavos)
+    cursor = conn_mysql.cursor(pymysql.cursors.SSCursor)
+    try:
+        cursor.execute(f"SELECT * FROM {citar(tabela)}")
+        colunas, conversores = alinhar_ao_cursor(esquema, cursor)
+        nomes = [nome for nome, _ in colunas]
+        conn_sqlite.execute("BEGIN")
+        try:
+            criar_tabela_destino(conn_sqlite, staging, colunas, esquema["chave_primaria"])
+            linhas, lotes, watermark = _transferir(
+                cursor, conn_sqlite, sql_insert(staging, nomes), nomes, orcamento_bytes, coluna_watermark,
+                conversores
+            )
+            conn_sqlite.commit()
+        except Exception:
+            descartar_staging(conn_sqlite, tabela)
+            raise
+    finally:
+        cursor.close()
+    trocar_tabela(conn_sqlite, tabela)
+    return {
+        "tabela": tabela,
+        "modo": "completo",
+        "linhas": linhas,
+        "lotes": lotes,
+        "watermark": watermark,
+        "segundos": round(time.monotonic() - inicio, 3),
+    }
+
+
+def estimar_linhas(conn_mysql, tabela):
+    """
+    Estimativa barata do número de linhas (information_schema); None para views.
+    """
+    with conn_mysql.cursor() as cur:
+        cur.execute(
+            "SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s",
+            (tabela,)
+        )
+        row = cur.fetchone()
+    return row[0] if row else None
+
+
+def calcular_fingerprint(conn_mysql, tabela, coluna_watermark=None):
+    """
+    Impressão digital barata do conteúdo remoto, usada para pular tabelas sem mudança:
+    COUNT + MAX(watermark) quando há watermark; senão update_time da tabela ou
+    CHECKSUM TABLE. Devolve None quando não há como detectar (views sem watermark).
+    """
+    with conn_mysql.cursor() as cur:
+        if coluna_watermark:
+            cur.execute(f"SELECT COUNT(*), MAX({citar(coluna_watermark)}) FROM {citar(tabela)}")
+            total, maximo = cur.fetchone()
+            return f"wm:{total}:{converter_valor(maximo)}"
+        try:
+            # No MySQL 8 o information_schema guarda estatísticas em cache por até 24h
+            cur.execute("SET SESSION information_schema_stats_expiry = 0")
+        except Exception:
+            pass
+        cur.execute(
+            "SELECT table_type, create_time, update_time FROM information_schema.tables "
+            "WHERE table_schema = DATABASE() AND table_name = %s",
+            (tabela,)
+        )
+        row = cur.fetchone()
+        if not row or row[0] != "BASE TABLE":
+            return None
+        if row[2] is not None:
+            return f"ut:{converter_valor(row[1])}:{converter_valor(row[2])}"
+        cur.execute(f"CHECKSUM TABLE {citar(tabela)}")
+        checksum = cur.fetchone()[1]
+        return f"ck:{checksum}" if checksum is not None else None
+
+
+def copiar_incremental(conn_mysql, conn_sqlite, tabela, coluna_watermark, chave_primaria=None,
+                       ultimo_watermark=None, orcamento_memoria_mb=ORCAMENTO_MEMORIA_MB, colunas_centavos=()):
+    """
+    Sincronização incremental (delta): traz só as linhas com watermark a partir do
+    último valor visto e faz upsert pela chave primária. Sem watermark anterior,
+    sem a tabela local ou com colunas diferentes, faz a cópia completa.
+
+    Com chave primária a leitura usa >= (as linhas da borda são reescritas pelo
+    upsert, sem perder alterações feitas no mesmo segundo); sem chave, só
+    acrescenta linhas com watermark estritamente maior.
+    """
+    if ultimo_watermark is None or not tabela_existe(conn_sqlite, tabela):
+        return copiar_tabela(conn_mysql, conn_sqlite, tabela, orcamento_memoria_mb, coluna_watermark,
+                             colunas_centavos)
+
+    inicio = time.monotonic()
+    orcamento_bytes = orcamento_memoria_mb * 1024 * 1024
+    chave = list(chave_primaria or [])
+    operador = ">=" if chave else ">"
+    esquema = ler_esquema_remoto(conn_mysql, tabela, colunas_centavos)
+    cursor = conn_mysql.cursor(pymysql.cursors.SSCursor)
+    try:
+        cursor.execute(
+            f"SELECT * FROM {citar(tabela)} WHERE {citar(coluna_watermark)} {operador} %s",
+            (ultimo_watermark,)
+        )
+        colunas, conversores = alinhar_ao_cursor(esquema, cursor)
+        nomes = [nome for nome, _ in colunas]
+        if nomes != colunas_locais(conn_sqlite, tabela):
+            cursor.close()
+            return copiar_tabela(conn_mysql, conn_sqlite, tabela, orcamento_memoria_mb, coluna_watermark,
+                                 colunas_centavos)
+        staging = nome_staging(tabela)
+        if chave:
+            garantir_indice_chave(conn_sqlite, tabela, chave)
+            conn_sqlite.commit()
+        conn_sqlite.execute("BEGIN")
+        try:
+            criar_tabela_destino(conn_sqlite, staging, colunas, esquema["chave_primaria"])
+            linhas, lotes, watermark = _transferir(
+                cursor, conn_sqlite, sql_insert(staging, nomes), nomes, orcamento_bytes, coluna_watermark,
+                conversores
+            )
+            conn_sqlite.commit()
+        except Exception:
+            descartar_staging(conn_sqlite, tabela)
+            raise
+    finally:
+        cursor.close()
+    trocar_tabela(conn_sqlite, tabela, "incremental", substituir=bool(chave or esquema["chave_primaria"]))
+    return {
+        "tabela": tabela,
+        "modo": "incremental",
+        "linhas": linhas,
+        "lotes": lotes,
+        "watermark": watermark if watermark is not None else ultimo_watermark,
+        "segundos": round(time.monotonic() - inicio, 3),
+    }
+
+
+def garantir_checkpoints(conn_sqlite):
+    conn_sqlite.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABELA_CHECKPOINT} (
+            tabela TEXT PRIMARY KEY,
+            colunas_chave TEXT,
+            ultima_chave TEXT,
+            linhas INTEGER,
+            fingerprint TEXT,
+            iniciado_em REAL,
+            atualizado_em REAL
+        )
+    """)
+
+
+def ler_checkpoint(conn_sqlite, tabela):
+    if not tabela_existe(conn_sqlite, TABELA_CHECKPOINT):
+        return None
+    row = conn_sqlite.execute(
+        f"SELECT colunas_chave, ultima_chave, linhas, fingerprint FROM {TABELA_CHECKPOINT} WHERE tabela = ?",
+        (tabela,)
+    ).fetchone()
+    if not row:
+        return None
+    return {
+        "colunas_chave": json.loads(row[0]),
+        "ultima_chave": json.loads(row[1]) if row[1] else None,
+        "linhas": row[2] or 0,
+        "fingerprint": row[3],
+    }
+
+
+def gravar_checkpoint(conn_sqlite, tabela, colunas_chave, ultima_chave, linhas, fingerprint=None):
+    """
+    Registra a última chave gravada na staging. Não faz commit: deve entrar na
+    mesma transação das linhas, para o checkpoint nunca passar à frente dos dados.
+    """
+    agora = time.time()
+    conn_sqlite.execute(
+        f"""
+        INSERT INTO {TABELA_CHECKPOINT}
+            (tabela, colunas_chave, ultima_chave, linhas, fingerprint, iniciado_em, atualizado_em)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(tabela) DO UPDATE SET
+            ultima_chave = excluded.ultima_chave, linhas = excluded.linhas, atualizado_em = excluded.atualizado_em
+        """,
+        (tabela, json.dumps(colunas_chave), json.dumps(ultima_chave) if ultima_chave is not None else None,
+         linhas, fingerprint, agora, agora)
+    )
+
+
+def apagar_checkpoint(conn_sqlite, tabela):
+    if tabela_existe(conn_sqlite, TABELA_CHECKPOINT):
+        conn_sqlite.execute(f"DELETE FROM {TABELA_CHECKPOINT} WHERE tabela = ?", (tabela,))
+
+
+def abrir_faixa(conn_mysql, tabela, chave, depois_de=None, limite=LINHAS_POR_FAIXA):
+    """
+    Cursor no servidor para a próxima faixa da chave: linhas com chave maior que
+    depois_de, em ordem, no máximo limite. A comparação de tuplas usa o índice da
+    chave primária, então cada faixa custa o mesmo no servidor.
+    """
+    campos = ", ".join(citar(c) for c in chave)
+    sql = f"SELECT * FROM {citar(tabela)}"
+    params = []
+    if depois_de is not None:
+        sql += f" WHERE ({campos}) > ({', '.join('%s' for _ in chave)})"
+        params = list(depois_de)
+    sql += f" ORDER BY {campos} LIMIT {int(limite)}"
+    cursor = conn_mysql.cursor(pymysql.cursors.SSCursor)
+    cursor.execute(sql, params)
+    return cursor
+
+
+def ler_faixas(conn_mysql, tabela, chave, cursor, indices_chave, orcamento_bytes, conversores=None,
+               limite=LINHAS_POR_FAIXA):
+    """
+    Lotes de todas as faixas a partir do cursor da primeira (aberto com abrir_faixa).
+    Cada faixa termina com commit na conexão remota, para não manter uma transação
+    aberta no servidor durante a cópia inteira.
+    """
+    while True:
+        linhas_faixa = 0
+        ultima = None
+        try:
+            for lote in ler_lotes(cursor, orcamento_bytes, conversores):
+                linhas_faixa += len(lote)
+                ultima = [lote[-1][i] for i in indices_chave]
+                yield lote
+        finally:
+            cursor.close()
+        conn_mysql.commit()
+        if linhas_faixa < limite:
+            return
+        cursor = abrir_faixa(conn_mysql, tabela, chave, ultima, limite)
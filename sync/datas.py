@@ -0,0 +1,82 @@
+from sync.copia import citar, tabela_existe
+
+# Chaves de data derivadas das colunas de data mapeadas nos indicadores: colunas
+# geradas (VIRTUAL, não ocupam espaço na tabela) com o mês como inteiro AAAAMM e o
+# dia como número de dias desde 1970-01-01. As consultas filtram por faixas dessas
+# chaves, que podem ser indexadas, em vez de strftime() sobre a coluna original.
+# Datas em texto 'dd/mm/aaaa' (comuns em views) são normalizadas para ISO antes.
+PREFIXO_MES = "_mes_"
+PREFIXO_DIA = "_dia_"
+
+
+def expressao_iso(coluna):
+    c = citar(coluna)
+    return (
+        f"CASE WHEN {c} LIKE '__/__/____%' "
+        f"THEN substr({c}, 7, 4) || '-' || substr({c}, 4, 2) || '-' || substr({c}, 1, 2) ELSE {c} END"
+    )
+
+
+def expressao_mes(coluna):
+    return f"CAST(strftime('%Y%m', {expressao_iso(coluna)}) AS INTEGER)"
+
+
+def expressao_dia(coluna):
+    return f"CAST(julianday(date({expressao_iso(coluna)})) - 2440587.5 AS INTEGER)"
+
+
+def chave_do_periodo(periodo):
+    """
+    'AAAA-MM' -> AAAAMM.
+    """
+    ano, mes = periodo.split("-")
+    return int(ano) * 100 + int(mes)
+
+
+def periodo_da_chave(chave):
+    return f"{chave // 100:04d}-{chave % 100:02d}"
+
+
+def colunas_geradas(conn, tabela):
+    # PRAGMA table_info não lista colunas geradas; table_xinfo marca com hidden 2 ou 3
+    return {c[1] for c in conn.execute(f"PRAGMA table_xinfo({citar(tabela)})").fetchall() if c[6] in (2, 3)}
+
+
+def chave_mes(conn, tabela, coluna):
+    """
+    Operando SQL com o mês AAAAMM da coluna: a coluna derivada quando existir (e
+    puder ser indexada), senão a mesma expressão calculada na consulta.
+    """
+    if coluna and tabela_existe(conn, tabela) and PREFIXO_MES + coluna in colunas_geradas(conn, tabela):
+        return citar(PREFIXO_MES + coluna)
+    return expressao_mes(coluna)
+
+
+def garantir_chaves_data(conn, mapeamentos):
+    """
+    Cria as colunas derivadas das colunas de data dos mapeamentos que ainda não
+    as têm (uma cópia completa recria a tabela sem elas). Colunas que nenhum
+    mapeamento usa mais ficam: são virtuais e não custam espaço. Devolve um
+    relatório das colunas criadas.
+    """
+    relatorio = []
+    vistas = set()
+    for m in mapeamentos:
+        tabela, coluna = m.get("tabela"), m.get("coluna_data")
+        if not tabela or not coluna or (tabela, coluna) in vistas or not tabela_existe(conn, tabela):
+            continue
+        vistas.add((tabela, coluna))
+        colunas = {c[1] for c in conn.execute(f"PRAGMA table_xinfo({citar(tabela)})").fetchall()}
+        if coluna not in colunas:
+            continue
+        for nome, expressao in ((PREFIXO_MES + coluna, expressao_mes(coluna)),
+                                (PREFIXO_DIA + coluna, expressao_dia(coluna))):
+            if nome in colunas:
+                continue
+            conn.execute(
+                f"ALTER TABLE {citar(tabela)} ADD COLUMN {citar(nome)} INTEGER "
+                f"GENERATED ALWAYS AS ({expressao}) VIRTUAL"
+            )
+            relatorio.append({"tabela": tabela, "coluna": nome, "origem": coluna})
+    conn.commit()
+    return relatorio
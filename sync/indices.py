@@ -0,0 +1,219 @@
+import hashlib
+
+from sync.copia import PREFIXO_STAGING, citar, colunas_locais, tabela_existe
+from sync.datas import PREFIXO_MES, colunas_geradas
+from sync.rollups import TABELA_ROLLUP
+from sync.saldos import TABELA_SALDOS
+
+# Índices criados pelo assistente; os demais índices da base nunca são removidos por ele
+PREFIXO_INDICE = "ixa_"
+
+
+def nome_indice(tabela, colunas):
+    resumo = hashlib.sha1(",".join(colunas).encode()).hexdigest()[:8]
+    return f"{PREFIXO_INDICE}{tabela}_{resumo}"
+
+
+def nome_base(nome):
+    # A troca da staging alterna o nome entre "ixa_..." e "_stg_ixa_..."
+    return nome[len(PREFIXO_STAGING):] if nome.startswith(PREFIXO_STAGING) else nome
+
+
+def garantir_tabela_mapeamentos(conn_sqlite):
+    """
+    Mapeamentos dos indicadores, no próprio arquivo de dados (Streamlit e backend).
+    """
+    conn_sqlite.execute("""
+        CREATE TABLE IF NOT EXISTS indicador_mapeamento (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            usuario_id INTEGER,
+            setor TEXT,
+            indicador TEXT,
+            tabela TEXT,
+            coluna_valor TEXT,
+            coluna_data TEXT,
+            coluna_tipo TEXT,
+            valores_entrada TEXT,
+            valores_saida TEXT,
+            coluna_filtro TEXT,
+            valor_filtro TEXT,
+            formula_sql TEXT
+        )
+    """)
+
+
+def carregar_mapeamentos(conn_sqlite):
+    """
+    Mapeamentos de indicadores (indicador_mapeamento) da base, se a tabela existir.
+    """
+    if not tabela_existe(conn_sqlite, "indicador_mapeamento"):
+        return []
+    rows = conn_sqlite.execute(
+        "SELECT indicador, tabela, coluna_valor, coluna_data, coluna_tipo, valores_entrada, valores_saida, "
+        "coluna_filtro, formula_sql FROM indicador_mapeamento"
+    ).fetchall()
+    campos = ("indicador", "tabela", "coluna_valor", "coluna_data", "coluna_tipo", "valores_entrada", "valores_saida",
+              "coluna_filtro", "formula_sql")
+    return [dict(zip(campos, r)) for r in rows]
+
+
+def carregar_relacionamentos(conn_sqlite, empresa_id=None):
+    """
+    (tabela_origem, coluna_origem, tabela_destino, coluna_destino) dos relacionamentos
+    ativos; no banco de controle do backend, filtrados pela empresa.
+    """
+    if not tabela_existe(conn_sqlite, "relacionamentos"):
+        return []
+    colunas = colunas_locais(conn_sqlite, "relacionamentos")
+    sql = "SELECT tabela_origem, coluna_origem, tabela_destino, coluna_destino FROM relacionamentos WHERE 1=1"
+    params = []
+    if "ativo" in colunas:
+        sql += " AND ativo = 1"
+    if empresa_id is not None and "empresa_id" in colunas:
+        sql += " AND empresa_id = ?"
+        params.append(empresa_id)
+    return conn_sqlite.execute(sql, params).fetchall()
+
+
+def planejar_indices(conn_sqlite, mapeamentos, relacionamentos):
+    """
+    Índices que as consultas dos KPIs e os joins dos relacionamentos usam:
+    colunas de igualdade primeiro (filtro e, fora do Saldo em Caixa, tipo),
+    depois a data e as colunas restantes da consulta, para o índice cobrir a
+    leitura sem tocar na tabela. A data entra como a chave de mês derivada
+    (sync.datas) quando a tabela a tem, que é o que as consultas filtram.
+    Devolve {nome: (tabela, colunas, motivo)}.
+    """
+    existentes = {}
+
+    def colunas_da_tabela(tabela):
+        if tabela not in existentes:
+            existentes[tabela] = set()
+            if tabela_existe(conn_sqlite, tabela):
+                existentes[tabela] = set(colunas_locais(conn_sqlite, tabela)) | colunas_geradas(conn_sqlite, tabela)
+        return existentes[tabela]
+
+    candidatos = []
+    for m in mapeamentos:
+        if m.get("formula_sql") or not m.get("tabela"):
+            continue
+        data = m.get("coluna_data")
+        if data and PREFIXO_MES + data in colunas_da_tabela(m["tabela"]):
+            data = PREFIXO_MES + data
+        if m.get("indicador") == "Saldo em Caixa":
+            colunas = [m.get("coluna_filtro"), data, m.get("coluna_tipo"), m.get("coluna_valor")]
+        else:
+            colunas = [m.get("coluna_filtro"), m.get("coluna_tipo"), data, m.get("coluna_valor")]
+        candidatos.append((m["tabela"], colunas, f"indicador {m.get('indicador')}"))
+    for tabela_origem, coluna_origem, tabela_destino, coluna_destino in relacionamentos:
+        motivo = f"relacionamento {tabela_origem}.{coluna_origem} = {tabela_destino}.{coluna_destino}"
+        candidatos.append((tabela_origem, [coluna_origem], motivo))
+        candidatos.append((tabela_destino, [coluna_destino], motivo))
+
+    por_tabela = {}
+    for tabela, colunas, motivo in candidatos:
+        vistas = []
+        for c in colunas:
+            if c and c in colunas_da_tabela(tabela) and c not in vistas:
+                vistas.append(c)
+        if vistas:
+            por_tabela.setdefault(tabela, {}).setdefault(tuple(vistas), []).append(motivo)
+
+    planejados = {}
+    for tabela, indices in por_tabela.items():
+        for colunas, motivos in indices.items():
+            # Um índice que é prefixo de outro da mesma tabela é redundante
+            if any(outro != colunas and outro[:len(colunas)] == colunas for outro in indices):
+                continue
+            planejados[nome_indice(tabela, colunas)] = (tabela, colunas, "; ".join(sorted(set(motivos))))
+    return planejados
+
+
+def tamanho_indices(conn_sqlite):
+    """
+    Bytes ocupados por índice (tabela virtual dbstat); vazio se o SQLite não tiver dbstat.
+    """
+    try:
+        rows = conn_sqlite.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall()
+    except Exception:
+        return {}
+    return dict(rows)
+
+
+def aplicar_indices(conn_sqlite, planejados):
+    """
+    Cria os índices planejados que faltam e remove os do assistente que nenhum
+    mapeamento ou relacionamento usa mais. Devolve um relatório por índice com
+    a ação e o tamanho em bytes.
+    """
+    atuais = {
+        nome_base(nome): (nome, tabela)
+        for nome, tabela in conn_sqlite.execute(
+            "SELECT name, tbl_name FROM sqlite_master WHERE type='index' AND name LIKE ?",
+            (f"%{PREFIXO_INDICE}%",)
+        ).fetchall()
+        if nome_base(nome).startswith(PREFIXO_INDICE)
+    }
+    relatorio = []
+    for base, (nome, tabela) in atuais.items():
+        if base not in planejados:
+            conn_sqlite.execute(f"DROP INDEX IF EXISTS {citar(nome)}")
+            relatorio.append({"indice": nome, "tabela": tabela, "colunas": None, "motivo": None, "acao": "removido"})
+    criados = False
+    for nome, (tabela, colunas, motivo) in planejados.items():
+        if nome in atuais:
+            relatorio.append({"indice": atuais[nome][0], "tabela": tabela, "colunas": list(colunas),
+                              "motivo": motivo, "acao": "mantido"})
+            continue
+        campos = ", ".join(citar(c) for c in colunas)
+        conn_sqlite.execute(f"CREATE INDEX IF NOT EXISTS {citar(nome)} ON {citar(tabela)} ({campos})")
+        criados = True
+        relatorio.append({"indice": nome, "tabela": tabela, "colunas": list(colunas), "motivo": motivo,
+                          "acao": "criado"})
+    conn_sqlite.commit()
+    if criados:
+        # Atualiza as estatísticas que o planejador usa para escolher os índices novos
+        conn_sqlite.execute("PRAGMA optimize")
+    tamanhos = tamanho_indices(conn_sqlite)
+    for item in relatorio:
+        item["bytes"] = tamanhos.get(item["indice"]) if item["acao"] != "removido" else 0
+    return relatorio
+
+
+def listar_indices(conn_sqlite):
+    """
+    Todos os índices nomeados da base com tabela, colunas, tamanho e se são do assistente.
+    """
+    tamanhos = tamanho_indices(conn_sqlite)
+    indices = []
+    for nome, tabela in conn_sqlite.execute(
+        "SELECT name, tbl_name FROM sqlite_master WHERE type='index' AND sql IS NOT NULL ORDER BY tbl_name, name"
+    ).fetchall():
+        colunas = [r[2] for r in conn_sqlite.execute(f"PRAGMA index_info({citar(nome)})").fetchall()]
+        indices.append({
+            "indice": nome, "tabela": tabela, "colunas": colunas, "bytes": tamanhos.get(nome),
+            "assistente": nome_base(nome).startswith(PREFIXO_INDICE),
+        })
+    return indices
+
+
+def indices_quentes(conn_sqlite):
+    """
+    (nome, tabela) dos índices que as leituras dos indicadores usam: os do
+    assistente e os dos rollups e livros de saldo.
+    """
+    return [
+        (nome, tabela)
+        for nome, tabela in conn_sqlite.execute(
+            "SELECT name, tbl_name FROM sqlite_master WHERE type='index' AND sql IS NOT NULL ORDER BY tbl_name, name"
+        ).fetchall()
+        if nome_base(nome).startswith(PREFIXO_INDICE) or tabela in (TABELA_ROLLUP, TABELA_SALDOS)
+    ]
+
+
+def tocar_indice(conn_sqlite, nome, tabela):
+    """
+    Percorre o índice inteiro (COUNT(*) forçado por ele), trazendo as páginas do
+    disco para o cache do sistema antes da primeira consulta. Devolve as linhas.
+    """
+    return conn_sqlite.execute(f"SELECT COUNT(*) FROM {citar(tabela)} INDEXED BY {citar(nome)}").fetchone()[0]
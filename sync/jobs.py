@@ -0,0 +1,166 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from sync.paralelo import resumir
+
+# Jobs de sincronização executando ao mesmo tempo
+JOBS_WORKERS = 2
+# Segundos que um job finalizado continua consultável
+RETENCAO_JOBS = 3600
+
+ATIVOS = ("pendente", "executando")
+
+
+class JobDuplicado(Exception):
+    def __init__(self, job):
+        super().__init__(f"Já existe o job {job.id} sincronizando estas tabelas.")
+        self.job = job
+
+
+class JobSincronizacao:
+    def __init__(self, empresa_id, tabelas):
+        self.id = uuid.uuid4().hex
+        self.empresa_id = empresa_id
+        self.tabelas = list(tabelas)
+        self.status = "pendente"
+        self.criado_em = time.time()
+        self.iniciado_em = None
+        self.concluido_em = None
+        self.erro = None
+        self.resultado = None
+        self.tabelas_progresso = {
+            t: {"status": "pendente", "linhas": 0, "estimativa_linhas": None,
+                "linhas_por_segundo": None, "eta_segundos": None, "erro": None}
+            for t in self.tabelas
+        }
+        self._inicios = {}
+        self._versao = 0
+        self._cond = threading.Condition()
+
+    def atualizar_tabela(self, tabela, evento, resultado):
+        """
+        Callback de progresso do sincronizar_paralelo (thread gravadora).
+        """
+        with self._cond:
+            progresso = self.tabelas_progresso.setdefault(tabela, {
+                "status": "pendente", "linhas": 0, "estimativa_linhas": None,
+                "linhas_por_segundo": None, "eta_segundos": None, "erro": None,
+            })
+            agora = time.monotonic()
+            if evento == "inicio":
+                self._inicios[tabela] = agora
+                progresso["status"] = "copiando"
+                progresso["estimativa_linhas"] = resultado.get("estimativa_linhas")
+                # Na retomada de uma cópia interrompida, as linhas já gravadas contam
+                progresso["linhas"] = resultado["linhas"]
+            elif evento == "lote":
+                progresso["linhas"] = resultado["linhas"]
+                decorrido = agora - self._inicios.get(tabela, agora)
+                if decorrido > 0:
+                    velocidade = (resultado["linhas"] - (resultado.get("retomada_de") or 0)) / decorrido
+                    progresso["linhas_por_segundo"] = round(velocidade, 1)
+                    estimativa = progresso["estimativa_linhas"]
+                    if estimativa and velocidade > 0:
+                        progresso["eta_segundos"] = round(max(0, estimativa - resultado["linhas"]) / velocidade, 1)
+            elif evento == "fim":
+                progresso["status"] = "concluida"
+                progresso["linhas"] = resultado["linhas"]
+                progresso["eta_segundos"] = 0
+            elif evento == "pulada":
+                progresso["status"] = "sem_mudanca"
+                progresso["eta_segundos"] = 0
+            elif evento == "erro":
+                progresso["status"] = "falhou"
+                progresso["erro"] = resultado.get("erro")
+                progresso["retomavel"] = resultado.get("retomavel", False)
+            self._versao += 1
+            self._cond.notify_all()
+
+    def _mudar_status(self, status, **campos):
+        with self._cond:
+            self.status = status
+            for nome, valor in campos.items():
+                setattr(self, nome, valor)
+            self._versao += 1
+            self._cond.notify_all()
+
+    def aguardar_mudanca(self, versao, timeout=15):
+        """
+        Bloqueia até o job mudar em relação a versao (ou timeout); devolve a versão atual.
+        """
+        with self._cond:
+            if self._versao == versao and self.status in ATIVOS:
+                self._cond.wait(timeout)
+            return self._versao
+
+    def como_dict(self):
+        with self._cond:
+            return {
+                "job_id": self.id,
+                "empresa_id": self.empresa_id,
+                "status": self.status,
+                "tabelas": {t: dict(p) for t, p in self.tabelas_progresso.items()},
+                "criado_em": self.criado_em,
+                "iniciado_em": self.iniciado_em,
+                "concluido_em": self.concluido_em,
+                "erro": self.erro,
+                "resumo": resumir(self.resultado) if self.resultado else None,
+                "resultado": self.resultado,
+            }
+
+
+class GerenciadorJobs:
+    """
+    Executa sincronizações como jobs em um pool próprio, fora da thread da requisição.
+    Uma empresa não pode ter dois jobs ativos com tabelas em comum.
+    """
+
+    def __init__(self, max_workers=JOBS_WORKERS, retencao=RETENCAO_JOBS):
+        self.retencao = retencao
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sync-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def criar(self, empresa_id, tabelas, executar):
+        """
+        executar(job) roda a sincronização e devolve o resultado; o progresso por
+        tabela chega por job.atualizar_tabela.
+        """
+        with self._lock:
+            self._expurgar()
+            for existente in self._jobs.values():
+                if (existente.empresa_id == empresa_id and existente.status in ATIVOS
+                        and set(existente.tabelas) & set(tabelas)):
+                    raise JobDuplicado(existente)
+            job = JobSincronizacao(empresa_id, tabelas)
+            self._jobs[job.id] = job
+        self._executor.submit(self._rodar, job, executar)
+        return job
+
+    def obter(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def listar(self, empresa_id):
+        with self._lock:
+            return [j for j in self._jobs.values() if j.empresa_id == empresa_id]
+
+    def encerrar(self):
+        self._executor.shutdown(wait=False)
+
+    def _rodar(self, job, executar):
+        job._mudar_status("executando", iniciado_em=time.time())
+        try:
+            resultado = executar(job)
+            falhou = any(r.get("erro") for r in resultado or [])
+            job._mudar_status("concluido_com_falhas" if falhou else "concluido",
+                              resultado=resultado, concluido_em=time.time())
+        except Exception as e:
+            job._mudar_status("falhou", erro=getattr(e, "detail", None) or str(e), concluido_em=time.time())
+
+    def _expurgar(self):
+        limite = time.time() - self.retencao
+        for job_id in [j.id for j in self._jobs.values() if j.concluido_em and j.concluido_em < limite]:
+            del self._jobs[job_id]
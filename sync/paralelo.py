@@ -0,0 +1,390 @@
+import queue
+import threading
+import time
+
+import pymysql.cursors
+
+from sync.copia import (
+    LIMIAR_PAGINACAO_LINHAS, LINHAS_POR_FAIXA, ORCAMENTO_MEMORIA_MB, abrir_faixa, apagar_checkpoint,
+    calcular_fingerprint, citar, colunas_locais, criar_tabela_destino, descartar_staging, estimar_bytes_linha,
+    garantir_checkpoints, garantir_indice_chave, estimar_linhas, gravar_checkpoint, ler_checkpoint, ler_faixas, ler_lotes, maior_valor,
+    nome_staging, sql_insert, tabela_existe, trocar_tabela,
+)
+from sync.tipos import alinhar_ao_cursor, chave_paginavel, ler_esquema_remoto
+
+WORKERS_PADRAO = 4
+# Consultas simultâneas permitidas em um mesmo servidor MySQL (somando todas as sincronizações)
+LIMITE_POR_HOST = 4
+# Lotes lidos aguardando o gravador
+FILA_MAXIMA = 8
+# Compara a impressão digital remota com a da última cópia e pula tabelas sem mudança
+DETECTAR_MUDANCAS = True
+
+_semaforos_host = {}
+_lock_semaforos = threading.Lock()
+
+
+def semaforo_do_host(host, limite=LIMITE_POR_HOST):
+    with _lock_semaforos:
+        if host not in _semaforos_host:
+            _semaforos_host[host] = threading.BoundedSemaphore(limite)
+        return _semaforos_host[host]
+
+
+def preparar_tarefa(conn_sqlite, tarefa):
+    """
+    Decide o modo efetivo de uma tarefa com base no SQLite local (thread do gravador).
+    Incremental só vale quando já existe watermark e a tabela local.
+    """
+    tarefa = dict(tarefa)
+    tarefa["chave_primaria"] = list(tarefa.get("chave_primaria") or [])
+    incremental = (
+        tarefa.get("modo") == "incremental"
+        and tarefa.get("coluna_watermark")
+        and tarefa.get("ultimo_watermark") is not None
+        and tabela_existe(conn_sqlite, tarefa["tabela"])
+    )
+    tarefa["modo"] = "incremental" if incremental else "completo"
+    tarefa["colunas_locais"] = colunas_locais(conn_sqlite, tarefa["tabela"]) if incremental else None
+    if not tabela_existe(conn_sqlite, tarefa["tabela"]):
+        tarefa["fingerprint"] = None
+    # Cópia completa interrompida: continua da última faixa gravada na staging
+    checkpoint = ler_checkpoint(conn_sqlite, tarefa["tabela"])
+    staging = nome_staging(tarefa["tabela"])
+    tarefa["retomar"] = None
+    if checkpoint and not incremental and tabela_existe(conn_sqlite, staging):
+        checkpoint["colunas_staging"] = colunas_locais(conn_sqlite, staging)
+        tarefa["retomar"] = checkpoint
+        tarefa["fingerprint"] = None
+    return tarefa
+
+
+def _abrir_paginada(conn_mysql, tarefa, esquema, chave):
+    """
+    Abre a primeira faixa da leitura por chave; na retomada, a faixa seguinte ao
+    checkpoint, desde que colunas e chave sejam as mesmas da staging.
+    Devolve (cursor, colunas, conversores, retomar).
+    """
+    tabela = tarefa["tabela"]
+    retomar = tarefa.get("retomar")
+    if retomar and retomar["colunas_chave"] == chave and retomar["ultima_chave"] is not None:
+        cursor = abrir_faixa(conn_mysql, tabela, chave, retomar["ultima_chave"], LINHAS_POR_FAIXA)
+        colunas, conversores = alinhar_ao_cursor(esquema, cursor)
+        if [nome for nome, _ in colunas] == retomar["colunas_staging"]:
+            return cursor, colunas, conversores, retomar
+        cursor.close()
+    cursor = abrir_faixa(conn_mysql, tabela, chave, limite=LINHAS_POR_FAIXA)
+    colunas, conversores = alinhar_ao_cursor(esquema, cursor)
+    return cursor, colunas, conversores, None
+
+
+def _executar_leitura(conn_mysql, tarefa, esquema, orcamento_bytes, estimativa=None):
+    """
+    Abre a leitura; devolve (cursor, lotes, colunas, modo, paginacao). paginacao é
+    None ou {"chave", "indices", "retomar"} quando a cópia completa é feita por faixas:
+    com chave usável (a do MySQL ou, em views, a configurada na tarefa) e tabela
+    grande ou de tamanho desconhecido (views não têm estimativa).
+    """
+    tabela = tarefa["tabela"]
+    if tarefa["modo"] == "completo":
+        chave = chave_paginavel(esquema) or chave_paginavel({**esquema, "chave_primaria": tarefa["chave_primaria"]})
+        grande = estimativa is None or estimativa >= LIMIAR_PAGINACAO_LINHAS
+        if chave and (tarefa.get("retomar") or grande):
+            cursor, colunas, conversores, retomar = _abrir_paginada(conn_mysql, tarefa, esquema, chave)
+            nomes = [nome for nome, _ in colunas]
+            indices = [nomes.index(c) for c in chave]
+            lotes = ler_faixas(conn_mysql, tabela, chave, cursor, indices, orcamento_bytes, conversores,
+                               LINHAS_POR_FAIXA)
+            return cursor, lotes, colunas, "completo", {"chave": chave, "indices": indices, "retomar": retomar}
+    cursor = conn_mysql.cursor(pymysql.cursors.SSCursor)
+    if tarefa["modo"] == "incremental":
+        operador = ">=" if tarefa["chave_primaria"] else ">"
+        cursor.execute(
+            f"SELECT * FROM {citar(tabela)} WHERE {citar(tarefa['coluna_watermark'])} {operador} %s",
+            (tarefa["ultimo_watermark"],)
+        )
+        colunas, conversores = alinhar_ao_cursor(esquema, cursor)
+        if [nome for nome, _ in colunas] == tarefa["colunas_locais"]:
+            return cursor, ler_lotes(cursor, orcamento_bytes, conversores), colunas, "incremental", None
+        # Estrutura mudou no servidor: volta para a cópia completa
+        cursor.close()
+        cursor = conn_mysql.cursor(pymysql.cursors.SSCursor)
+    cursor.execute(f"SELECT * FROM {citar(tabela)}")
+    colunas, conversores = alinhar_ao_cursor(esquema, cursor)
+    return cursor, ler_lotes(cursor, orcamento_bytes, conversores), colunas, "completo", None
+
+
+def _ler_tabela(conn_mysql, tarefa, fila_lotes, orcamento_bytes, canceladas, detectar_mudancas, metricas):
+    """
+    Lê uma tabela e envia os lotes ao gravador. metricas recebe o tempo gasto
+    lendo do servidor (consulta + fetch + conversão) e os bytes lidos (estimativa
+    do tamanho das linhas em memória).
+    """
+    tabela = tarefa["tabela"]
+    fingerprint = None
+    if detectar_mudancas:
+        # Calculada antes da leitura: se a tabela mudar durante a cópia, a próxima sincronização copia de novo
+        fingerprint = calcular_fingerprint(conn_mysql, tabela, tarefa.get("coluna_watermark"))
+        if fingerprint is not None and fingerprint == tarefa.get("fingerprint"):
+            fila_lotes.put(("pulada", tabela, fingerprint))
+            return
+    estimativa = estimar_linhas(conn_mysql, tabela) if tarefa["modo"] == "completo" else None
+    esquema = ler_esquema_remoto(conn_mysql, tabela, tarefa.get("colunas_centavos") or ())
+    cursor, lotes, colunas, modo, paginacao = _executar_leitura(conn_mysql, tarefa, esquema, orcamento_bytes,
+                                                                estimativa)
+    if paginacao and paginacao["retomar"]:
+        # Vale a impressão digital do início da cópia: se a tabela mudou desde então,
+        # a próxima sincronização copia de novo
+        fingerprint = paginacao["retomar"]["fingerprint"]
+    try:
+        fila_lotes.put(("inicio", tabela, (colunas, modo, estimativa, esquema["chave_primaria"], paginacao,
+                                           fingerprint)))
+        nomes = [nome for nome, _ in colunas]
+        coluna_watermark = tarefa.get("coluna_watermark")
+        indice = nomes.index(coluna_watermark) if coluna_watermark in nomes else None
+        watermark = None
+        while True:
+            inicio_lote = time.monotonic()
+            lote = next(lotes, None)
+            metricas["segundos_leitura"] += time.monotonic() - inicio_lote
+            if lote is None:
+                break
+            metricas["bytes"] += int(estimar_bytes_linha(lote) * len(lote))
+            if tabela in canceladas:
+                return
+            if indice is not None:
+                watermark = maior_valor(watermark, lote, indice)
+            fila_lotes.put(("lote", tabela, lote))
+        if watermark is None and modo == "incremental":
+            watermark = tarefa["ultimo_watermark"]
+        fila_lotes.put(("fim", tabela, (watermark, fingerprint, metricas)))
+    finally:
+        lotes.close()
+        cursor.close()
+
+
+def _trabalhador(fila_tarefas, fila_lotes, abrir_conexao_remota, semaforo, orcamento_bytes, canceladas,
+                 detectar_mudancas):
+    conn_mysql = None
+    latencia = None
+    try:
+        while True:
+            try:
+                tarefa = fila_tarefas.get_nowait()
+            except queue.Empty:
+                break
+            with semaforo:
+                metricas = {"segundos_leitura": 0.0, "bytes": 0, "latencia_conexao": None}
+                try:
+                    if conn_mysql is None:
+                        inicio_conexao = time.monotonic()
+                        conn_mysql = abrir_conexao_remota()
+                        latencia = time.monotonic() - inicio_conexao
+                    metricas["latencia_conexao"] = latencia
+                    _ler_tabela(conn_mysql, tarefa, fila_lotes, orcamento_bytes, canceladas, detectar_mudancas,
+                                metricas)
+                except Exception as e:
+                    fila_lotes.put(("erro", tarefa["tabela"], (str(e), metricas)))
+                    # A conexão pode ter ficado com resultado pendente; abre outra na próxima tarefa
+                    if conn_mysql is not None:
+                        try:
+                            conn_mysql.close()
+                        except Exception:
+                            pass
+                    conn_mysql = None
+    finally:
+        if conn_mysql is not None:
+            try:
+                conn_mysql.close()
+            except Exception:
+                pass
+        fila_lotes.put(("saida", None, None))
+
+
+def sincronizar_paralelo(tarefas, abrir_conexao_remota, conn_sqlite, host=None, workers=WORKERS_PADRAO,
+                         limite_por_host=LIMITE_POR_HOST, orcamento_memoria_mb=ORCAMENTO_MEMORIA_MB,
+                         ao_progresso=None, detectar_mudancas=DETECTAR_MUDANCAS):
+    """
+    Sincroniza várias tabelas em paralelo. Cada worker abre a sua conexão remota
+    (abrir_conexao_remota) e lê as tabelas em lotes; a thread que chama esta função
+    é a única gravadora e é dona de conn_sqlite.
+
+    tarefas: lista de dicts com "tabela" e, opcionalmente, "modo", "coluna_watermark",
+    "ultimo_watermark", "chave_primaria", "colunas_centavos" (DECIMAL gravados como
+    inteiros em centavos) e "fingerprint" (da última cópia). Tabelas
+    cuja impressão digital remota não mudou são puladas sem ler dados.
+
+    Cada tabela é carregada na sua staging e publicada com trocar_tabela ao terminar;
+    em caso de falha a staging é descartada e a versão publicada fica intacta.
+    Tabelas grandes com chave primária são lidas por faixas da chave: se a leitura
+    falhar, a staging fica com um checkpoint da última faixa gravada e a próxima
+    sincronização continua dali (resultado "retomavel" e, depois, "retomada_de").
+
+    ao_progresso(tabela, evento, resultado), se informado, é chamado na thread
+    gravadora a cada "inicio", "lote", "fim" e "erro".
+
+    Retorna um resultado por tabela (linhas, lotes, watermark, fingerprint, pulada,
+    segundos, erro e a telemetria: bytes, segundos_leitura, segundos_gravacao,
+    segundos_indices, latencia_conexao, linhas_por_segundo); a falha de uma
+    tabela não interrompe as demais.
+    """
+    garantir_checkpoints(conn_sqlite)
+    conn_sqlite.commit()
+    tarefas = [preparar_tarefa(conn_sqlite, t) for t in tarefas]
+    if not tarefas:
+        return []
+    workers = max(1, min(workers, len(tarefas)))
+    # O orçamento cobre os lotes na fila e o lote que cada worker está montando
+    orcamento_bytes = orcamento_memoria_mb * 1024 * 1024 // (FILA_MAXIMA + workers)
+    semaforo = semaforo_do_host(host, limite_por_host)
+
+    fila_tarefas = queue.Queue()
+    for tarefa in tarefas:
+        fila_tarefas.put(tarefa)
+    fila_lotes = queue.Queue(maxsize=FILA_MAXIMA)
+    canceladas = set()
+
+    threads = [
+        threading.Thread(
+            target=_trabalhador,
+            args=(fila_tarefas, fila_lotes, abrir_conexao_remota, semaforo, orcamento_bytes, canceladas,
+                  detectar_mudancas),
+            daemon=True,
+        )
+        for _ in range(workers)
+    ]
+    inicio_geral = time.monotonic()
+    for t in threads:
+        t.start()
+
+    por_tabela = {t["tabela"]: t for t in tarefas}
+    resultados = {
+        t["tabela"]: {"tabela": t["tabela"], "modo": t["modo"], "linhas": 0, "lotes": 0,
+                      "estimativa_linhas": None, "watermark": None, "fingerprint": None, "pulada": False,
+                      "segundos": None, "erro": None, "retomada_de": None, "retomavel": False,
+                      "bytes": 0, "segundos_leitura": None, "segundos_gravacao": 0.0, "segundos_indices": None,
+                      "latencia_conexao": None, "linhas_por_segundo": None}
+        for t in tarefas
+    }
+    inicios = {}
+    inserts = {}
+    substituir = {}
+    paginadas = {}
+    ativos = workers
+    while ativos:
+        tipo, tabela, dado = fila_lotes.get()
+        if tipo == "saida":
+            ativos -= 1
+            continue
+        resultado = resultados[tabela]
+        if tabela in canceladas and tipo != "erro":
+            continue
+        try:
+            if tipo == "inicio":
+                colunas, modo, estimativa, chave_remota, paginacao, fingerprint = dado
+                nomes = [nome for nome, _ in colunas]
+                inicios[tabela] = time.monotonic()
+                resultado["modo"] = modo
+                resultado["estimativa_linhas"] = estimativa
+                chave = por_tabela[tabela]["chave_primaria"]
+                # Com chave primária declarada no destino, o delta precisa ser upsert
+                substituir[tabela] = bool(chave or chave_remota)
+                if modo == "incremental" and chave:
+                    garantir_indice_chave(conn_sqlite, tabela, chave)
+                if paginacao:
+                    paginadas[tabela] = paginacao
+                if paginacao and paginacao["retomar"]:
+                    resultado["retomada_de"] = resultado["linhas"] = paginacao["retomar"]["linhas"]
+                else:
+                    apagar_checkpoint(conn_sqlite, tabela)
+                    criar_tabela_destino(conn_sqlite, nome_staging(tabela), colunas, chave_remota)
+                    if paginacao:
+                        gravar_checkpoint(conn_sqlite, tabela, paginacao["chave"], None, 0, fingerprint)
+                conn_sqlite.commit()
+                inserts[tabela] = sql_insert(nome_staging(tabela), nomes)
+            elif tipo == "lote":
+                inicio_gravacao = time.monotonic()
+                conn_sqlite.executemany(inserts[tabela], dado)
+                resultado["linhas"] += len(dado)
+                resultado["lotes"] += 1
+                paginacao = paginadas.get(tabela)
+                if paginacao:
+                    ultima = [dado[-1][i] for i in paginacao["indices"]]
+                    gravar_checkpoint(conn_sqlite, tabela, paginacao["chave"], ultima, resultado["linhas"])
+                conn_sqlite.commit()
+                resultado["segundos_gravacao"] += time.monotonic() - inicio_gravacao
+            elif tipo == "fim":
+                watermark, resultado["fingerprint"], metricas = dado
+                _registrar_metricas(resultado, metricas)
+                coluna_watermark = por_tabela[tabela].get("coluna_watermark")
+                if resultado["retomada_de"] and coluna_watermark:
+                    # As faixas gravadas antes da interrupção também contam para o watermark
+                    anterior = conn_sqlite.execute(
+                        f"SELECT MAX({citar(coluna_watermark)}) FROM {citar(nome_staging(tabela))}"
+                    ).fetchone()[0]
+                    watermark = maior_valor(watermark, [(anterior,)], 0)
+                inicio_troca = time.monotonic()
+                # Na cópia completa a troca recria os índices na staging: é o tempo de indexação
+                trocar_tabela(conn_sqlite, tabela, resultado["modo"], substituir=substituir[tabela])
+                apagar_checkpoint(conn_sqlite, tabela)
+                conn_sqlite.commit()
+                resultado["segundos_indices"] = round(time.monotonic() - inicio_troca, 3)
+                resultado["watermark"] = watermark
+                resultado["segundos"] = round(time.monotonic() - inicios[tabela], 3)
+                copiadas = resultado["linhas"] - (resultado["retomada_de"] or 0)
+                if resultado["segundos"]:
+                    resultado["linhas_por_segundo"] = round(copiadas / resultado["segundos"], 1)
+            elif tipo == "pulada":
+                resultado["pulada"] = True
+                resultado["fingerprint"] = dado
+                resultado["watermark"] = por_tabela[tabela].get("ultimo_watermark")
+                resultado["segundos"] = 0
+            elif tipo == "erro":
+                resultado["erro"], metricas = dado
+                _registrar_metricas(resultado, metricas)
+                if (tabela in paginadas or por_tabela[tabela]["retomar"]) and tabela not in canceladas:
+                    # Falha na leitura (mesmo antes de começar, ex.: servidor fora do ar na
+                    # retomada): staging e checkpoint ficam para a próxima tentativa
+                    conn_sqlite.rollback()
+                    resultado["retomavel"] = True
+                else:
+                    descartar_staging(conn_sqlite, tabela)
+        except Exception as e:
+            canceladas.add(tabela)
+            resultado["erro"] = str(e)
+            descartar_staging(conn_sqlite, tabela)
+            apagar_checkpoint(conn_sqlite, tabela)
+            conn_sqlite.commit()
+        if resultado["erro"] and resultado["segundos"] is None:
+            resultado["segundos"] = round(time.monotonic() - inicios.get(tabela, inicio_geral), 3)
+        if ao_progresso:
+            ao_progresso(tabela, "erro" if resultado["erro"] else tipo, resultado)
+
+    for t in threads:
+        t.join()
+    for resultado in resultados.values():
+        resultado["segundos_gravacao"] = round(resultado["segundos_gravacao"], 3)
+    return [resultados[t["tabela"]] for t in tarefas]
+
+
+def _registrar_metricas(resultado, metricas):
+    resultado["bytes"] = metricas["bytes"]
+    resultado["segundos_leitura"] = round(metricas["segundos_leitura"], 3)
+    if metricas["latencia_conexao"] is not None:
+        resultado["latencia_conexao"] = round(metricas["latencia_conexao"], 4)
+
+
+def resumir(resultados):
+    """
+    Totais de uma sincronização; segundos_economizados soma a duração da última
+    cópia das tabelas puladas (campo "ultima_duracao" do resultado, quando houver).
+    """
+    puladas = [r for r in resultados if r.get("pulada")]
+    return {
+        "tabelas": len(resultados),
+        "copiadas": sum(1 for r in resultados if not r.get("pulada") and not r.get("erro")),
+        "puladas": len(puladas),
+        "falhas": sum(1 for r in resultados if r.get("erro")),
+        "linhas": sum(r.get("linhas") or 0 for r in resultados),
+        "segundos_economizados": round(sum(r.get("ultima_duracao") or 0 for r in puladas), 3),
+    }
@@ -0,0 +1,342 @@
+import hashlib
+import json
+import re
+import time
+
+from sync.copia import citar, colunas_locais, tabela_existe
+from sync.datas import chave_do_periodo, chave_mes, periodo_da_chave
+
+# Agregados mensais dos indicadores mapeados, refeitos a cada sincronização.
+# Uma "origem" é a combinação (tabela, data, valor, tipo, filtro) de um mapeamento;
+# mapeamentos com as mesmas colunas compartilham o rollup.
+TABELA_ROLLUP = "_sync_rollup_mensal"
+TABELA_ORIGENS = "_sync_rollup_origem"
+# Rollups com mais linhas que isso (tipo/filtro com muitos valores) não compensam
+MAX_LINHAS_ROLLUP = 100_000
+# Literal numérico que o SQLite converte ao comparar com uma coluna numérica
+RE_NUMERO = re.compile(r"^\s*[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?\s*$")
+
+
+def origem_do_mapeamento(m):
+    """
+    (tabela, coluna_data, coluna_valor, coluna_tipo, coluna_filtro) de um mapeamento,
+    ou None quando ele não pode ser agregado (fórmula SQL própria, colunas faltando).
+    """
+    if m.get("formula_sql") or not (m.get("tabela") and m.get("coluna_data") and m.get("coluna_valor")):
+        return None
+    return (m["tabela"], m["coluna_data"], m["coluna_valor"], m.get("coluna_tipo") or None,
+            m.get("coluna_filtro") or None)
+
+
+def id_origem(origem):
+    return hashlib.sha1(json.dumps(origem).encode()).hexdigest()[:12]
+
+
+def afinidade(conn, tabela, coluna):
+    """
+    Afinidade da coluna no SQLite (INTEGER, REAL, NUMERIC, TEXT ou BLOB), pelas
+    regras do tipo declarado. Decide como um texto comparado com ela é convertido.
+    """
+    if not coluna:
+        return None
+    declarado = next(
+        (c[2] for c in conn.execute(f"PRAGMA table_xinfo({citar(tabela)})").fetchall() if c[1] == coluna), ""
+    ).upper()
+    if "INT" in declarado:
+        return "INTEGER"
+    if any(t in declarado for t in ("CHAR", "CLOB", "TEXT")):
+        return "TEXT"
+    if "BLOB" in declarado or not declarado:
+        return "BLOB"
+    if any(t in declarado for t in ("REAL", "FLOA", "DOUB")):
+        return "REAL"
+    return "NUMERIC"
+
+
+def comparavel(valor, afinidade_coluna):
+    """
+    O valor do mapeamento (texto) como o SQLite o compara com uma coluna dessa
+    afinidade na tabela de origem: '1' vira 1 numa coluna INTEGER e 1.0 numa REAL.
+    """
+    if not isinstance(valor, str) or afinidade_coluna not in ("INTEGER", "REAL", "NUMERIC"):
+        return valor
+    if not RE_NUMERO.match(valor):
+        return valor
+    texto = valor.strip()
+    if afinidade_coluna == "REAL":
+        return float(texto)
+    if re.fullmatch(r"[+-]?\d+", texto):
+        return int(texto)
+    numero = float(texto)
+    return int(numero) if numero.is_integer() and abs(numero) < 2 ** 63 else numero
+
+
+def garantir_tabelas_rollup(conn):
+    # Rollups de antes das afinidades guardavam tipo/filtro sem tipo: são refeitos do zero
+    if tabela_existe(conn, TABELA_ORIGENS) and "afinidade_tipo" not in colunas_locais(conn, TABELA_ORIGENS):
+        conn.execute(f"DROP TABLE IF EXISTS {TABELA_ROLLUP}")
+        conn.execute(f"DROP TABLE {TABELA_ORIGENS}")
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABELA_ORIGENS} (
+            origem TEXT PRIMARY KEY,
+            tabela TEXT,
+            coluna_data TEXT,
+            coluna_valor TEXT,
+            coluna_tipo TEXT,
+            coluna_filtro TEXT,
+            afinidade_tipo TEXT,     -- afinidade das colunas na tabela de origem (ver comparavel)
+            afinidade_filtro TEXT,
+            linhas INTEGER,
+            atualizado_em REAL
+        )
+    """)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABELA_ROLLUP} (
+            origem TEXT,
+            mes TEXT,                -- 'YYYY-MM'
+            tipo TEXT,               -- CAST do valor da origem; a consulta compara com CAST(? AS TEXT)
+            filtro TEXT,
+            soma REAL,
+            linhas INTEGER,
+            acumulado REAL           -- soma corrente por (tipo, filtro) até o mês, para saldos
+        )
+    """)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS ix_rollup_origem_mes ON {TABELA_ROLLUP} (origem, mes)")
+
+
+def mes_inicial_alterado(conn, tabela, coluna_data, coluna_watermark, desde_watermark):
+    """
+    Primeiro mês com linhas trazidas por uma sincronização incremental (watermark
+    a partir do valor anterior). None se não houver como saber.
+    """
+    if not coluna_watermark or desde_watermark is None:
+        return None
+    row = conn.execute(
+        f"SELECT MIN({chave_mes(conn, tabela, coluna_data)}) FROM {citar(tabela)} "
+        f"WHERE {citar(coluna_watermark)} >= ?",
+        (desde_watermark,)
+    ).fetchone()
+    return periodo_da_chave(row[0]) if row and row[0] is not None else None
+
+
+def _reconstruir(conn, chave, origem, desde=None):
+    tabela, coluna_data, coluna_valor, coluna_tipo, coluna_filtro = origem
+    mes = chave_mes(conn, tabela, coluna_data)
+    tipo = f"CAST({citar(coluna_tipo)} AS TEXT)" if coluna_tipo else "NULL"
+    filtro = f"CAST({citar(coluna_filtro)} AS TEXT)" if coluna_filtro else "NULL"
+    condicoes = [f"{mes} IS NOT NULL"]
+    params = [chave]
+    if desde:
+        conn.execute(f"DELETE FROM {TABELA_ROLLUP} WHERE origem = ? AND mes >= ?", (chave, desde))
+        condicoes.append(f"{mes} >= ?")
+        params.append(chave_do_periodo(desde))
+    else:
+        conn.execute(f"DELETE FROM {TABELA_ROLLUP} WHERE origem = ?", (chave,))
+    conn.execute(
+        f"""
+        INSERT INTO {TABELA_ROLLUP} (origem, mes, tipo, filtro, soma, linhas)
+        SELECT ?, printf('%04d-%02d', {mes} / 100, {mes} % 100), {tipo}, {filtro}, SUM({citar(coluna_valor)}), COUNT(*)
+        FROM {citar(tabela)} WHERE {' AND '.join(condicoes)}
+        GROUP BY 2, 3, 4
+        """,
+        params
+    )
+    # Soma corrente refeita sobre o rollup inteiro (poucas centenas de linhas)
+    conn.execute(
+        f"""
+        UPDATE {TABELA_ROLLUP} SET acumulado = c.acumulado
+        FROM (
+            SELECT rowid AS id, SUM(soma) OVER (PARTITION BY tipo, filtro ORDER BY mes) AS acumulado
+            FROM {TABELA_ROLLUP} WHERE origem = ?
+        ) AS c
+        WHERE {TABELA_ROLLUP}.rowid = c.id AND mes >= ?
+        """,
+        (chave, desde or "")
+    )
+    return conn.execute(f"SELECT COUNT(*) FROM {TABELA_ROLLUP} WHERE origem = ?", (chave,)).fetchone()[0]
+
+
+def remover_rollup(conn, chave):
+    conn.execute(f"DELETE FROM {TABELA_ROLLUP} WHERE origem = ?", (chave,))
+    conn.execute(f"DELETE FROM {TABELA_ORIGENS} WHERE origem = ?", (chave,))
+
+
+def remover_rollups_da_tabela(conn, tabela):
+    if not tabela_existe(conn, TABELA_ORIGENS):
+        return
+    for (chave,) in conn.execute(f"SELECT origem FROM {TABELA_ORIGENS} WHERE tabela = ?", (tabela,)).fetchall():
+        remover_rollup(conn, chave)
+
+
+def atualizar_rollups(conn, mapeamentos, alteradas):
+    """
+    Atualiza os rollups depois de uma sincronização. alteradas: {tabela: None ou
+    (coluna_watermark, watermark_anterior)}. None (cópia completa) refaz os rollups
+    da tabela inteiros; numa cópia incremental só são refeitos os meses a partir do
+    primeiro mês trazido pelo delta (uma linha cuja data mudou para um mês
+    posterior deixa o mês antigo desatualizado até a próxima cópia completa).
+    Origens novas são construídas do zero e as que nenhum mapeamento usa mais são
+    removidas. Devolve um relatório por origem.
+    """
+    garantir_tabelas_rollup(conn)
+    origens = {}
+    for m in mapeamentos:
+        origem = origem_do_mapeamento(m)
+        if origem is not None:
+            origens[id_origem(origem)] = origem
+    existentes = {
+        r[0]: r[1] for r in conn.execute(f"SELECT origem, atualizado_em FROM {TABELA_ORIGENS}").fetchall()
+    }
+    relatorio = []
+    for chave in existentes:
+        if chave not in origens:
+            remover_rollup(conn, chave)
+            relatorio.append({"origem": chave, "tabela": None, "acao": "removido"})
+    for chave, origem in origens.items():
+        tabela = origem[0]
+        nova = chave not in existentes
+        if not nova and tabela not in alteradas:
+            continue
+        colunas = set(colunas_locais(conn, tabela)) if tabela_existe(conn, tabela) else set()
+        if not all(c in colunas for c in origem[1:] if c):
+            remover_rollup(conn, chave)
+            relatorio.append({"origem": chave, "tabela": tabela, "acao": "removido"})
+            continue
+        desde = None
+        if not nova and alteradas.get(tabela):
+            desde = mes_inicial_alterado(conn, tabela, origem[1], *alteradas[tabela])
+        inicio = time.monotonic()
+        linhas = _reconstruir(conn, chave, origem, desde)
+        if linhas > MAX_LINHAS_ROLLUP:
+            remover_rollup(conn, chave)
+            relatorio.append({"origem": chave, "tabela": tabela, "acao": "descartado", "linhas": linhas})
+            continue
+        conn.execute(
+            f"""
+            INSERT INTO {TABELA_ORIGENS}
+                (origem, tabela, coluna_data, coluna_valor, coluna_tipo, coluna_filtro, afinidade_tipo,
+                 afinidade_filtro, linhas, atualizado_em)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(origem) DO UPDATE SET
+                afinidade_tipo = excluded.afinidade_tipo,
+                afinidade_filtro = excluded.afinidade_filtro,
+                linhas = excluded.linhas,
+                atualizado_em = excluded.atualizado_em
+            """,
+            (chave,) + origem + (afinidade(conn, tabela, origem[3]), afinidade(conn, tabela, origem[4]),
+                                 linhas, time.time())
+        )
+        relatorio.append({
+            "origem": chave, "tabela": tabela, "acao": "criado" if nova else ("parcial" if desde else "refeito"),
+            "desde": desde, "linhas": linhas, "segundos": round(time.monotonic() - inicio, 3),
+        })
+    conn.commit()
+    return relatorio
+
+
+def origens_disponiveis(conn):
+    if not tabela_existe(conn, TABELA_ORIGENS):
+        return set()
+    return {r[0] for r in conn.execute(f"SELECT origem FROM {TABELA_ORIGENS}").fetchall()}
+
+
+def _afinidades(conn, chave):
+    row = conn.execute(
+        f"SELECT afinidade_tipo, afinidade_filtro FROM {TABELA_ORIGENS} WHERE origem = ?", (chave,)
+    ).fetchone()
+    return row or (None, None)
+
+
+def _em_tipos(valores, afinidade_tipo, params):
+    # tipo IN (...) com os valores convertidos como na tabela de origem
+    params.extend(comparavel(v, afinidade_tipo) for v in valores)
+    return f"tipo IN ({', '.join('CAST(? AS TEXT)' for _ in valores)})"
+
+
+def _condicao_filtro(valor_filtro, afinidade_filtro, condicoes, params):
+    if valor_filtro is not None:
+        condicoes.append("filtro = CAST(? AS TEXT)")
+        params.append(comparavel(valor_filtro, afinidade_filtro))
+
+
+def somar_mes(conn, chave, periodo, tipos=None, valor_filtro=None):
+    """
+    Soma do mês no rollup, opcionalmente só de alguns tipos e de um valor do filtro.
+    """
+    afinidade_tipo, afinidade_filtro = _afinidades(conn, chave)
+    condicoes = ["origem = ?", "mes = ?"]
+    params = [chave, periodo]
+    if tipos:
+        condicoes.append(_em_tipos(tipos, afinidade_tipo, params))
+    _condicao_filtro(valor_filtro, afinidade_filtro, condicoes, params)
+    row = conn.execute(f"SELECT SUM(soma) FROM {TABELA_ROLLUP} WHERE {' AND '.join(condicoes)}", params).fetchone()
+    return row[0]
+
+
+def saldo_ate(conn, chave, periodo, entradas, saidas, valor_filtro=None):
+    """
+    Entradas menos saídas acumuladas até o mês: o último acumulado de cada
+    (tipo, filtro) até o período, sem somar o histórico linha a linha.
+    """
+    afinidade_tipo, afinidade_filtro = _afinidades(conn, chave)
+    condicoes = ["origem = ?", "mes <= ?"]
+    params = [chave, periodo]
+    _condicao_filtro(valor_filtro, afinidade_filtro, condicoes, params)
+    valores_sinal = []
+    sinal = ["CASE"]
+    if entradas:
+        sinal.append(f"WHEN {_em_tipos(entradas, afinidade_tipo, valores_sinal)} THEN acumulado")
+    if saidas:
+        sinal.append(f"WHEN {_em_tipos(saidas, afinidade_tipo, valores_sinal)} THEN -1*acumulado")
+    sinal.append("ELSE 0 END")
+    row = conn.execute(
+        f"""
+        SELECT SUM({' '.join(sinal)}) FROM (
+            SELECT tipo, acumulado,
+                   ROW_NUMBER() OVER (PARTITION BY tipo, filtro ORDER BY mes DESC) AS ordem
+            FROM {TABELA_ROLLUP} WHERE {' AND '.join(condicoes)}
+        ) WHERE ordem = 1
+        """,
+        valores_sinal + params
+    ).fetchone()
+    return row[0]
+
+
+def serie_mensal(conn, chave, inicio, fim, tipos=None, valor_filtro=None):
+    """
+    {mes: soma} dos meses entre inicio e fim, em uma consulta agrupada no rollup.
+    """
+    afinidade_tipo, afinidade_filtro = _afinidades(conn, chave)
+    condicoes = ["origem = ?", "mes BETWEEN ? AND ?"]
+    params = [chave, inicio, fim]
+    if tipos:
+        condicoes.append(_em_tipos(tipos, afinidade_tipo, params))
+    _condicao_filtro(valor_filtro, afinidade_filtro, condicoes, params)
+    return dict(conn.execute(
+        f"SELECT mes, SUM(soma) FROM {TABELA_ROLLUP} WHERE {' AND '.join(condicoes)} GROUP BY mes", params
+    ).fetchall())
+
+
+def serie_saldo(conn, chave, fim, entradas, saidas, valor_filtro=None):
+    """
+    {mes: saldo acumulado} de todos os meses com movimento até fim, numa única
+    passada de janela sobre o rollup.
+    """
+    afinidade_tipo, afinidade_filtro = _afinidades(conn, chave)
+    condicoes = ["origem = ?", "mes <= ?"]
+    params = [chave, fim]
+    _condicao_filtro(valor_filtro, afinidade_filtro, condicoes, params)
+    valores_sinal = []
+    sinal = ["CASE"]
+    if entradas:
+        sinal.append(f"WHEN {_em_tipos(entradas, afinidade_tipo, valores_sinal)} THEN soma")
+    if saidas:
+        sinal.append(f"WHEN {_em_tipos(saidas, afinidade_tipo, valores_sinal)} THEN -1*soma")
+    sinal.append("ELSE 0 END")
+    return dict(conn.execute(
+        f"""
+        SELECT mes, SUM(SUM({' '.join(sinal)})) OVER (ORDER BY mes)
+        FROM {TABELA_ROLLUP} WHERE {' AND '.join(condicoes)} GROUP BY mes
+        """,
+        valores_sinal + params
+    ).fetchall())
@@ -0,0 +1,253 @@
+import hashlib
+import json
+import time
+
+from sync.copia import citar, colunas_locais, tabela_existe
+from sync.datas import chave_do_periodo, chave_mes, colunas_geradas
+from sync.rollups import afinidade, comparavel, mes_inicial_alterado
+
+# Livro de saldos do "Saldo em Caixa": o saldo de fechamento de cada mês (entradas
+# menos saídas acumuladas desde o início), por valor da coluna de filtro (ex.: cada
+# conta bancária) e no total. O saldo de um período é a última linha até ele, em vez
+# de somar o histórico inteiro. Um "livro" é a combinação (tabela, data, valor, tipo,
+# filtro, entradas, saídas) de um mapeamento; mapeamentos iguais compartilham o livro.
+TABELA_LIVROS = "_sync_saldo_livro"
+TABELA_SALDOS = "_sync_saldo_mensal"
+INDICADOR_SALDO = "Saldo em Caixa"
+
+
+def _valores(texto):
+    return sorted({v.strip() for v in (texto or "").split(",") if v.strip()})
+
+
+def livro_do_mapeamento(m):
+    """
+    (tabela, coluna_data, coluna_valor, coluna_tipo, coluna_filtro, entradas, saidas)
+    de um mapeamento de Saldo em Caixa, ou None se não for um (ou usar fórmula SQL).
+    """
+    if m.get("indicador") != INDICADOR_SALDO or m.get("formula_sql"):
+        return None
+    if not (m.get("tabela") and m.get("coluna_data") and m.get("coluna_valor") and m.get("coluna_tipo")):
+        return None
+    return (m["tabela"], m["coluna_data"], m["coluna_valor"], m["coluna_tipo"], m.get("coluna_filtro") or None,
+            _valores(m.get("valores_entrada")), _valores(m.get("valores_saida")))
+
+
+def id_livro(livro):
+    return hashlib.sha1(json.dumps(livro).encode()).hexdigest()[:12]
+
+
+def garantir_tabelas_saldo(conn):
+    # Livros de antes da afinidade do filtro não achavam filtros numéricos: são refeitos do zero
+    if tabela_existe(conn, TABELA_LIVROS) and "afinidade_filtro" not in colunas_locais(conn, TABELA_LIVROS):
+        conn.execute(f"DROP TABLE IF EXISTS {TABELA_SALDOS}")
+        conn.execute(f"DROP TABLE {TABELA_LIVROS}")
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABELA_LIVROS} (
+            livro TEXT PRIMARY KEY,
+            tabela TEXT,
+            coluna_data TEXT,
+            coluna_valor TEXT,
+            coluna_tipo TEXT,
+            coluna_filtro TEXT,
+            afinidade_filtro TEXT,   -- afinidade da coluna de filtro na origem (ver sync.rollups.comparavel)
+            entradas TEXT,           -- JSON
+            saidas TEXT,             -- JSON
+            linhas INTEGER,
+            atualizado_em REAL
+        )
+    """)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABELA_SALDOS} (
+            livro TEXT,
+            geral INTEGER,           -- 1: todos os valores do filtro somados; 0: um valor do filtro
+            filtro TEXT,             -- CAST do valor da origem; a consulta compara com CAST(? AS TEXT)
+            mes INTEGER,             -- AAAAMM
+            movimento REAL,          -- entradas menos saídas no mês
+            saldo REAL               -- saldo de fechamento do mês
+        )
+    """)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS ix_saldo_livro_mes ON {TABELA_SALDOS} (livro, geral, filtro, mes)")
+
+
+def _movimento(livro, params):
+    _, _, coluna_valor, coluna_tipo, _, entradas, saidas = livro
+    casos = []
+    if entradas:
+        casos.append(f"WHEN {citar(coluna_tipo)} IN ({', '.join('?' for _ in entradas)}) THEN {citar(coluna_valor)}")
+        params.extend(entradas)
+    if saidas:
+        casos.append(f"WHEN {citar(coluna_tipo)} IN ({', '.join('?' for _ in saidas)}) THEN -1*{citar(coluna_valor)}")
+        params.extend(saidas)
+    return f"CASE {' '.join(casos)} ELSE 0 END" if casos else "0"
+
+
+def _reconstruir(conn, chave, livro, desde=None):
+    """
+    Refaz os meses a partir de desde (AAAAMM; None refaz tudo): os movimentos vêm
+    da tabela e os saldos partem do fechamento do mês anterior a desde.
+    """
+    tabela, coluna_data, _, _, coluna_filtro, _, _ = livro
+    desde = desde or 0
+    mes = chave_mes(conn, tabela, coluna_data)
+    conn.execute(f"DELETE FROM {TABELA_SALDOS} WHERE livro = ? AND mes >= ?", (chave, desde))
+    params = [chave]
+    movimento = _movimento(livro, params)
+    params.append(desde)
+    conn.execute(
+        f"""
+        INSERT INTO {TABELA_SALDOS} (livro, geral, filtro, mes, movimento)
+        SELECT ?, {0 if coluna_filtro else 1}, {f"CAST({citar(coluna_filtro)} AS TEXT)" if coluna_filtro else 'NULL'}, {mes},
+               SUM({movimento})
+        FROM {citar(tabela)} WHERE {mes} >= ?
+        GROUP BY 3, 4
+        """,
+        params
+    )
+    if coluna_filtro:
+        conn.execute(
+            f"""
+            INSERT INTO {TABELA_SALDOS} (livro, geral, filtro, mes, movimento)
+            SELECT livro, 1, NULL, mes, SUM(movimento) FROM {TABELA_SALDOS}
+            WHERE livro = ? AND geral = 0 AND mes >= ?
+            GROUP BY mes
+            """,
+            (chave, desde)
+        )
+    # Fechamento = fechamento anterior a desde + movimentos acumulados desde então
+    conn.execute(
+        f"""
+        UPDATE {TABELA_SALDOS} SET saldo = c.saldo
+        FROM (
+            SELECT m.rowid AS id,
+                   COALESCE((
+                       SELECT b.saldo FROM {TABELA_SALDOS} b
+                       WHERE b.livro = m.livro AND b.geral = m.geral AND b.filtro IS m.filtro AND b.mes < ?
+                       ORDER BY b.mes DESC LIMIT 1
+                   ), 0) + SUM(m.movimento) OVER (PARTITION BY m.geral, m.filtro ORDER BY m.mes) AS saldo
+            FROM {TABELA_SALDOS} m WHERE m.livro = ? AND m.mes >= ?
+        ) AS c
+        WHERE {TABELA_SALDOS}.rowid = c.id
+        """,
+        (desde, chave, desde)
+    )
+    return conn.execute(f"SELECT COUNT(*) FROM {TABELA_SALDOS} WHERE livro = ?", (chave,)).fetchone()[0]
+
+
+def remover_livro(conn, chave):
+    conn.execute(f"DELETE FROM {TABELA_SALDOS} WHERE livro = ?", (chave,))
+    conn.execute(f"DELETE FROM {TABELA_LIVROS} WHERE livro = ?", (chave,))
+
+
+def remover_saldos_da_tabela(conn, tabela):
+    if not tabela_existe(conn, TABELA_LIVROS):
+        return
+    for (chave,) in conn.execute(f"SELECT livro FROM {TABELA_LIVROS} WHERE tabela = ?", (tabela,)).fetchall():
+        remover_livro(conn, chave)
+
+
+def atualizar_saldos(conn, mapeamentos, alteradas):
+    """
+    Atualiza os livros de saldo depois de uma sincronização, como os rollups
+    (ver sync.rollups.atualizar_rollups): alteradas é {tabela: None ou
+    (coluna_watermark, watermark_anterior)}; numa cópia incremental só são
+    refeitos os meses a partir do primeiro mês trazido pelo delta, partindo do
+    saldo de fechamento do mês anterior. Devolve um relatório por livro.
+    """
+    garantir_tabelas_saldo(conn)
+    livros = {}
+    for m in mapeamentos:
+        livro = livro_do_mapeamento(m)
+        if livro is not None:
+            livros[id_livro(livro)] = livro
+    existentes = {r[0] for r in conn.execute(f"SELECT livro FROM {TABELA_LIVROS}").fetchall()}
+    relatorio = []
+    for chave in existentes - set(livros):
+        remover_livro(conn, chave)
+        relatorio.append({"livro": chave, "tabela": None, "acao": "removido"})
+    for chave, livro in livros.items():
+        tabela = livro[0]
+        novo = chave not in existentes
+        if not novo and tabela not in alteradas:
+            continue
+        colunas = set()
+        if tabela_existe(conn, tabela):
+            colunas = set(colunas_locais(conn, tabela)) | colunas_geradas(conn, tabela)
+        if not all(c in colunas for c in livro[1:5] if c):
+            remover_livro(conn, chave)
+            relatorio.append({"livro": chave, "tabela": tabela, "acao": "removido"})
+            continue
+        desde = None
+        if not novo and alteradas.get(tabela):
+            desde = mes_inicial_alterado(conn, tabela, livro[1], *alteradas[tabela])
+        inicio = time.monotonic()
+        linhas = _reconstruir(conn, chave, livro, chave_do_periodo(desde) if desde else None)
+        conn.execute(
+            f"""
+            INSERT INTO {TABELA_LIVROS}
+                (livro, tabela, coluna_data, coluna_valor, coluna_tipo, coluna_filtro, afinidade_filtro, entradas,
+                 saidas, linhas, atualizado_em)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(livro) DO UPDATE SET
+                afinidade_filtro = excluded.afinidade_filtro,
+                linhas = excluded.linhas,
+                atualizado_em = excluded.atualizado_em
+            """,
+            (chave,) + livro[:5] + (afinidade(conn, tabela, livro[4]), json.dumps(livro[5]), json.dumps(livro[6]),
+                                    linhas, time.time())
+        )
+        relatorio.append({
+            "livro": chave, "tabela": tabela, "acao": "criado" if novo else ("parcial" if desde else "refeito"),
+            "desde": desde, "linhas": linhas, "segundos": round(time.monotonic() - inicio, 3),
+        })
+    conn.commit()
+    return relatorio
+
+
+def livros_disponiveis(conn):
+    if not tabela_existe(conn, TABELA_LIVROS):
+        return set()
+    return {r[0] for r in conn.execute(f"SELECT livro FROM {TABELA_LIVROS}").fetchall()}
+
+
+def _escopo(conn, chave, valor_filtro, condicoes, params):
+    # Sem valor de filtro vale a linha geral (todas as contas somadas); com ele, o
+    # valor é convertido como na coluna de origem ('7' vira '7.0' numa coluna REAL)
+    if valor_filtro is None:
+        condicoes.append("geral = 1")
+        return
+    row = conn.execute(f"SELECT afinidade_filtro FROM {TABELA_LIVROS} WHERE livro = ?", (chave,)).fetchone()
+    condicoes.append("geral = 0 AND filtro = CAST(? AS TEXT)")
+    params.append(comparavel(str(valor_filtro), row[0] if row else None))
+
+
+def saldo_do_livro(conn, chave, periodo, valor_filtro=None):
+    """
+    Saldo até o período (AAAAMM): o fechamento do último mês com movimento até
+    ele, numa única busca pelo índice. O mês corrente entra com o movimento
+    parcial trazido pela última sincronização. None quando não há linha até o
+    período (ex.: valor do filtro sem movimento no livro).
+    """
+    condicoes = ["livro = ?"]
+    params = [chave]
+    _escopo(conn, chave, valor_filtro, condicoes, params)
+    params.append(periodo)
+    row = conn.execute(
+        f"SELECT saldo FROM {TABELA_SALDOS} WHERE {' AND '.join(condicoes)} AND mes <= ? "
+        "ORDER BY mes DESC LIMIT 1",
+        params
+    ).fetchone()
+    return row[0] if row else None
+
+
+def serie_do_livro(conn, chave, fim, valor_filtro=None):
+    """
+    {mes AAAAMM: saldo de fechamento} dos meses com movimento até fim.
+    """
+    condicoes = ["livro = ?"]
+    params = [chave]
+    _escopo(conn, chave, valor_filtro, condicoes, params)
+    params.append(fim)
+    return dict(conn.execute(
+        f"SELECT mes, saldo FROM {TABELA_SALDOS} WHERE {' AND '.join(condicoes)} AND mes <= ?", params
+    ).fetchall())
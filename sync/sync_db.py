@@ -1,8 +1,42 @@
 import os
 import pandas as pd
-import sqlite3
-from sqlalchemy import create_engine, inspect
 import streamlit as st
+from sync.banco_local import escrever, gerenciador
+from sync.catalogo import CacheCatalogo, ler_catalogo_remoto, nomes_do_catalogo
+from sync.colunar import colunar_ativo, exportar_tabelas, remover_parquet
+from sync.datas import garantir_chaves_data
+from sync.conexoes import PoolsPorChave
+from sync.copia import ORCAMENTO_MEMORIA_MB
+from sync.rollups import atualizar_rollups, remover_rollups_da_tabela
+from sync.saldos import atualizar_saldos, remover_saldos_da_tabela
+from sync.versao import incrementar_versao
+from sync.indices import aplicar_indices, carregar_mapeamentos, carregar_relacionamentos, planejar_indices
+from sync.paralelo import sincronizar_paralelo, WORKERS_PADRAO
+
+# Conexões com o MySQL reaproveitadas entre execuções do Streamlit (chave: host/porta/schema)
+pools_mysql = PoolsPorChave()
+# Catálogo remoto lido uma vez e reaproveitado entre os reruns (chave: host/porta/schema)
+catalogos = CacheCatalogo()
+
+def parametros_mysql():
+    return (
+        st.session_state.get("mysql_host"),
+        st.session_state.get("mysql_port"),
+        st.session_state.get("mysql_user"),
+        st.session_state.get("mysql_password"),
+        st.session_state.get("mysql_database"),
+    )
+
+def conexao_remota(parametros=None):
+    # Os workers da sincronização não enxergam st.session_state: recebem os parâmetros prontos
+    parametros = parametros or parametros_mysql()
+    host, porta, _, _, schema = parametros
+    return pools_mysql.conexao((host, porta, schema), *parametros)
+
+def invalidar_conexao_remota(host, porta, schema):
+    # Credenciais alteradas: descarta conexões e catálogo lidos com as antigas
+    pools_mysql.invalidar((host, porta, schema))
+    catalogos.invalidar((host, porta, schema))
 
 def gerar_descricao_semantica(nome_tabela, nome_coluna):
     nome_tabela_low = nome_tabela.lower()
@@ -61,51 +95,85 @@ def salvar_estrutura_dinamica(entidades, conn_sqlite):
     conn_sqlite.commit()
     cursor.close()
 
-def obter_lista_tabelas_views_remotas():
-    mysql_host = st.session_state.get("mysql_host")
-    mysql_port = st.session_state.get("mysql_port")
-    mysql_user = st.session_state.get("mysql_user")
-    mysql_password = st.session_state.get("mysql_password")
-    mysql_database = st.session_state.get("mysql_database")
+def obter_lista_tabelas_views_remotas(atualizar=False):
+    parametros = parametros_mysql()
+    host, porta, _, _, schema = parametros
+
+    def carregar():
+        with conexao_remota(parametros) as conn_mysql:
+            return ler_catalogo_remoto(conn_mysql)
+
     try:
-        mysql_uri = f"mysql+pymysql://{mysql_user}:{mysql_password}@{mysql_host}:{mysql_port}/{mysql_database}?charset=utf8"
-        mysql_engine = create_engine(mysql_uri)
-        inspector = inspect(mysql_engine)
-        tabelas = inspector.get_table_names(schema=mysql_database)
-        views = inspector.get_view_names(schema=mysql_database)
-        return tabelas + views
+        catalogo, _ = catalogos.obter((host, porta, schema), carregar, atualizar=atualizar)
+        return nomes_do_catalogo(catalogo)
     except Exception as e:
         st.error(f"Erro ao buscar tabelas remotas: {e}")
         return []
 
-def sync_mysql_to_sqlite(tabelas_sync):
-    mysql_host = st.session_state.get("mysql_host")
-    mysql_port = st.session_state.get("mysql_port")
-    mysql_user = st.session_state.get("mysql_user")
-    mysql_password = st.session_state.get("mysql_password")
-    mysql_database = st.session_state.get("mysql_database")
+def sync_mysql_to_sqlite(tabelas_sync, orcamento_memoria_mb=ORCAMENTO_MEMORIA_MB, workers=WORKERS_PADRAO):
+    parametros = parametros_mysql()
+    mysql_host, mysql_port = parametros[:2]
     output_sqlite_path = st.session_state.get("sqlite_path", "data/cliente_dados.db")
 
+    def abrir_conexao_remota():
+        return conexao_remota(parametros)
+
     try:
-        mysql_uri = f"mysql+pymysql://{mysql_user}:{mysql_password}@{mysql_host}:{mysql_port}/{mysql_database}?charset=utf8"
-        mysql_engine = create_engine(mysql_uri)
         os.makedirs(os.path.dirname(output_sqlite_path), exist_ok=True)
-        with sqlite3.connect(output_sqlite_path, timeout=30) as sqlite_conn:
-            for entidade in tabelas_sync:
-                st.write(f"🔄 Sincronizando: {entidade}")
-                df = pd.read_sql(f"SELECT * FROM `{mysql_database}`.`{entidade}`", mysql_engine)
-                df.to_sql(entidade, con=sqlite_conn, if_exists="replace", index=False)
-            salvar_estrutura_dinamica(tabelas_sync, sqlite_conn)
-        st.success("✅ Sincronização concluída com sucesso.")
+        sqlite_conn = gerenciador(output_sqlite_path).conectar()
+        try:
+            st.write(f"🔄 Sincronizando {len(tabelas_sync)} tabela(s)...")
+            resultados = sincronizar_paralelo(
+                [{"tabela": t} for t in tabelas_sync], abrir_conexao_remota, sqlite_conn,
+                host=f"{mysql_host}:{mysql_port}", workers=workers, orcamento_memoria_mb=orcamento_memoria_mb,
+                detectar_mudancas=False
+            )
+            for resultado in resultados:
+                if resultado["erro"]:
+                    st.write(f"❌ {resultado['tabela']}: {resultado['erro']}")
+                else:
+                    st.write(f"✅ {resultado['tabela']}: {resultado['linhas']} linhas em {resultado['segundos']}s")
+            salvar_estrutura_dinamica([r["tabela"] for r in resultados if not r["erro"]], sqlite_conn)
+            mapeamentos = carregar_mapeamentos(sqlite_conn)
+            garantir_chaves_data(sqlite_conn, mapeamentos)
+            copiadas = {r["tabela"]: None for r in resultados if not r["erro"]}
+            atualizar_rollups(sqlite_conn, mapeamentos, copiadas)
+            atualizar_saldos(sqlite_conn, mapeamentos, copiadas)
+            incrementar_versao(sqlite_conn)
+            sqlite_conn.commit()
+            planejados = planejar_indices(sqlite_conn, mapeamentos, carregar_relacionamentos(sqlite_conn))
+            for item in aplicar_indices(sqlite_conn, planejados):
+                if item["acao"] == "criado":
+                    st.write(f"📇 Índice {item['indice']} criado em {item['tabela']} ({item['motivo']}), "
+                             f"{(item['bytes'] or 0) / 1024 / 1024:.1f} MB")
+                elif item["acao"] == "removido":
+                    st.write(f"🗑️ Índice {item['indice']} removido (sem uso)")
+        finally:
+            sqlite_conn.close()
+        exportadas = [r["tabela"] for r in resultados if not r["erro"]]
+        for tabela, erro in exportar_tabelas(output_sqlite_path, exportadas).items():
+            st.write(f"⚠️ {tabela}: Parquet não gerado ({erro}); consultas usarão o SQLite.")
+        if exportadas and colunar_ativo():
+            # Consultas no DuckDB durante a exportação leram o Parquet antigo com a versão nova
+            with escrever(output_sqlite_path) as conn:
+                incrementar_versao(conn)
+        if any(r["erro"] for r in resultados):
+            st.warning("⚠️ Sincronização concluída com falhas em algumas tabelas.")
+        else:
+            st.success("✅ Sincronização concluída com sucesso.")
     except Exception as e:
         st.error(f"❌ Erro ao sincronizar: {e}")
 
 def excluir_tabelas_sqlite(sqlite_path, tabelas_excluir):
     try:
-        with sqlite3.connect(sqlite_path, timeout=10) as conn:
+        with escrever(sqlite_path) as conn:
             c = conn.cursor()
             for tabela in tabelas_excluir:
                 c.execute(f"DROP TABLE IF EXISTS `{tabela}`")
+                remover_rollups_da_tabela(conn, tabela)
+                remover_saldos_da_tabela(conn, tabela)
+                remover_parquet(sqlite_path, tabela)
+            incrementar_versao(conn)
             conn.commit()
         st.success(f"Tabela(s) excluída(s) com sucesso: {', '.join(tabelas_excluir)}")
     except Exception as e:
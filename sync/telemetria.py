@@ -0,0 +1,168 @@
+import time
+
+# Execuções guardadas por empresa; as mais antigas são apagadas a cada registro
+RETENCAO_EXECUCOES = 1000
+# Execuções consideradas por padrão nos agregados do histórico
+ULTIMAS_EXECUCOES = 20
+
+CAMPOS_TABELA = (
+    "tabela", "modo", "linhas", "bytes", "segundos", "segundos_leitura", "segundos_gravacao",
+    "segundos_indices", "linhas_por_segundo", "latencia_conexao", "pulada", "retomada_de", "erro",
+)
+
+
+def garantir_tabelas_log(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sync_execucoes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            empresa_id INTEGER,
+            origem TEXT,                     -- 'job' ou 'agendador'
+            iniciada_em REAL,                -- epoch
+            segundos REAL,
+            tabelas INTEGER,
+            copiadas INTEGER,
+            puladas INTEGER,
+            falhas INTEGER,
+            linhas INTEGER,
+            bytes INTEGER,
+            segundos_indices REAL,           -- ajuste dos índices do assistente após a cópia
+            erro TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sync_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            execucao_id INTEGER,
+            empresa_id INTEGER,
+            tabela TEXT,
+            modo TEXT,
+            linhas INTEGER,
+            bytes INTEGER,                   -- estimativa do tamanho das linhas lidas, em memória
+            segundos REAL,
+            segundos_leitura REAL,
+            segundos_gravacao REAL,
+            segundos_indices REAL,
+            linhas_por_segundo REAL,
+            latencia_conexao REAL,
+            pulada INTEGER,
+            retomada_de INTEGER,
+            erro TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_sync_execucoes_empresa ON sync_execucoes (empresa_id, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_sync_log_execucao ON sync_log (execucao_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_sync_log_tabela ON sync_log (empresa_id, tabela, execucao_id)")
+
+
+def registrar_execucao(conn, empresa_id, detalhes, iniciada_em, origem=None, segundos_indices=None, erro=None):
+    """
+    Grava uma execução de sincronização (sync_execucoes) e uma linha por tabela
+    (sync_log) a partir dos resultados de sincronizar_paralelo. Devolve o id da execução.
+    """
+    detalhes = detalhes or []
+    cur = conn.execute(
+        """
+        INSERT INTO sync_execucoes
+            (empresa_id, origem, iniciada_em, segundos, tabelas, copiadas, puladas, falhas, linhas, bytes,
+             segundos_indices, erro)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            empresa_id, origem, iniciada_em, round(time.time() - iniciada_em, 3), len(detalhes),
+            sum(1 for d in detalhes if not d.get("erro") and not d.get("pulada")),
+            sum(1 for d in detalhes if d.get("pulada")),
+            sum(1 for d in detalhes if d.get("erro")),
+            sum(d.get("linhas") or 0 for d in detalhes),
+            sum(d.get("bytes") or 0 for d in detalhes),
+            segundos_indices, erro,
+        )
+    )
+    execucao_id = cur.lastrowid
+    conn.executemany(
+        f"""
+        INSERT INTO sync_log (execucao_id, empresa_id, {", ".join(CAMPOS_TABELA)})
+        VALUES (?, ?, {", ".join("?" for _ in CAMPOS_TABELA)})
+        """,
+        [(execucao_id, empresa_id) + tuple(d.get(c) for c in CAMPOS_TABELA) for d in detalhes]
+    )
+    antigas = conn.execute(
+        "SELECT id FROM sync_execucoes WHERE empresa_id IS ? ORDER BY id DESC LIMIT -1 OFFSET ?",
+        (empresa_id, RETENCAO_EXECUCOES)
+    ).fetchall()
+    if antigas:
+        conn.executemany("DELETE FROM sync_log WHERE execucao_id = ?", antigas)
+        conn.executemany("DELETE FROM sync_execucoes WHERE id = ?", antigas)
+    return execucao_id
+
+
+def percentil(valores, p):
+    """
+    Percentil p (0-100) com interpolação linear; None para lista vazia.
+    """
+    valores = sorted(v for v in valores if v is not None)
+    if not valores:
+        return None
+    posicao = (len(valores) - 1) * p / 100
+    inferior = int(posicao)
+    superior = min(inferior + 1, len(valores) - 1)
+    return valores[inferior] + (valores[superior] - valores[inferior]) * (posicao - inferior)
+
+
+def _arredondar(valor, casas=3):
+    return round(valor, casas) if valor is not None else None
+
+
+def historico(conn, empresa_id, ultimas=ULTIMAS_EXECUCOES, tabela=None):
+    """
+    Últimas execuções da empresa e, por tabela, os agregados sobre elas: p50/p95
+    da duração e das fases, vazão, linhas e bytes médios, falhas e último erro.
+    As tabelas puladas (sem mudança) contam nas execuções mas não nas durações.
+    """
+    colunas_execucao = [
+        "id", "origem", "iniciada_em", "segundos", "tabelas", "copiadas", "puladas", "falhas", "linhas", "bytes",
+        "segundos_indices", "erro",
+    ]
+    execucoes = [
+        dict(zip(colunas_execucao, r))
+        for r in conn.execute(
+            f"SELECT {', '.join(colunas_execucao)} FROM sync_execucoes WHERE empresa_id = ? ORDER BY id DESC LIMIT ?",
+            (empresa_id, ultimas)
+        ).fetchall()
+    ]
+    if not execucoes:
+        return {"execucoes": [], "tabelas": []}
+    sql = (
+        f"SELECT execucao_id, {', '.join(CAMPOS_TABELA)} FROM sync_log "
+        f"WHERE empresa_id = ? AND execucao_id >= ?"
+    )
+    params = [empresa_id, execucoes[-1]["id"]]
+    if tabela:
+        sql += " AND tabela = ?"
+        params.append(tabela)
+    por_tabela = {}
+    for row in conn.execute(sql + " ORDER BY execucao_id", params).fetchall():
+        registro = dict(zip(("execucao_id",) + CAMPOS_TABELA, row))
+        por_tabela.setdefault(registro["tabela"], []).append(registro)
+
+    tabelas = []
+    for nome, registros in sorted(por_tabela.items()):
+        copias = [r for r in registros if not r["pulada"] and not r["erro"]]
+        falhas = [r for r in registros if r["erro"]]
+        agregado = {
+            "tabela": nome,
+            "execucoes": len(registros),
+            "copias": len(copias),
+            "puladas": sum(1 for r in registros if r["pulada"]),
+            "falhas": len(falhas),
+            "ultimo_erro": falhas[-1]["erro"] if falhas else None,
+            "linhas_media": _arredondar(sum(r["linhas"] or 0 for r in copias) / len(copias), 1) if copias else None,
+            "bytes_media": int(sum(r["bytes"] or 0 for r in copias) / len(copias)) if copias else None,
+            "ultima_copia": copias[-1] if copias else None,
+        }
+        for campo in ("segundos", "segundos_leitura", "segundos_gravacao", "segundos_indices", "latencia_conexao"):
+            valores = [r[campo] for r in copias]
+            agregado[f"p50_{campo}"] = _arredondar(percentil(valores, 50), 4)
+            agregado[f"p95_{campo}"] = _arredondar(percentil(valores, 95), 4)
+        agregado["p50_linhas_por_segundo"] = _arredondar(percentil([r["linhas_por_segundo"] for r in copias], 50), 1)
+        tabelas.append(agregado)
+    return {"execucoes": execucoes, "tabelas": tabelas}
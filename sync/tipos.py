@@ -0,0 +1,167 @@
+from datetime import date, datetime, time as dtime, timedelta
+from decimal import Decimal
+
+from pymysql.constants import FIELD_TYPE
+
+# Tipos do driver (cursor.description), usados quando não há information_schema
+CODIGOS_INTEIROS = {
+    FIELD_TYPE.TINY, FIELD_TYPE.SHORT, FIELD_TYPE.LONG,
+    FIELD_TYPE.LONGLONG, FIELD_TYPE.INT24, FIELD_TYPE.YEAR,
+}
+CODIGOS_REAIS = {FIELD_TYPE.FLOAT, FIELD_TYPE.DOUBLE, FIELD_TYPE.DECIMAL, FIELD_TYPE.NEWDECIMAL}
+CODIGOS_DATA = {FIELD_TYPE.DATE, FIELD_TYPE.DATETIME, FIELD_TYPE.TIMESTAMP, FIELD_TYPE.NEWDATE}
+
+
+# Tipos do information_schema.columns (data_type)
+TIPOS_INTEIROS = {"tinyint", "smallint", "mediumint", "int", "integer", "bigint", "year"}
+TIPOS_REAIS = {"float", "double", "real"}
+TIPOS_DECIMAIS = {"decimal", "numeric"}
+TIPOS_BINARIOS = {"binary", "varbinary", "tinyblob", "blob", "mediumblob", "longblob"}
+
+
+def tipo_sqlite(type_code):
+    if type_code in CODIGOS_INTEIROS:
+        return "INTEGER"
+    if type_code in CODIGOS_REAIS:
+        return "REAL"
+    if type_code in CODIGOS_DATA:
+        return "TIMESTAMP"
+    return "TEXT"
+
+
+def converter_valor(valor):
+    """
+    Converte os tipos devolvidos pelo pymysql para tipos aceitos pelo sqlite3,
+    no mesmo formato que o pandas gravava com to_sql.
+    """
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, datetime):
+        return valor.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(valor, date):
+        return valor.isoformat()
+    if isinstance(valor, (dtime, timedelta)):
+        return str(valor)
+    if isinstance(valor, bytearray):
+        return bytes(valor)
+    return valor
+
+
+def _inteiro(valor):
+    return None if valor is None else int(valor)
+
+
+def _real(valor):
+    return None if valor is None else float(valor)
+
+
+def _bit(valor):
+    if valor is None:
+        return None
+    if isinstance(valor, (bytes, bytearray)):
+        return int.from_bytes(valor, "big")
+    return int(valor)
+
+
+def _centavos(valor):
+    if valor is None:
+        return None
+    return int((Decimal(valor) * 100).to_integral_value())
+
+
+def mapear_coluna(data_type, escala=None, centavos=False):
+    """
+    Tipo declarado no SQLite e conversor de valores para um tipo do MySQL.
+    DECIMAL com escala 0 vira INTEGER; com escala, REAL ou inteiro em centavos
+    (valor * 100, arredondado) quando a coluna estiver configurada assim.
+    """
+    data_type = (data_type or "").lower()
+    if data_type in TIPOS_INTEIROS:
+        return "INTEGER", _inteiro
+    if data_type == "bit":
+        return "INTEGER", _bit
+    if data_type in TIPOS_DECIMAIS:
+        if not escala:
+            return "INTEGER", _inteiro
+        if centavos:
+            return "INTEGER", _centavos
+        return "REAL", _real
+    if data_type in TIPOS_REAIS:
+        return "REAL", _real
+    if data_type == "date":
+        return "DATE", converter_valor
+    if data_type in ("datetime", "timestamp"):
+        return "DATETIME", converter_valor
+    if data_type in TIPOS_BINARIOS:
+        return "BLOB", converter_valor
+    return "TEXT", converter_valor
+
+
+def descobrir_chave_primaria(conn_mysql, tabela):
+    """
+    Colunas da PRIMARY KEY na ordem da chave (não na ordem das colunas da tabela),
+    a mesma do índice que o MySQL usa no ORDER BY das faixas.
+    """
+    with conn_mysql.cursor() as cur:
+        cur.execute(
+            """
+            SELECT column_name FROM information_schema.key_column_usage
+            WHERE table_schema = DATABASE() AND table_name = %s AND constraint_name = 'PRIMARY'
+            ORDER BY ordinal_position
+            """,
+            (tabela,)
+        )
+        return [row[0] for row in cur.fetchall()]
+
+
+def ler_esquema_remoto(conn_mysql, tabela, colunas_centavos=()):
+    """
+    Lê do information_schema os tipos das colunas e a chave primária da tabela/view.
+    Deve ser chamada antes de abrir o cursor de leitura (SSCursor ocupa a conexão).
+    """
+    with conn_mysql.cursor() as cur:
+        cur.execute(
+            """
+            SELECT column_name, data_type, numeric_scale
+            FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = %s
+            ORDER BY ordinal_position
+            """,
+            (tabela,)
+        )
+        rows = cur.fetchall()
+    colunas = {nome: mapear_coluna(data_type, escala, nome in colunas_centavos) for nome, data_type, escala in rows}
+    return {"colunas": colunas, "chave_primaria": descobrir_chave_primaria(conn_mysql, tabela)}
+
+
+def alinhar_ao_cursor(esquema, cursor):
+    """
+    Devolve (colunas [(nome, tipo)], conversores) na ordem do cursor. Colunas que
+    não estão no esquema caem no mapeamento pelo tipo do driver.
+    """
+    colunas = []
+    conversores = []
+    for d in cursor.description:
+        nome = d[0]
+        tipo, conversor = (esquema or {}).get("colunas", {}).get(nome, (tipo_sqlite(d[1]), converter_valor))
+        colunas.append((nome, tipo))
+        conversores.append(conversor)
+    return colunas, conversores
+
+
+def chave_paginavel(esquema):
+    """
+    Chave primária usável na paginação por faixas: só colunas inteiras, de texto
+    ou de data, cujo valor convertido compara no MySQL como o original. Lista
+    vazia quando não há chave ou algum tipo não serve (ex.: DECIMAL em centavos).
+    """
+    chave = esquema.get("chave_primaria") or []
+    for coluna in chave:
+        tipo, conversor = esquema["colunas"].get(coluna, (None, None))
+        if conversor is _inteiro:
+            continue
+        if conversor is converter_valor and tipo in ("TEXT", "DATE", "DATETIME"):
+            continue
+        return []
+    return list(chave)
+
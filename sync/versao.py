@@ -0,0 +1,23 @@
+from sync.copia import tabela_existe
+
+# Versão dos dados de um arquivo SQLite: muda a cada sincronização ou exclusão de
+# tabela e entra na chave dos caches de resultados (ver app.indicadores.CacheKPI)
+TABELA_VERSAO = "_sync_versao"
+
+
+def versao_dados(conn):
+    if not tabela_existe(conn, TABELA_VERSAO):
+        return 0
+    row = conn.execute(f"SELECT versao FROM {TABELA_VERSAO} WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+
+def incrementar_versao(conn):
+    """
+    Nova versão dos dados; não faz commit (entra na transação de quem chamou).
+    """
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {TABELA_VERSAO} (id INTEGER PRIMARY KEY, versao INTEGER)")
+    conn.execute(
+        f"INSERT INTO {TABELA_VERSAO} (id, versao) VALUES (1, 1) "
+        "ON CONFLICT(id) DO UPDATE SET versao = versao + 1"
+    )